@@ -0,0 +1,8 @@
+"""ASGIアプリケーションエントリーポイント。
+
+このモジュールは、uvicornなどのASGIサーバーからアプリケーションを実行するためのエントリーポイントです。
+"""
+
+# uvicornはカレントディレクトリ（このファイルのディレクトリ）をパスに含めるため、
+# src/ 配下のパッケージをそのままインポートできる
+from src.hatena_bookmark.asgi import application
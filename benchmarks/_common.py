@@ -0,0 +1,336 @@
+"""ベンチマーク共通のヘルパー。
+
+はてなブックマークの代わりに応答するスタブサーバー、アプリケーションサーバーの起動、
+レイテンシの集計など、各ベンチマークスクリプトで共有する機能を提供します。
+"""
+
+import asyncio
+import gc
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# リポジトリのルートディレクトリ
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 実際のipad.hotentry APIに含まれる、フィードでは使わないフィールド
+_EXTRA_FIELDS = {
+    'eid': '4700000000000000000',
+    'entry_url': 'https://b.hatena.ne.jp/entry/s/example.com/',
+    'favicon_url': 'https://cdn-ak2.favicon.st-hatena.com/64?url=https%3A%2F%2Fexample.com%2F',
+    'image': 'https://cdn-ak-scissors.b.st-hatena.com/image/square/0000/example.com/',
+    'root_url': 'https://example.com/',
+    'category_css_class': 'category-it',
+    'is_ad': False,
+}
+
+
+def synthetic_entries(count, seed=0):
+    """ipad.hotentry APIと同じ形のエントリーを生成する。
+
+    Args:
+        count (int): エントリー数
+        seed (int, optional): 乱数のシード
+
+    Returns:
+        list: エントリー（辞書）のリスト
+    """
+    rng = random.Random(seed)
+    hosts = ['example.com', 'zenn.dev', 'qiita.com', 'github.com', 'anond.hatelabo.jp',
+             'www.youtube.com', 'note.com', 'www.nikkei.com']
+    entries = []
+    for i in range(count):
+        host = hosts[i % len(hosts)]
+        entry = dict(_EXTRA_FIELDS)
+        entry.update({
+            'title': f'生成AIの活用事例 {i}: 大規模言語モデルを業務に導入した話',
+            'url': f'https://{host}/articles/{i:06d}',
+            'description': '本記事では、社内で生成AIを導入した際の知見を紹介します。' * 3,
+            'count': rng.randint(3, 1500),
+            'date': f'2024-03-{1 + i % 28:02d}T{i % 24:02d}:00:00+09:00',
+            'eid': str(4700000000000000000 + i),
+        })
+        entries.append(entry)
+    return entries
+
+
+class StubUpstream:
+    """はてなブックマークの代わりに応答するスタブHTTPサーバー。
+
+    ``/api/ipad.hotentry`` でJSONを返します。``delay`` 秒だけ応答を遅らせることで、
+    上流の遅延がサービス全体に与える影響を再現できます。
+    """
+
+    def __init__(self, entries, delay=0.0):
+        self.payload = json.dumps(entries, ensure_ascii=False).encode('utf-8')
+        self.delay = delay
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub.hits += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if self.path.startswith('/api/ipad.hotentry'):
+                    body, content_type, status = stub.payload, 'application/json', 200
+                else:
+                    body, content_type, status = b'not found', 'text/plain', 404
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 1024
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        """スタブサーバーのベースURL。"""
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def env(self):
+        """アプリケーションをスタブに向けるための環境変数（1つのクライアントから送るため制限は外す）。"""
+        return {
+            'HATENA_API_URL': f'{self.base_url}/api/ipad.hotentry',
+            'HATENA_RSS_URL': f'{self.base_url}/hotentry.rss',
+            'RATE_LIMIT_RATE': '0',
+            'RATE_LIMIT_CONDITIONAL_RATE': '0',
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def free_port():
+    """未使用のTCPポート番号を返す。"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode, port, workers=4):
+    """アプリケーションサーバーの起動コマンドを返す。
+
+    Args:
+        mode (str): ``wsgi`` （gunicornの同期ワーカー）または ``asgi`` （uvicorn）
+        port (int): 待ち受けポート
+        workers (int, optional): ワーカー数
+
+    Returns:
+        list: コマンドライン
+    """
+    if mode == 'wsgi':
+        return [sys.executable, '-m', 'gunicorn', 'wsgi:application', '--bind',
+                f'127.0.0.1:{port}', '--workers', str(workers), '--timeout', '120',
+                '--log-level', 'warning']
+    if mode == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1',
+                '--port', str(port), '--workers', str(workers), '--log-level', 'warning',
+                '--backlog', '4096']
+    raise ValueError(f'不明なモードです: {mode}')
+
+
+class AppServer:
+    """アプリケーションサーバーを子プロセスとして起動する。
+
+    Args:
+        mode (str): ``wsgi`` または ``asgi``
+        env (dict, optional): 追加の環境変数
+        workers (int, optional): ワーカー数
+    """
+
+    def __init__(self, mode, env=None, workers=4):
+        self.port = free_port()
+        self.command = server_command(mode, self.port, workers)
+        self.env = dict(os.environ, **(env or {}))
+        self.process = None
+
+    @property
+    def base_url(self):
+        """アプリケーションのベースURL。"""
+        return f'http://127.0.0.1:{self.port}'
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, cwd=ROOT, env=self.env)
+        wait_until_ready(f'{self.base_url}/health')
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def wait_until_ready(url, timeout=30.0):
+    """URLが200を返すまで待つ。
+
+    Returns:
+        float: 待った秒数
+    """
+    start = time.perf_counter()
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - start
+        except OSError:
+            pass
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f'{url} が起動しませんでした')
+        time.sleep(0.02)
+
+
+class RawConnection:
+    """負荷生成用の最小限のHTTP/1.1クライアント（1接続を使い回す）。
+
+    汎用クライアントは大量の同時リクエストでクライアント側の処理が支配的になるため、
+    計測対象のサーバー以外の負荷を抑える目的で使用します。
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def get(self, path, headers=None):
+        """GETリクエストを送信する。
+
+        Args:
+            path (str): クエリ文字列を含むパス
+            headers (dict, optional): 追加のリクエストヘッダー
+
+        Returns:
+            tuple: (ステータスコード, 小文字キーのヘッダー辞書, 本文)
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'GET {path} HTTP/1.1', f'Host: {self.host}:{self.port}']
+        lines.extend(f'{key}: {value}' for key, value in (headers or {}).items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        try:
+            await self.writer.drain()
+            status_line = await self.reader.readuntil(b'\r\n')
+            status = int(status_line.split()[1])
+            response_headers = {}
+            while True:
+                line = await self.reader.readuntil(b'\r\n')
+                if line == b'\r\n':
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                response_headers[key.strip().lower()] = value.strip()
+            if response_headers.get('transfer-encoding') == 'chunked':
+                body = await self._read_chunked()
+            else:
+                body = await self.reader.readexactly(
+                    int(response_headers.get('content-length', 0)))
+        except (OSError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, response_headers, body
+
+    async def _read_chunked(self):
+        """chunked形式の本文を読み込む。"""
+        chunks = []
+        while True:
+            size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            if size == 0:
+                await self.reader.readuntil(b'\r\n')
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+    def close(self):
+        """接続を閉じる。"""
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def percentile(sorted_values, ratio):
+    """ソート済みの値から百分位数を返す（最近傍法）。"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(ratio * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize_latencies(latencies, errors, elapsed):
+    """レイテンシの一覧を集計する。
+
+    Args:
+        latencies (list): 成功したリクエストのレイテンシ（秒）
+        errors (int): 失敗したリクエスト数
+        elapsed (float): 計測全体の経過秒数
+
+    Returns:
+        dict: スループット、百分位数（ミリ秒）、エラー率
+    """
+    values = sorted(latencies)
+    total = len(values) + errors
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'throughput_rps': round(len(values) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': ms(percentile(values, 0.50)),
+        'p95_ms': ms(percentile(values, 0.95)),
+        'p99_ms': ms(percentile(values, 0.99)),
+        'max_ms': ms(values[-1] if values else None),
+    }
+
+
+def retained_bytes(build):
+    """``build`` が返したオブジェクトを保持している間のメモリ増加量を計測する。"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    snapshot = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del snapshot
+    return retained
+
+
+def git_revision():
+    """計測したリビジョンを返す（gitがない場合はNone）。"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
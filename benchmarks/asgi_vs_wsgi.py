@@ -0,0 +1,82 @@
+"""WSGI（gunicorn同期ワーカー）とASGI（uvicorn）の負荷比較ベンチマーク。
+
+遅延を入れたスタブの上流サーバーに向けて両方のサーバーを起動し、同じ同時接続数で
+``/hotentry/all/feed`` を叩いたときのスループットとレイテンシを並べて表示します。
+
+使い方:
+    python benchmarks/asgi_vs_wsgi.py --concurrency 500 --requests 5000 --upstream-delay 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from _common import (AppServer, RawConnection, StubUpstream, summarize_latencies,
+                     synthetic_entries)
+
+
+async def drive(port, concurrency, total_requests, timeout):
+    """同時接続数を保ったままフィードをリクエストする。
+
+    Returns:
+        dict: 集計結果
+    """
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total_requests):
+        queue.put_nowait((100, 200, 500)[i % 3])
+
+    async def worker():
+        nonlocal errors
+        connection = RawConnection('127.0.0.1', port)
+        while not queue.empty():
+            threshold = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                status, _, _ = await asyncio.wait_for(
+                    connection.get(f'/hotentry/all/feed?threshold={threshold}'), timeout)
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                connection.close()
+                errors += 1
+        connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return summarize_latencies(latencies, errors, elapsed)
+
+
+def main():
+    """ベンチマークを実行して結果をJSONで表示する。"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--upstream-delay', type=float, default=0.2,
+                        help='スタブの上流サーバーの応答遅延（秒）')
+    parser.add_argument('--entries', type=int, default=30)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    args = parser.parse_args()
+
+    results = {}
+    with StubUpstream(synthetic_entries(args.entries), delay=args.upstream_delay) as upstream:
+        for mode in ('wsgi', 'asgi'):
+            with AppServer(mode, upstream.env(), workers=args.workers) as server:
+                hits_before = upstream.hits
+                results[mode] = asyncio.run(drive(
+                    server.port, args.concurrency, args.requests, args.timeout))
+                results[mode]['upstream_requests'] = upstream.hits - hits_before
+
+    print(json.dumps({'parameters': vars(args), 'results': results},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
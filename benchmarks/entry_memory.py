@@ -0,0 +1,47 @@
+"""エントリーの保持メモリのベンチマーク。
+
+ipad.hotentry APIと同じ形のJSONを生成し、デコードした辞書のリストをそのまま保持する場合と、
+取り込み時に ``Entry`` へ変換して保持する場合のスナップショット1つあたりのメモリ量を
+tracemallocで計測します。
+
+使い方:
+    python benchmarks/entry_memory.py --entries 30 100 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from _common import ROOT, retained_bytes, synthetic_entries
+
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from hatena_bookmark.api import parse_hotentry_json  # noqa: E402
+
+
+def main():
+    """ベンチマークを実行して結果をJSONで表示する。"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, nargs='+', default=[30, 100, 1000])
+    args = parser.parse_args()
+
+    results = []
+    for count in args.entries:
+        payload = json.dumps(synthetic_entries(count), ensure_ascii=False).encode('utf-8')
+        raw = retained_bytes(lambda: json.loads(payload))
+        entries = retained_bytes(lambda: parse_hotentry_json(json.loads(payload)))
+        results.append({
+            'entries': count,
+            'payload_bytes': len(payload),
+            'raw_dicts_bytes': raw,
+            'entry_objects_bytes': entries,
+            'saved_bytes': raw - entries,
+            'saved_ratio': round(1 - entries / raw, 3),
+        })
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""ipad.hotentry APIのレスポンスのデコードと正規化のベンチマーク。
+
+大きな合成ペイロードについて、標準ライブラリのjsonとorjson（インストールされている場合）の
+デコード時間と、デコード後に ``parse_hotentry_json`` でフィードに使うフィールドへ射影・検証するまでの
+時間を計測します。あわせて、デコードした辞書をそのまま保持する場合と、射影したエントリーを
+保持する場合のメモリ量を比較します。
+
+使い方:
+    python benchmarks/json_decode.py --entries 1000 10000 50000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from _common import ROOT, retained_bytes, synthetic_entries
+
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from hatena_bookmark.api import parse_hotentry_json  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def best_of(fn, repeat):
+    """``fn`` を ``repeat`` 回実行した中で最短の秒数を返す。"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    """ベンチマークを実行して結果をJSONで表示する。"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    decoders = {'json': json.loads}
+    if orjson is not None:
+        decoders['orjson'] = orjson.loads
+
+    results = []
+    for count in args.entries:
+        payload = json.dumps(synthetic_entries(count), ensure_ascii=False).encode('utf-8')
+        result = {'entries': count, 'payload_bytes': len(payload)}
+        for name, loads in decoders.items():
+            result[f'{name}_decode_ms'] = round(best_of(lambda: loads(payload), args.repeat) * 1000, 2)
+            result[f'{name}_decode_and_project_ms'] = round(
+                best_of(lambda: parse_hotentry_json(loads(payload)), args.repeat) * 1000, 2)
+        result['raw_dicts_bytes'] = retained_bytes(lambda: json.loads(payload))
+        result['projected_entries_bytes'] = retained_bytes(
+            lambda: parse_hotentry_json(json.loads(payload)))
+        results.append(result)
+
+    print(json.dumps({'backends': list(decoders), 'results': results},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
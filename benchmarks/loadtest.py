@@ -0,0 +1,205 @@
+"""サービス全体の負荷試験。
+
+スタブの上流サーバーに向けてアプリケーションを起動し、実際のポーリングに近いリクエストの
+組み合わせ（しきい値の比率、If-None-Matchを付けた条件付きリクエストの割合、``/`` と ``/health``）を
+指定した同時接続数で送信します。エンドポイントごとのスループット、p50/p95/p99レイテンシ、
+エラー率をJSONのレポートとして出力します。リクエストの並びはシードから決まるため、
+バージョン間でレポートを比較できます。
+
+``--replay`` を指定すると、スタブの代わりに ``benchmarks/record_upstream.py`` で記録した
+実際の上流のレスポンスを再生します（``--replay-speed`` で記録した遅延を再現）。
+
+使い方:
+    python benchmarks/loadtest.py --mode wsgi --concurrency 50 --requests 5000 --output before.json
+    python benchmarks/loadtest.py --mode wsgi --concurrency 50 --requests 5000 --baseline before.json
+    python benchmarks/loadtest.py --replay upstream.jsonl.gz --replay-speed 1.0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from _common import (AppServer, RawConnection, StubUpstream, git_revision, summarize_latencies,
+                     synthetic_entries)
+
+# 比較に使う指標
+COMPARED_METRICS = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate')
+
+
+def parse_weights(value):
+    """'100:6,200:3,500:1' 形式の重みを辞書に変換する。"""
+    weights = {}
+    for part in value.split(','):
+        key, _, weight = part.partition(':')
+        weights[key.strip()] = float(weight or 1)
+    return weights
+
+
+def build_plan(total_requests, endpoint_weights, threshold_weights, conditional_ratio, seed):
+    """送信するリクエストの並びを生成する。
+
+    Returns:
+        list: (エンドポイント名, パス, 条件付きリクエストかどうか) のリスト
+    """
+    rng = random.Random(seed)
+    endpoints = list(endpoint_weights)
+    thresholds = list(threshold_weights)
+    plan = []
+    for _ in range(total_requests):
+        endpoint = rng.choices(endpoints, weights=[endpoint_weights[e] for e in endpoints])[0]
+        if endpoint == 'feed':
+            threshold = rng.choices(thresholds, weights=[threshold_weights[t] for t in thresholds])[0]
+            plan.append(('feed', f'/hotentry/all/feed?threshold={threshold}',
+                         rng.random() < conditional_ratio))
+        elif endpoint == 'index':
+            plan.append(('index', '/', False))
+        else:
+            plan.append(('health', '/health', False))
+    return plan
+
+
+async def drive(host, port, plan, concurrency, timeout):
+    """同時接続数を保ったまま計画どおりにリクエストを送信する。
+
+    Returns:
+        dict: エンドポイントごとの集計結果
+    """
+    latencies = {name: [] for name, _, _ in plan}
+    errors = Counter()
+    statuses = {name: Counter() for name in latencies}
+    # パスごとに最後に受け取ったETag（条件付きリクエストに使う）
+    etags = {}
+    queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    async def worker():
+        connection = RawConnection(host, port)
+        while not queue.empty():
+            name, path, conditional = queue.get_nowait()
+            headers = {}
+            if conditional and path in etags:
+                headers['If-None-Match'] = etags[path]
+            start = time.perf_counter()
+            try:
+                status, response_headers, _ = await asyncio.wait_for(
+                    connection.get(path, headers), timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                connection.close()
+                errors[name] += 1
+                statuses[name]['exception'] += 1
+                continue
+            statuses[name][str(status)] += 1
+            if status >= 400:
+                errors[name] += 1
+                continue
+            latencies[name].append(time.perf_counter() - start)
+            if 'etag' in response_headers:
+                etags[path] = response_headers['etag']
+        connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    report = {}
+    for name in latencies:
+        report[name] = summarize_latencies(latencies[name], errors[name], elapsed)
+        report[name]['status_counts'] = dict(sorted(statuses[name].items()))
+    all_latencies = [value for values in latencies.values() for value in values]
+    report['total'] = summarize_latencies(all_latencies, sum(errors.values()), elapsed)
+    report['total']['elapsed_s'] = round(elapsed, 2)
+    return report
+
+
+def compare(report, baseline):
+    """ベースラインのレポートとの差分を返す。
+
+    Returns:
+        dict: エンドポイントごとの指標の差分（今回 - ベースライン）
+    """
+    deltas = {}
+    for name, current in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous is None:
+            continue
+        deltas[name] = {
+            metric: round(current[metric] - previous[metric], 4)
+            for metric in COMPARED_METRICS
+            if current.get(metric) is not None and previous.get(metric) is not None
+        }
+    return deltas
+
+
+def main():
+    """負荷試験を実行してレポートをJSONで出力する。"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--url', help='起動済みのアプリケーションに向ける場合のベースURL')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--endpoints', default='feed:90,index:5,health:5',
+                        help='エンドポイントの比率（feed, index, health）')
+    parser.add_argument('--thresholds', default='100:5,200:3,500:2',
+                        help='フィードのしきい値の比率')
+    parser.add_argument('--conditional-ratio', type=float, default=0.5,
+                        help='If-None-Matchを付けるフィードのリクエストの割合')
+    parser.add_argument('--upstream-delay', type=float, default=0.2,
+                        help='スタブの上流サーバーの応答遅延（秒）')
+    parser.add_argument('--entries', type=int, default=30)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--replay', help='スタブの代わりに再生する上流のアーカイブ')
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help='再生の速さ（1.0で記録どおりの遅延、0で遅延なし）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='レポートを書き出すファイル')
+    parser.add_argument('--baseline', help='比較するレポートのファイル')
+    args = parser.parse_args()
+
+    plan = build_plan(args.requests, parse_weights(args.endpoints),
+                      parse_weights(args.thresholds), args.conditional_ratio, args.seed)
+
+    report = {'revision': git_revision(), 'parameters': vars(args)}
+    if args.url:
+        target = urlsplit(args.url)
+        report['endpoints'] = asyncio.run(drive(
+            target.hostname, target.port or 80, plan, args.concurrency, args.timeout))
+    elif args.replay:
+        env = {
+            'UPSTREAM_MODE': 'replay',
+            'UPSTREAM_ARCHIVE': os.path.abspath(args.replay),
+            'UPSTREAM_REPLAY_SPEED': str(args.replay_speed),
+            # 1つのクライアントから送るため、リクエスト数の制限は外す
+            'RATE_LIMIT_RATE': '0',
+            'RATE_LIMIT_CONDITIONAL_RATE': '0',
+        }
+        with AppServer(args.mode, env, workers=args.workers) as server:
+            report['endpoints'] = asyncio.run(drive(
+                '127.0.0.1', server.port, plan, args.concurrency, args.timeout))
+    else:
+        with StubUpstream(synthetic_entries(args.entries), delay=args.upstream_delay) as upstream:
+            with AppServer(args.mode, upstream.env(), workers=args.workers) as server:
+                hits_before = upstream.hits
+                report['endpoints'] = asyncio.run(drive(
+                    '127.0.0.1', server.port, plan, args.concurrency, args.timeout))
+                report['upstream_requests'] = upstream.hits - hits_before
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['delta'] = compare(report, json.load(f))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""上流のレスポンスの記録。
+
+はてなブックマーク（または ``HATENA_API_URL`` で指定した上流）から、指定したカテゴリーの
+ホットエントリーを一定間隔で取得し、レスポンスをアーカイブに記録します。記録したアーカイブは
+``loadtest.py --replay`` やアプリケーションの ``UPSTREAM_MODE=replay`` で再生できます。
+
+使い方:
+    python benchmarks/record_upstream.py --output upstream.jsonl.gz --categories all it --rounds 12 --interval 300
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from _common import ROOT
+
+
+def main():
+    """上流のレスポンスを記録して、記録した件数を表示する。"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', required=True, help='記録するアーカイブ（追記する）')
+    parser.add_argument('--categories', nargs='+', default=['all'])
+    parser.add_argument('--rounds', type=int, default=1, help='取得を繰り返す回数')
+    parser.add_argument('--interval', type=float, default=0.0, help='取得の間隔（秒）')
+    parser.add_argument('--rss', action='store_true', help='RSSフィード（フォールバック）も記録する')
+    args = parser.parse_args()
+
+    # api は読み込み時に記録のアダプターを取り付けるため、環境変数を先に設定する
+    os.environ['UPSTREAM_MODE'] = 'record'
+    os.environ['UPSTREAM_ARCHIVE'] = os.path.abspath(args.output)
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    from hatena_bookmark import api
+
+    results = []
+    for round_number in range(args.rounds):
+        if round_number:
+            time.sleep(args.interval)
+        for category in args.categories:
+            try:
+                entries = api.fetch_hatena_hotentries(category)
+                if args.rss:
+                    api.fetch_hatena_hotentries_from_rss(category)
+                results.append({'round': round_number, 'category': category,
+                                'entries': len(entries)})
+            except Exception as e:
+                results.append({'round': round_number, 'category': category, 'error': str(e)})
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
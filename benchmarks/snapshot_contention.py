@@ -0,0 +1,121 @@
+"""スナップショットの読み出しの競合のベンチマーク。
+
+多数の読み出しスレッドがスナップショットのエントリーと取得日時を読み続ける間、
+1つの書き込みスレッドが一定間隔でスナップショットを公開します。差し替えによる公開
+（``store.get_snapshot``）と、比較のためのロックを取る読み出しの双方について、
+1秒あたりの読み出し回数と、エントリーと取得日時が食い違った読み出しの回数を計測します。
+
+使い方:
+    python benchmarks/snapshot_contention.py --threads 1 8 32 --seconds 2
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from _common import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from hatena_bookmark.store import Snapshot, get_snapshot, publish_snapshot  # noqa: E402
+
+CATEGORY = 'benchmark'
+
+
+class LockedStore:
+    """変更前と同じく、ロックを取って辞書の2つのキーを読み書きする。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store = {'entries': (0,), 'last_update': datetime(2000, 1, 1)}
+
+    def publish(self, version, last_update):
+        with self._lock:
+            self._store['entries'] = (version,)
+            self._store['last_update'] = last_update
+
+    def read(self):
+        with self._lock:
+            return self._store['entries'], self._store['last_update']
+
+
+class SwappedStore:
+    """``store.publish_snapshot`` で公開し、``store.get_snapshot`` で読み出す。"""
+
+    def publish(self, version, last_update):
+        publish_snapshot(CATEGORY, Snapshot((version,), None, version, last_update, None))
+
+    def read(self):
+        snapshot = get_snapshot(CATEGORY)
+        return snapshot.entries, snapshot.last_update
+
+
+def run(store, threads, seconds, publish_interval):
+    """読み出しスレッドと書き込みスレッドを動かして集計する。
+
+    エントリーには更新番号、取得日時には更新番号から決まる日時を入れるため、
+    両者が食い違っていれば同じ公開による値ではないことが分かります。
+    """
+    epoch = datetime(2000, 1, 1)
+    store.publish(0, epoch)
+    stop = threading.Event()
+    counts = [0] * threads
+    torn = [0] * threads
+
+    def reader(slot):
+        reads = inconsistent = 0
+        while not stop.is_set():
+            entries, last_update = store.read()
+            if epoch + timedelta(seconds=entries[0]) != last_update:
+                inconsistent += 1
+            reads += 1
+        counts[slot] = reads
+        torn[slot] = inconsistent
+
+    def writer():
+        version = 0
+        while not stop.is_set():
+            version += 1
+            store.publish(version, epoch + timedelta(seconds=version))
+            time.sleep(publish_interval)
+
+    workers = [threading.Thread(target=reader, args=(slot,)) for slot in range(threads)]
+    workers.append(threading.Thread(target=writer))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return {'reads_per_second': round(sum(counts) / seconds), 'inconsistent_reads': sum(torn)}
+
+
+def main():
+    """ベンチマークを実行して結果をJSONで表示する。"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--publish-interval', type=float, default=0.001,
+                        help='書き込みスレッドが公開する間隔（秒）')
+    args = parser.parse_args()
+
+    results = []
+    for threads in args.threads:
+        locked = run(LockedStore(), threads, args.seconds, args.publish_interval)
+        swapped = run(SwappedStore(), threads, args.seconds, args.publish_interval)
+        results.append({
+            'threads': threads,
+            'locked': locked,
+            'swapped': swapped,
+            'speedup': round(swapped['reads_per_second'] / max(locked['reads_per_second'], 1), 2),
+        })
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""起動時間のベンチマーク。
+
+``python -X importtime`` でアプリケーションのインポートにかかる時間と、その内訳（累積時間の
+大きいモジュール）を計測します。また、スタブの上流サーバーに向けてワーカー1つのサーバーを起動し、
+プロセスの起動から最初のリクエスト（``/health`` とフィード）に応答するまでの時間を計測します。
+レポートをファイルに保存しておくと、バージョン間で比較できます。
+
+使い方:
+    python benchmarks/startup.py --runs 5 --output startup-before.json
+    python benchmarks/startup.py --runs 5 --baseline startup-before.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from _common import ROOT, StubUpstream, free_port, git_revision, server_command, synthetic_entries
+
+# 起動時に読み込まないことを確認するモジュール
+LAZY_MODULES = ('apscheduler', 'dateutil', 'xml.etree.ElementTree')
+
+
+def import_profile(entrypoint, top):
+    """``-X importtime`` の出力からインポート時間の内訳を集計する。
+
+    Args:
+        entrypoint (str): インポートするモジュール（``app`` や ``asgi``）
+        top (int): 内訳に含めるモジュールの数
+
+    Returns:
+        dict: 合計時間（ミリ秒）、累積時間の大きいモジュール、起動時に読み込まれた遅延対象のモジュール
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {entrypoint}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = _split(line)
+        modules[name] = (int(self_us), int(cumulative_us))
+    ranked = sorted(((name, cumulative) for name, (_, cumulative) in modules.items()
+                     if name != entrypoint), key=lambda item: item[1], reverse=True)
+    return {
+        'total_ms': round(modules.get(entrypoint, (0, 0))[1] / 1000, 1),
+        'top_cumulative_ms': {name: round(cumulative / 1000, 1) for name, cumulative in ranked[:top]},
+        'eager_lazy_modules': [name for name in LAZY_MODULES if name in modules],
+    }
+
+
+def _split(line):
+    """'import time: self | cumulative | name' の行を分割する。"""
+    self_part, cumulative_part, name_part = line[len('import time:'):].split('|')
+    return self_part.strip(), cumulative_part.strip(), name_part.strip()
+
+
+def time_to_first_request(mode, env, feed_path, timeout=60.0):
+    """サーバーのプロセスを起動し、最初のリクエストに応答するまでの秒数を計測する。
+
+    Returns:
+        dict: ``/health`` とフィードのそれぞれに最初に応答するまでの秒数
+    """
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    start = time.perf_counter()
+    process = subprocess.Popen(server_command(mode, port, workers=1), cwd=ROOT,
+                               env=dict(os.environ, **env))
+    try:
+        health = _poll(f'{base_url}/health', start, timeout)
+        feed = _poll(f'{base_url}{feed_path}', start, timeout)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {'health_s': round(health, 3), 'feed_s': round(feed, 3)}
+
+
+def _poll(url, start, timeout):
+    """URLが200を返すまで繰り返し、``start`` からの経過秒数を返す。"""
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                if response.status == 200:
+                    return time.perf_counter() - start
+        except OSError:
+            pass
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f'{url} が起動しませんでした')
+        time.sleep(0.005)
+
+
+def summarize(runs):
+    """複数回の計測の最小値と中央値を返す。"""
+    return {
+        key: {'min': min(run[key] for run in runs),
+              'median': round(statistics.median(run[key] for run in runs), 3)}
+        for key in runs[0]
+    }
+
+
+def main():
+    """起動時間を計測してレポートをJSONで出力する。"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='内訳に含めるモジュールの数')
+    parser.add_argument('--feed-path', default='/hotentry/all/feed?threshold=100')
+    parser.add_argument('--output', help='レポートを書き出すファイル')
+    parser.add_argument('--baseline', help='比較するレポートのファイル')
+    args = parser.parse_args()
+
+    entrypoint = 'app' if args.mode == 'wsgi' else 'asgi'
+    report = {
+        'revision': git_revision(),
+        'parameters': vars(args),
+        'imports': [import_profile(entrypoint, args.top) for _ in range(args.runs)],
+    }
+    report['import_total_ms'] = summarize([{'total_ms': run['total_ms']}
+                                           for run in report['imports']])['total_ms']
+    report['imports'] = report['imports'][-1]
+
+    with StubUpstream(synthetic_entries(30)) as upstream:
+        runs = [time_to_first_request(args.mode, upstream.env(), args.feed_path)
+                for _ in range(args.runs)]
+    report['first_request'] = summarize(runs)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['delta'] = {
+            'import_total_ms': round(report['import_total_ms']['median']
+                                     - baseline['import_total_ms']['median'], 1),
+            **{key: round(value['median'] - baseline['first_request'][key]['median'], 3)
+               for key, value in report['first_request'].items()},
+        }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,8 +6,26 @@
 Modules:
     app: Flaskアプリケーションの定義とルーティング
     api: はてなブックマークAPIとの通信機能
+    asgi: ASGIアプリケーション（非同期版のフィードと更新通知）
     feed: RSSフィード生成機能
+    models: エントリーのデータモデル
+    notify: しきい値ごとの更新通知のファンアウト
+    store: ホットエントリーのスナップショット保持
+    catalog: 設定ファイルで定義した名前付きフィード
+    cache: インスタンス間で共有するキャッシュ
+    cdn: CDN向けのキャッシュ制御
+    coalesce: 同時取得の集約
+    domains: ドメインによる絞り込み
+    enrich: 記事のメタデータの取得
+    memory: メモリ使用量の診断とキャッシュの予算
+    ratelimit: クライアントごとのリクエスト数の制限
+    refresh: 更新間隔の調整
+    replay: 上流のレスポンスの記録・再生
+    search: キーワード検索
+    trace: 処理段階ごとの所要時間の計測
+    trending: ブックマーク数の伸びによるランキング
     utils: ユーティリティ関数
+    warmup: リクエストの多いフィードの事前レンダリング
 """
 
 __version__ = '0.1.0'
\ No newline at end of file
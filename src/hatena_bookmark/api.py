@@ -4,65 +4,259 @@
 APIアクセスに失敗した場合は、RSSフィードからのフォールバック機能も実装しています。
 """
 
+import json
+import os
 import requests
-import xml.etree.ElementTree as ET
 import logging
+from .models import Entry
+from .trace import span
 from .utils import get_random_user_agent
 
-# リクエストセッション
-session = requests.Session()
-session.headers.update({
+try:
+    # 高速なJSONデコーダー（インストールされていない場合は標準ライブラリを使用）
+    import orjson
+except ImportError:
+    orjson = None
+
+# 取得元のURL（検証用のスタブサーバーに向ける場合は環境変数で上書き）
+HATENA_API_URL = os.environ.get('HATENA_API_URL', 'https://b.hatena.ne.jp/api/ipad.hotentry')
+HATENA_RSS_URL = os.environ.get('HATENA_RSS_URL', 'https://b.hatena.ne.jp/hotentry.rss')
+
+# カテゴリー（URLのパスに使う名前 -> ipad.hotentry APIのmode）
+CATEGORIES = {
+    'all': 'general',
+    'social': 'social',
+    'economics': 'economics',
+    'life': 'life',
+    'knowledge': 'knowledge',
+    'it': 'it',
+    'fun': 'fun',
+    'entertainment': 'entertainment',
+    'game': 'game',
+}
+
+# カテゴリーの表示名
+CATEGORY_LABELS = {
+    'all': '総合',
+    'social': '世の中',
+    'economics': '政治と経済',
+    'life': '暮らし',
+    'knowledge': '学び',
+    'it': 'テクノロジー',
+    'fun': 'おもしろ',
+    'entertainment': 'エンタメ',
+    'game': 'アニメとゲーム',
+}
+
+# 上流への接続方法（live: そのまま接続、record: 記録しながら接続、replay: 記録を再生）
+UPSTREAM_MODE = os.environ.get('UPSTREAM_MODE', 'live')
+UPSTREAM_ARCHIVE = os.environ.get('UPSTREAM_ARCHIVE', 'upstream-archive.jsonl.gz')
+UPSTREAM_REPLAY_SPEED = float(os.environ.get('UPSTREAM_REPLAY_SPEED', '0'))
+
+# リクエストのタイムアウト（秒）
+API_TIMEOUT = float(os.environ.get('API_TIMEOUT', '10'))
+
+# 共通のリクエストヘッダー
+DEFAULT_HEADERS = {
     'Accept': 'application/json, text/xml',
     'Accept-Language': 'ja,en-US;q=0.7,en;q=0.3',
     'Accept-Encoding': 'gzip, deflate, br',
     'Connection': 'keep-alive',
-})
+}
+
+# リクエストセッション
+session = requests.Session()
+session.headers.update(DEFAULT_HEADERS)
+
+# 記録・再生のモードで非同期クライアントに渡すトランスポート
+_async_transport = None
+if UPSTREAM_MODE != 'live':
+    from .replay import install as install_replay
+    _async_transport = install_replay(session, UPSTREAM_MODE, UPSTREAM_ARCHIVE,
+                                      UPSTREAM_REPLAY_SPEED)
+
+# 使用するJSONデコーダーの名前
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# 非同期クライアント（ASGIモードで最初に使用されたときに生成）
+_async_client = None
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
 
-def fetch_hatena_hotentries():
+def fetch_hatena_hotentries(category='all'):
     """はてなブックマークのホットエントリーを取得する。
 
     APIからデータを取得し、失敗した場合はRSSフィードからデータを取得します。
 
+    Args:
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+
     Returns:
-        list: エントリーのリスト。各エントリーは辞書形式で、title, url, description, count, dateを含む。
+        list: エントリー（Entry）のリスト
 
     Raises:
         requests.RequestException: リクエストに失敗した場合
     """
     try:
         # APIからデータを取得
-        url = "https://b.hatena.ne.jp/api/ipad.hotentry?mode=general"
         session.headers['User-Agent'] = get_random_user_agent()
-        response = session.get(url, timeout=10)
+        with span('fetch'):
+            response = session.get(HATENA_API_URL, params={'mode': CATEGORIES[category]},
+                                   timeout=API_TIMEOUT)
         response.raise_for_status()
-        return response.json()
+        with span('parse'):
+            return parse_hotentry_json(loads_json(response.content))
     except Exception as e:
         logger.error(f"APIからのデータ取得に失敗しました: {str(e)}")
         # 失敗した場合はRSSフィードから取得
-        return fetch_hatena_hotentries_from_rss()
+        return fetch_hatena_hotentries_from_rss(category)
 
 
-def fetch_hatena_hotentries_from_rss():
+def fetch_hatena_hotentries_from_rss(category='all'):
     """はてなブックマークのホットエントリーをRSSフィードから取得する。
 
+    Args:
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+
     Returns:
-        list: エントリーのリスト。各エントリーは辞書形式で、title, url, description, count, dateを含む。
+        list: エントリー（Entry）のリスト
 
     Raises:
         requests.RequestException: リクエストに失敗した場合
     """
-    url = "https://b.hatena.ne.jp/hotentry.rss"
     session.headers['User-Agent'] = get_random_user_agent()
-    response = session.get(url, timeout=10)
+    with span('fetch_rss'):
+        response = session.get(rss_url(category), timeout=API_TIMEOUT)
     response.raise_for_status()
     
+    with span('parse_rss'):
+        return parse_hotentry_rss(response.content)
+
+
+async def fetch_hatena_hotentries_async(category='all'):
+    """はてなブックマークのホットエントリーを非同期に取得する。
+
+    ``fetch_hatena_hotentries`` の非同期版です。イベントループをブロックせずに
+    APIからデータを取得し、失敗した場合はRSSフィードからデータを取得します。
+
+    Args:
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+
+    Returns:
+        list: エントリー（Entry）のリスト
+
+    Raises:
+        httpx.HTTPError: リクエストに失敗した場合
+    """
+    client = _get_async_client()
+    headers = {'User-Agent': get_random_user_agent()}
+    try:
+        with span('fetch'):
+            response = await client.get(HATENA_API_URL, params={'mode': CATEGORIES[category]},
+                                        headers=headers)
+        response.raise_for_status()
+        with span('parse'):
+            return parse_hotentry_json(loads_json(response.content))
+    except Exception as e:
+        logger.error(f"APIからのデータ取得に失敗しました: {str(e)}")
+        # 失敗した場合はRSSフィードから取得
+        with span('fetch_rss'):
+            response = await client.get(rss_url(category), headers=headers)
+        response.raise_for_status()
+        with span('parse_rss'):
+            return parse_hotentry_rss(response.content)
+
+
+def rss_url(category='all'):
+    """カテゴリーのホットエントリーRSSフィードのURLを返す。
+
+    Args:
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+
+    Returns:
+        str: RSSフィードのURL（総合は /hotentry.rss、その他は /hotentry/<カテゴリー>.rss）
+    """
+    if category == 'all':
+        return HATENA_RSS_URL
+    return HATENA_RSS_URL[:-len('.rss')] + f'/{category}.rss'
+
+
+def _get_async_client():
+    """非同期クライアントを返す（接続はプロセス内で使い回す）。"""
+    global _async_client
+    if _async_client is None:
+        import httpx
+        _async_client = httpx.AsyncClient(
+            headers={key: value for key, value in DEFAULT_HEADERS.items()
+                     if key != 'Connection'},
+            timeout=API_TIMEOUT,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            transport=_async_transport,
+        )
+    return _async_client
+
+
+def loads_json(content):
+    """JSONをデコードする（orjsonがあればorjson、なければ標準ライブラリを使用）。
+
+    Args:
+        content (bytes): JSONの本文
+
+    Returns:
+        object: デコードした値
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def parse_hotentry_json(items):
+    """ipad.hotentry APIのレスポンスをエントリーに変換する。
+
+    フィードで使うフィールドだけを取り出し、その他のフィールドは保持しません。
+    URLやブックマーク数が不正なエントリーは、フィード全体を失敗させずに読み飛ばします。
+
+    Args:
+        items (list): APIのレスポンス（辞書のリスト）
+
+    Returns:
+        list: エントリー（Entry）のリスト
+
+    Raises:
+        ValueError: レスポンスがリストでない場合
+    """
+    if not isinstance(items, list):
+        raise ValueError(f'APIのレスポンスがリストではありません: {type(items).__name__}')
+    entries = []
+    dropped = 0
+    for item in items:
+        try:
+            entries.append(Entry.from_dict(item))
+        except ValueError as e:
+            dropped += 1
+            logger.debug(f"不正なエントリーを読み飛ばしました: {str(e)}")
+    if dropped:
+        logger.warning(f"不正なエントリーを{dropped}件読み飛ばしました（全{len(items)}件）")
+    return entries
+
+
+def parse_hotentry_rss(content):
+    """ホットエントリーのRSSフィード（RSS 1.0）をパースする。
+
+    Args:
+        content (bytes): RSSフィードの本文
+
+    Returns:
+        list: エントリー（Entry）のリスト
+    """
+    # RSSへのフォールバック時にだけ使うため、XMLパーサーは必要になったときに読み込む
+    import xml.etree.ElementTree as ET
+
     # RSSフィードをパース
     entries = []
-    root = ET.fromstring(response.content)
+    root = ET.fromstring(content)
     
     # 名前空間を定義
     namespaces = {
@@ -86,12 +280,6 @@ def fetch_hatena_hotentries_from_rss():
         hatena_count = item.find('.//hatena:bookmarkcount', namespaces)
         count = int(hatena_count.text) if hatena_count is not None else 0
         
-        entries.append({
-            'title': title,
-            'url': link,
-            'description': description,
-            'count': count,
-            'date': date_str
-        })
+        entries.append(Entry(title, link, description, count, date_str))
     
     return entries
\ No newline at end of file
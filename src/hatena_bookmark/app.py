@@ -2,28 +2,68 @@
 
 このモジュールは、Flaskアプリケーションの初期化、ルーティング、およびバックグラウンドタスクの
 設定を行います。
+
+ワーカーの起動を速くするため、APSchedulerの読み込みとスケジューラーの開始（初回の取得を含む）は
+起動から ``SCHEDULER_START_DELAY`` 秒後にバックグラウンドのスレッドで行います。ワーカーはその完了を
+待たずにリクエストを受け付け、それまでに届いたリクエストは必要なデータをその場で取得します。
 """
 
 import os
-import threading
 import logging
+import threading
 from datetime import datetime
-from flask import Flask, url_for, request
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
+from flask import Flask, Response, abort, g, jsonify, url_for, request
+
+from .feed import (accepts_gzip, generate_opml, get_batch_feeds, get_hotentry_feed,
+                   get_trending_feed)
+from .api import CATEGORIES
+from .catalog import catalog, render_catalog
+from .cdn import feed_cache_headers, html_cache_headers, purge_on_change
+from .domains import parse_domain_filter
+from .enrich import enrich_entries, enrichment_status
+from .memory import (check_admin_token, measure_snapshot, memory_report, start_tracing,
+                     stop_tracing)
+from .notify import notifier
+from .ratelimit import (charge_full_response, check_request, client_key, rate_limit_status,
+                        too_many_requests_headers)
+from .refresh import refresh_policy
+from .store import (add_listener, degraded_status, get_snapshot, get_snapshots, record_demand,
+                    refresh_entries, upstream_flight)
+from .trace import start_trace
+from .trending import trend_tracker
+from .utils import parse_threshold, split_list_param
+from .warmup import feed_warmer
+
+# 起動からスケジューラーを開始するまでの秒数（起動直後のリクエストとCPUを奪い合わないようにする）
+SCHEDULER_START_DELAY = float(os.environ.get('SCHEDULER_START_DELAY', '5'))
 
-from .feed import get_hotentry_feed
-from .api import fetch_hatena_hotentries
+# バッチエンドポイントで一度に指定できるしきい値の数
+MAX_BATCH_THRESHOLDS = 10
 
-# グローバルなデータストア
-global_store = {
-    'latest_entries': None,
-    'last_update': None
+# OPMLに掲載するしきい値
+OPML_THRESHOLDS = [100, 200, 500]
+
+# CDN向けのキャッシュヘッダーを付けるページ（エンドポイント名 -> 総合のスナップショットに依存するか）
+CACHEABLE_PAGES = {
+    'index': True,
+    'debug_ifttt': False,
+    'hotentry_opml': False,
+}
+
+# クライアントごとのリクエスト数の制限を適用するエンドポイント
+RATE_LIMITED_ENDPOINTS = {
+    'hotentry_feed',
+    'hotentry_feed_nocache',
+    'hotentry_batch',
+    'hotentry_trending',
+    'catalog_feed',
 }
-store_lock = threading.Lock()
 
-# スケジューラーの初期化
-scheduler = BackgroundScheduler()
+# 診断用のエンドポイントで返す、割り当ての多い箇所の最大件数
+MAX_MEMORY_REPORT_LIMIT = 100
+
+# スケジューラー（``init_scheduler`` で生成する）
+scheduler = None
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
@@ -37,22 +77,58 @@ def create_app():
     """
     app = Flask(__name__)
     
+    @app.before_request
+    def limit_feed_requests():
+        """フィードへのリクエストをクライアントごとに制限する（超えた場合は429）。"""
+        if request.endpoint not in RATE_LIMITED_ENDPOINTS:
+            return None
+        key = client_key(request.remote_addr, request.headers.get('X-Forwarded-For'),
+                         request.headers.get('User-Agent'))
+        conditional = ('If-None-Match' in request.headers
+                       or 'If-Modified-Since' in request.headers)
+        retry_after = check_request(key, conditional)
+        if retry_after:
+            return Response('Too Many Requests\n', status=429, mimetype='text/plain',
+                            headers=too_many_requests_headers(retry_after))
+        g.rate_limit_key = key if conditional else None
+        return None
+    
+    @app.after_request
+    def charge_conditional_miss(response):
+        """条件付きリクエストが304にならなかった場合は、通常のリクエストとしても数える。"""
+        key = g.pop('rate_limit_key', None)
+        if key is not None and response.status_code != 304:
+            charge_full_response(key)
+        return response
+    
+    @app.after_request
+    def add_cache_headers(response):
+        """HTMLなどのページにCDN向けのキャッシュヘッダーを付ける。"""
+        if request.endpoint in CACHEABLE_PAGES and response.status_code == 200:
+            snapshot = get_snapshot('all') if CACHEABLE_PAGES[request.endpoint] else None
+            response.headers.update(html_cache_headers(snapshot))
+        return response
+    
     # ルーティングの設定
-    @app.route('/hotentry/all/feed')
-    def hotentry_feed():
-        """ホットエントリーのRSSフィードを返す（常に最新データを取得）。
+    @app.route('/hotentry/<category>/feed')
+    def hotentry_feed(category):
+        """ホットエントリーのRSSフィードを返す。
+
+        Args:
+            category (str): カテゴリー（'all'は総合）
 
         Returns:
             Response: XMLレスポンス
         """
+        if category not in CATEGORIES:
+            abort(404)
+        
         # クエリパラメータからしきい値を取得（デフォルトは100）
-        threshold = request.args.get('threshold', '100')
-        try:
-            threshold = int(threshold)
-        except ValueError:
-            threshold = 100
+        threshold = parse_threshold(request.args.get('threshold'))
+        record_feed_variant(category, threshold)
         
-        return get_hotentry_feed(threshold)
+        return get_hotentry_feed(threshold, category, request.args.get('q'),
+                                 request_domain_filter())
     
     # 互換性のために古いエンドポイントも維持
     @app.route('/hotentry/all/feed/nocache')
@@ -63,13 +139,80 @@ def create_app():
             Response: XMLレスポンス
         """
         # クエリパラメータからしきい値を取得
-        threshold = request.args.get('threshold', '100')
-        try:
-            threshold = int(threshold)
-        except ValueError:
-            threshold = 100
+        threshold = parse_threshold(request.args.get('threshold'))
+        record_feed_variant('all', threshold)
+        
+        return get_hotentry_feed(threshold, query=request.args.get('q'),
+                                 domains=request_domain_filter())
+    
+    @app.route('/hotentry/all/trending')
+    def hotentry_trending():
+        """ブックマーク数の伸びが大きい順のRSSフィードを返す。
+
+        Returns:
+            Response: XMLレスポンス
+        """
+        threshold = parse_threshold(request.args.get('threshold'), default=0)
+        return get_trending_feed(threshold)
+    
+    @app.route('/f/<name>')
+    def catalog_feed(name):
+        """設定ファイルで定義した名前付きフィードを返す。
+
+        スナップショットの更新時にレンダリング済みであれば、そのバイト列をそのまま返します。
+        ない場合（``PUBLIC_BASE_URL`` が未設定の場合を含む）は通常のフィードと同じく生成します。
+
+        Args:
+            name (str): 名前付きフィードの名前
+
+        Returns:
+            Response: XMLレスポンス
+        """
+        feed = catalog.get(name)
+        if feed is None:
+            abort(404)
+        
+        rendered, snapshot = catalog.lookup(name)
+        if rendered is None:
+            return get_hotentry_feed(feed.threshold, feed.category, feed.query, feed.domains)
         
-        return get_hotentry_feed(threshold)
+        record_demand(feed.category)
+        response = Response(rendered.body, mimetype='application/xml')
+        response.set_etag(rendered.etag, weak=True)
+        response.headers.update(feed_cache_headers([feed.category], [feed.threshold],
+                                                   {feed.category: snapshot}))
+        return response.make_conditional(request)
+    
+    @app.route('/hotentry/batch')
+    def hotentry_batch():
+        """複数のしきい値・カテゴリーのRSSフィードをまとめてJSONで返す。
+
+        ``threshold`` と ``category`` はカンマ区切りまたは繰り返しで複数指定できます。
+
+        Returns:
+            Response: JSONレスポンス
+        """
+        thresholds = [parse_threshold(value) for value in
+                      split_list_param(request.args.getlist('threshold'))] or [100]
+        categories = split_list_param(request.args.getlist('category')) or ['all']
+        
+        unknown = [category for category in categories if category not in CATEGORIES]
+        if unknown:
+            abort(404)
+        if len(thresholds) > MAX_BATCH_THRESHOLDS:
+            abort(400)
+        
+        return get_batch_feeds(categories, thresholds)
+    
+    @app.route('/hotentry/feeds.opml')
+    def hotentry_opml():
+        """提供しているフィードの一覧をOPMLで返す。
+
+        Returns:
+            Response: OPMLレスポンス
+        """
+        return Response(generate_opml(request.host_url, OPML_THRESHOLDS),
+                        mimetype='text/x-opml')
     
     @app.route('/debug/ifttt')
     def debug_ifttt():
@@ -315,9 +458,9 @@ def create_app():
         """
         # 最終更新時刻を取得
         last_update = None
-        with store_lock:
-            if global_store['last_update'] is not None:
-                last_update = global_store['last_update'].strftime("%Y-%m-%d %H:%M:%S")
+        snapshot = get_snapshot('all')
+        if snapshot is not None:
+            last_update = snapshot.last_update.strftime("%Y-%m-%d %H:%M:%S")
         
         return f"""
         <!DOCTYPE html>
@@ -596,9 +739,9 @@ def create_app():
                 <div class="card">
                     <h2>例</h2>
                     <ul>
-                        <li><a href="{url_for('hotentry_feed', threshold=100)}" target="_blank">100ブックマーク以上の記事</a></li>
-                        <li><a href="{url_for('hotentry_feed', threshold=200)}" target="_blank">200ブックマーク以上の記事</a></li>
-                        <li><a href="{url_for('hotentry_feed', threshold=500)}" target="_blank">500ブックマーク以上の記事</a></li>
+                        <li><a href="{url_for('hotentry_feed', category='all', threshold=100)}" target="_blank">100ブックマーク以上の記事</a></li>
+                        <li><a href="{url_for('hotentry_feed', category='all', threshold=200)}" target="_blank">200ブックマーク以上の記事</a></li>
+                        <li><a href="{url_for('hotentry_feed', category='all', threshold=500)}" target="_blank">500ブックマーク以上の記事</a></li>
                     </ul>
                 </div>
                 
@@ -607,7 +750,7 @@ def create_app():
                     <div class="feature-list">
                         <div class="feature-item">はてなブックマークの説明文を含む</div>
                         <div class="feature-item">IFTTTのRSSトリガーに対応</div>
-                        <div class="feature-item">常に最新のデータを取得</div>
+                        <div class="feature-item">5分以内の新しいデータを配信</div>
                         <div class="feature-item">5分間隔でデータ更新</div>
                     </div>
                     
@@ -640,49 +783,165 @@ def create_app():
         """
         return "OK", 200
     
+    @app.route('/status')
+    def status():
+        """スナップショットと上流への取得の状態をJSONで返す。
+
+        Returns:
+            Response: JSONレスポンス
+        """
+        snapshots = {
+            category: {
+                'entries': len(snapshot.entries),
+                'last_update': snapshot.last_update.isoformat(timespec='seconds'),
+                'version': snapshot.version,
+            }
+            for category, snapshot in get_snapshots().items()
+        }
+        
+        scheduler_status = refresh_policy.status()
+        job = scheduler.get_job('update_feed') if scheduler is not None else None
+        next_run = job.next_run_time if job is not None else None
+        scheduler_status['next_run_time'] = next_run.isoformat(timespec='seconds') if next_run else None
+        
+        return jsonify({
+            'snapshots': snapshots,
+            'upstream': upstream_flight.stats(),
+            'degraded': degraded_status(),
+            'catalog': catalog.status(),
+            'enrichment': enrichment_status(),
+            'trending': trend_tracker.status(),
+            'rate_limit': rate_limit_status(),
+            'warmup': feed_warmer.status(),
+            'scheduler': scheduler_status,
+        })
+    
+    @app.route('/admin/memory')
+    def admin_memory():
+        """メモリの使用状況をJSONで返す（``ADMIN_TOKEN`` で認証する）。
+
+        ``trace=start`` / ``trace=stop`` でtracemallocによる追跡を開始・停止できます。
+        トークンが設定されていない場合や一致しない場合は、エンドポイントの存在を隠すため404を返します。
+
+        Returns:
+            Response: JSONレスポンス
+        """
+        if not check_admin_token(request.headers.get('Authorization'),
+                                 request.headers.get('X-Admin-Token')):
+            abort(404)
+        trace = request.args.get('trace')
+        if trace == 'start':
+            start_tracing()
+        elif trace == 'stop':
+            stop_tracing()
+        elif trace is not None:
+            abort(400)
+        group_by = request.args.get('group_by', 'lineno')
+        if group_by not in ('lineno', 'filename', 'traceback'):
+            abort(400)
+        limit = max(1, min(request.args.get('limit', 20, type=int), MAX_MEMORY_REPORT_LIMIT))
+        response = jsonify(memory_report(limit, group_by))
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
     return app
 
 
+def record_feed_variant(category, threshold):
+    """検索語やドメインの指定がないフィードへのリクエストを事前レンダリングのために数える。"""
+    if any(name in request.args for name in ('q', 'include_domain', 'exclude_domain')):
+        return
+    encoding = 'gzip' if accepts_gzip(request.headers.get('Accept-Encoding')) else 'identity'
+    feed_warmer.record(category, threshold, encoding)
+
+
+def request_domain_filter():
+    """リクエストの ``include_domain`` / ``exclude_domain`` パラメータを変換する。"""
+    return parse_domain_filter(request.args.getlist('include_domain'),
+                               request.args.getlist('exclude_domain'))
+
+
 def update_global_store():
     """グローバルストアのデータを更新する。"""
     try:
-        entries = fetch_hatena_hotentries()
-        with store_lock:
-            global_store['latest_entries'] = entries
-            global_store['last_update'] = datetime.now()
+        # リクエストの処理で取得中であれば、その結果を共有する
+        with start_trace('scheduler.update_feed'):
+            refresh_entries('all')
         logger.info("グローバルストアのデータを更新しました")
     except Exception as e:
         logger.error(f"グローバルストアの更新に失敗しました: {str(e)}")
+    finally:
+        reschedule_update()
+
+
+def reschedule_update():
+    """チャーンと需要から決めた間隔で次の更新を予約する。"""
+    if scheduler is None or scheduler.get_job('update_feed') is None:
+        return
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    interval = refresh_policy.next_interval()
+    scheduler.reschedule_job('update_feed', trigger=IntervalTrigger(seconds=interval))
+    logger.info(f"次の更新を{interval:.0f}秒後に予約しました")
+
+
+def publish_to_subscribers(category, entries):
+    """総合のスナップショットが更新されたら、ストリーム購読者へしきい値ごとの変化を通知する。"""
+    if category == 'all':
+        notifier.publish(entries)
 
 
 def init_scheduler():
-    """スケジューラーを初期化する。"""
-    if not scheduler.running:
-        scheduler.add_job(
-            update_global_store,
-            trigger=IntervalTrigger(minutes=5),
-            id='update_feed',
-            name='Update RSS feed data',
-            replace_existing=True
-        )
-        scheduler.start()
-        logger.info("スケジューラーを開始しました")
+    """スケジューラーを初期化する（初回の取得はすぐに実行する）。"""
+    global scheduler
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    if scheduler is not None and scheduler.running:
+        return
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(
+        update_global_store,
+        trigger=IntervalTrigger(seconds=refresh_policy.next_interval()),
+        id='update_feed',
+        name='Update RSS feed data',
+        next_run_time=datetime.now(),
+        replace_existing=True
+    )
+    scheduler.start()
+    logger.info("スケジューラーを開始しました")
+
+
+def start_background_tasks(delay=SCHEDULER_START_DELAY):
+    """スケジューラーを ``delay`` 秒後にバックグラウンドのスレッドで初期化する。"""
+    def run():
+        try:
+            init_scheduler()
+        except Exception as e:
+            logger.error(f"スケジューラーの初期化に失敗しました: {str(e)}")
+
+    timer = threading.Timer(delay, run)
+    timer.name = 'scheduler-init'
+    timer.daemon = True
+    timer.start()
 
 
 # アプリケーションの初期化
 app = create_app()
+add_listener(publish_to_subscribers)
+add_listener(refresh_policy.observe)
+add_listener(trend_tracker.observe)
+# CDNへのパージ、メタデータの取得の依頼、事前レンダリング、メモリ使用量の見積もりは、取得を待っている
+# リクエストを止めないようバックグラウンドで呼び出す（名前付きフィードのレンダリングの後に、それも含めて
+# メモリ使用量を見積もる）
+add_listener(purge_on_change, background=True)
+add_listener(enrich_entries, background=True)
+add_listener(render_catalog, background=True)
+add_listener(measure_snapshot, background=True)
+add_listener(feed_warmer.warm, background=True)
 
-# 初期データを取得
-try:
-    update_global_store()
-except Exception as e:
-    logger.error(f"初期データ取得に失敗しました: {str(e)}")
-
-# スケジューラーを初期化
-try:
-    init_scheduler()
-except Exception as e:
-    logger.error(f"スケジューラーの初期化に失敗しました: {str(e)}")
+# スケジューラーを初期化（初回のデータもスケジューラーが取得する）
+start_background_tasks()
 
 # Render用のWSGIアプリケーション
 application = app
@@ -690,4 +949,4 @@ application = app
 # ローカル開発時のみ実行
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
-    app.run(debug=True, port=port)
\ No newline at end of file
+    app.run(debug=True, port=port)
@@ -0,0 +1,401 @@
+"""ASGIアプリケーションの定義モジュール。
+
+このモジュールは、アプリケーションをASGIサーバー（uvicornなど）で提供するための
+ASGIアプリケーションを定義します。フィードのエンドポイントは非同期クライアントで
+はてなブックマークからデータを取得するため、上流の応答が遅くてもワーカーを占有せず、
+1プロセスで数千の同時接続を扱えます。しきい値ごとのフィード更新をプッシュ配信する
+エンドポイントも、待機中の接続をスレッドを持たずにイベントループ上で保持します。
+
+エンドポイント:
+    GET /hotentry/<category>/feed?threshold=XX: RSSフィード（非同期版）
+    GET /hotentry/all/feed/nocache?threshold=XX: 上記と同じ（互換性のため）
+    GET /hotentry/all/stream?threshold=XX: Server-Sent Eventsでしきい値超えを配信
+    GET /hotentry/all/feed/wait?threshold=XX: ETagが変わるまで待機するロングポーリング
+    GET /health: ヘルスチェック
+
+上記以外のパス（ホームページなど）はスレッドプール上のFlaskアプリケーションに委譲します。
+"""
+
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+# Flaskアプリケーションの読み込みでスケジューラー（リフレッシャー）も起動する
+from .app import app as flask_app
+from .api import CATEGORIES
+from .cache import is_shared
+from .feed import (accepts_gzip, build_error_feed, encode_feed, generate_rss_feed,
+                   render_feed_items)
+from .notify import notifier
+from .ratelimit import (charge_full_response, check_request, client_key,
+                        too_many_requests_headers)
+from .cdn import degraded_headers, feed_cache_headers
+from .domains import parse_domain_filter
+from .search import parse_query
+from .store import get_serving_snapshot_async
+from .trace import server_timing_header, span, start_trace
+from .utils import parse_threshold
+from .warmup import feed_warmer
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# SSEのキープアライブ間隔（秒）
+HEARTBEAT_SECONDS = 15
+
+# ロングポーリングの待機時間（秒）
+DEFAULT_WAIT_SECONDS = 30
+MAX_WAIT_SECONDS = 60
+
+# 非同期版のないページを処理するFlaskアプリケーション
+wsgi_fallback = WsgiToAsgi(flask_app)
+
+
+async def application(scope, receive, send):
+    """ASGIアプリケーション本体。
+
+    Args:
+        scope (dict): ASGIスコープ
+        receive (callable): メッセージ受信関数
+        send (callable): メッセージ送信関数
+    """
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path']
+    category = _feed_category(path)
+    if category is not None:
+        await feed_endpoint(scope, receive, send, category)
+    elif path == '/hotentry/all/stream':
+        await stream_endpoint(scope, receive, send)
+    elif path == '/hotentry/all/feed/wait':
+        await wait_endpoint(scope, receive, send)
+    elif path == '/health':
+        await _send_response(send, 200, b'OK', 'text/html; charset=utf-8')
+    else:
+        await wsgi_fallback(scope, receive, send)
+
+
+async def feed_endpoint(scope, receive, send, category='all'):
+    """ホットエントリーのRSSフィードを返す（Flask版の非同期実装）。
+
+    ``If-None-Match`` で指定されたETagと一致する場合は304を返します。
+    """
+    query = _query_params(scope)
+    threshold = parse_threshold(query.get('threshold'))
+    terms = parse_query(query.get('q'))
+    query_lists = _query_lists(scope)
+    domains = parse_domain_filter(query_lists.get('include_domain', []),
+                                  query_lists.get('exclude_domain', []))
+    headers = _headers(scope)
+
+    # クライアントごとのリクエスト数の制限（Flask版と同じバケットを使う）
+    conditional = 'if-none-match' in headers or 'if-modified-since' in headers
+    key = await _limit_request(scope, headers, send, conditional)
+    if key is None:
+        return
+
+    compress = accepts_gzip(headers.get('accept-encoding'))
+    if not terms and domains is None:
+        feed_warmer.record(category, threshold, 'gzip' if compress else 'identity')
+
+    try:
+        with start_trace('feed', category=category, threshold=threshold, server='asgi') as trace:
+            # 新しいスナップショットがなければ取得する（同時の取得は1回にまとめられる）
+            # 取得に失敗した場合は、最後に取得できたスナップショットで代替する
+            with span('snapshot'):
+                snapshot, staleness = await get_serving_snapshot_async(category)
+            # しきい値・検索語・ドメインで絞り込んだアイテム（スナップショットごとにキャッシュ）。
+            # 共有キャッシュ（ファイル・Redis）の読み書きはブロックするため、スレッドで行う
+            if is_shared():
+                items, etag, _ = await asyncio.to_thread(
+                    render_feed_items, snapshot, category, threshold, terms, domains)
+            else:
+                items, etag, _ = render_feed_items(snapshot, category, threshold, terms, domains)
+            response_headers = feed_cache_headers([category], [threshold], {category: snapshot})
+            if staleness is not None:
+                response_headers.update(degraded_headers(staleness))
+            extra_headers = [(b'etag', f'W/"{etag}"'.encode('ascii')),
+                             (b'vary', b'Accept-Encoding')]
+            extra_headers.extend((name.lower().encode('ascii'), value.encode('ascii'))
+                                 for name, value in response_headers.items())
+            if _parse_etag(headers.get('if-none-match')) == etag:
+                await _send_response(send, 304, b'', None, _with_timing(extra_headers, trace))
+                return
+            if conditional:
+                charge_full_response(key)
+
+            host_url = _host_url(scope, headers)
+            body = encode_feed(snapshot, category, threshold, items, host_url,
+                               _request_url(scope, host_url), terms, domains, compress)
+            if compress:
+                extra_headers.append((b'content-encoding', b'gzip'))
+            await _send_response(send, 200, body, 'application/xml; charset=utf-8',
+                                 _with_timing(extra_headers, trace))
+    except Exception as e:
+        logger.error(f"フィード生成中にエラーが発生しました: {str(e)}")
+        await _send_response(send, 500, build_error_feed(e).encode('utf-8'),
+                             'application/xml; charset=utf-8')
+
+
+async def stream_endpoint(scope, receive, send):
+    """しきい値を新たに超えたエントリーをServer-Sent Eventsで配信する。
+
+    接続直後に現在のETagを ``ready`` イベントとして送り、以後はリフレッシャーが
+    新しいデータを取り込むたびに ``crossing`` （新たにしきい値を超えたエントリーあり）
+    または ``update`` （ETagのみ変化）イベントを送ります。
+    """
+    query = _query_params(scope)
+    threshold = parse_threshold(query.get('threshold'))
+    # 接続を保持し続けるため、購読の開始は通常のリクエストとして数える
+    if await _limit_request(scope, _headers(scope), send, False) is None:
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+
+    subscription = notifier.subscribe(threshold)
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        etag, _ = notifier.current(threshold)
+        await _send_chunk(send, 'retry: 10000\n' + _format_event(
+            'ready', etag, {'threshold': threshold, 'etag': etag}))
+
+        while True:
+            event = await _next_event(subscription, disconnected, HEARTBEAT_SECONDS)
+            if disconnected.done():
+                break
+            if event is None:
+                await _send_chunk(send, ': keepalive\n\n')
+                continue
+            if event.crossed:
+                data = {
+                    'threshold': threshold,
+                    'etag': event.etag,
+                    'entries': [_entry_summary(entry) for entry in event.crossed],
+                }
+                await _send_chunk(send, _format_event('crossing', event.etag, data))
+            else:
+                data = {'threshold': threshold, 'etag': event.etag}
+                await _send_chunk(send, _format_event('update', event.etag, data))
+    finally:
+        notifier.unsubscribe(subscription)
+        disconnected.cancel()
+
+
+async def wait_endpoint(scope, receive, send):
+    """フィードのETagが変わるまで待機し、変化後のRSSフィードを返す。
+
+    ``If-None-Match`` ヘッダー（または ``etag`` パラメータ）で指定されたETagと
+    現在のETagが異なればすぐに返します。待機時間内に変化がなければ304を返します。
+    """
+    query = _query_params(scope)
+    threshold = parse_threshold(query.get('threshold'))
+    timeout = min(parse_threshold(query.get('timeout'), DEFAULT_WAIT_SECONDS),
+                  MAX_WAIT_SECONDS)
+    headers = _headers(scope)
+    client_etag = _parse_etag(headers.get('if-none-match') or query.get('etag'))
+    # 待機を多数保持されないよう、フィードと同じバケットで数える
+    # （ETag付きは条件付きリクエスト。変化したフィードを返す場合は通常のバケットからも差し引く）
+    conditional = client_etag is not None
+    key = await _limit_request(scope, headers, send, conditional)
+    if key is None:
+        return
+
+    etag, entries = notifier.current(threshold)
+    if etag is None or etag == client_etag:
+        subscription = notifier.subscribe(threshold)
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            # 購読中に届いたイベントのうち、ETagが変化したものだけを採用する
+            loop = asyncio.get_running_loop()
+            remaining = max(timeout, 0)
+            deadline = loop.time() + remaining
+            while remaining > 0:
+                event = await _next_event(subscription, disconnected, remaining)
+                if disconnected.done():
+                    return
+                if event is None:
+                    break
+                if event.etag != client_etag:
+                    etag, entries = event.etag, event.entries
+                    break
+                remaining = deadline - loop.time()
+        finally:
+            notifier.unsubscribe(subscription)
+            disconnected.cancel()
+
+        if etag is None or etag == client_etag:
+            extra = [(b'etag', f'W/"{etag}"'.encode('ascii'))] if etag else []
+            await _send_response(send, 304, b'', None, extra)
+            return
+
+    if conditional:
+        charge_full_response(key)
+    host_url = _host_url(scope, headers)
+    self_url = f"{host_url}/hotentry/all/feed?threshold={threshold}"
+    body = generate_rss_feed(entries, threshold, host_url=host_url, self_url=self_url)
+    await _send_response(send, 200, body.encode('utf-8'), 'application/xml; charset=utf-8',
+                         [(b'etag', f'W/"{etag}"'.encode('ascii'))])
+
+
+async def _limit_request(scope, headers, send, conditional):
+    """クライアントごとのリクエスト数を数え、超えていれば429を送る。
+
+    Returns:
+        str: 許可した場合はクライアントのキー。429を送った場合はNone。
+    """
+    key = client_key((scope.get('client') or ('', 0))[0], headers.get('x-forwarded-for'),
+                     headers.get('user-agent'))
+    retry_after = check_request(key, conditional)
+    if not retry_after:
+        return key
+    await _send_response(send, 429, b'Too Many Requests\n', 'text/plain; charset=utf-8',
+                         [(name.lower().encode('ascii'), value.encode('ascii'))
+                          for name, value in too_many_requests_headers(retry_after).items()])
+    return None
+
+
+def _feed_category(path):
+    """フィードのパスであればカテゴリーを返す。
+
+    Returns:
+        str: カテゴリー。フィードのパスでない場合はNone。
+    """
+    if path == '/hotentry/all/feed/nocache':
+        return 'all'
+    parts = path.split('/')
+    if (len(parts) == 4 and parts[1] == 'hotentry' and parts[3] == 'feed'
+            and parts[2] in CATEGORIES):
+        return parts[2]
+    return None
+
+
+async def _next_event(subscription, disconnected, timeout):
+    """購読のイベントかクライアントの切断のどちらかを待つ。
+
+    Returns:
+        FeedEvent: 受け取ったイベント。タイムアウトまたは切断の場合はNone。
+    """
+    getter = asyncio.ensure_future(subscription.get(timeout))
+    await asyncio.wait({getter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+    if not getter.done():
+        getter.cancel()
+        return None
+    return getter.result()
+
+
+async def _wait_disconnect(receive):
+    """クライアントが切断するまで待つ。"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _lifespan(receive, send):
+    """ASGIのlifespanプロトコルに応答する。"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _send_response(send, status, body, content_type, extra_headers=None):
+    """レスポンス全体を一度に送信する。"""
+    headers = [(b'content-length', str(len(body)).encode('ascii'))]
+    if content_type:
+        headers.append((b'content-type', content_type.encode('ascii')))
+    headers.extend(extra_headers or [])
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_chunk(send, text):
+    """ストリーミングレスポンスの一部を送信する。"""
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+
+def _format_event(name, event_id, data):
+    """Server-Sent Eventsの1イベント分の文字列を生成する。"""
+    lines = [f'event: {name}']
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+def _entry_summary(entry):
+    """イベントに含めるエントリーの要約を返す。"""
+    return {
+        'title': entry.title,
+        'url': entry.url,
+        'count': entry.count,
+    }
+
+
+def _with_timing(headers, trace):
+    """Server-Timingヘッダーを付ける場合は追加したヘッダーのリストを返す。"""
+    timing = server_timing_header(trace)
+    if timing:
+        return headers + [(b'server-timing', timing.encode('ascii'))]
+    return headers
+
+
+def _query_params(scope):
+    """クエリ文字列を辞書（各キーの最初の値）に変換する。"""
+    return {key: values[0] for key, values in _query_lists(scope).items()}
+
+
+def _query_lists(scope):
+    """クエリ文字列を辞書（各キーの値のリスト）に変換する。"""
+    return parse_qs(scope.get('query_string', b'').decode('latin-1'))
+
+
+def _headers(scope):
+    """リクエストヘッダーを小文字キーの辞書に変換する。"""
+    return {key.decode('latin-1').lower(): value.decode('latin-1')
+            for key, value in scope.get('headers', [])}
+
+
+def _parse_etag(value):
+    """If-None-Matchの値から最初のETagを取り出す。"""
+    if not value:
+        return None
+    value = value.split(',')[0].strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    return value.strip('"') or None
+
+
+def _request_url(scope, host_url):
+    """リクエストURL（クエリ文字列を含む）を組み立てる。"""
+    url = host_url + scope.get('root_path', '') + scope['path']
+    query_string = scope.get('query_string', b'').decode('latin-1')
+    return f'{url}?{query_string}' if query_string else url
+
+
+def _host_url(scope, headers):
+    """リクエストのスキームとホストからベースURLを組み立てる。"""
+    scheme = headers.get('x-forwarded-proto') or scope.get('scheme', 'http')
+    host = headers.get('host')
+    if not host:
+        server = scope.get('server') or ('localhost', 80)
+        host = f'{server[0]}:{server[1]}'
+    return f'{scheme}://{host}'
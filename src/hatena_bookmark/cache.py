@@ -0,0 +1,435 @@
+"""インスタンス間で共有するキャッシュのバックエンドモジュール。
+
+このモジュールは、スナップショットとレンダリング済みのフィード（ETagを含む）を複数のインスタンスで
+共有するためのキャッシュを提供します。バックエンドは ``CACHE_BACKEND`` で切り替えます。
+
+- ``memory``: 共有しない（デフォルト。レンダリング済みのアイテムはプロセス内の ``feed`` のキャッシュだけに持つ）
+- ``file``: ``CACHE_DIR`` のファイル（同じホストのワーカー間で共有）
+- ``redis``: ``REDIS_URL`` のRedis（複数のホストで共有）
+
+Redisに接続できない場合（認証に失敗した場合を含む）は ``REDIS_RETRY_INTERVAL`` 秒間Redisを使わずに、
+キャッシュにないものとして扱います（障害中の呼び出しごとにタイムアウトまで待たないようにする）。
+
+値は先頭にフォーマットのバージョンを付けた、zlibで圧縮したJSONとして保存します。
+バージョンが異なる値（デプロイ前のインスタンスが書いた値など）は、キャッシュにないものとして扱います。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from queue import Empty, LifoQueue
+from urllib.parse import unquote, urlsplit
+
+# キャッシュのバックエンドと接続先
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'hatena-bookmark-cache'))
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+# Redisへの接続をプールしておく最大数と、接続・応答のタイムアウト（秒）
+REDIS_POOL_SIZE = int(os.environ.get('REDIS_POOL_SIZE', '8'))
+REDIS_TIMEOUT = float(os.environ.get('REDIS_TIMEOUT', '1.0'))
+
+# Redisに接続できなかった後、Redisを使わずにおく秒数
+REDIS_RETRY_INTERVAL = float(os.environ.get('REDIS_RETRY_INTERVAL', '10'))
+
+# ファイルのキャッシュで、有効期限の切れたファイルを削除する間隔（秒）
+CACHE_SWEEP_INTERVAL = float(os.environ.get('CACHE_SWEEP_INTERVAL', '600'))
+
+# 書きかけのまま残った一時ファイルを削除するまでの秒数
+_STALE_TEMP_SECONDS = 3600
+
+# キーの接頭辞（同じRedisを他の用途と共有できるようにする）
+KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'hatena-bookmark:')
+
+# 値のフォーマットの識別子とバージョン
+MAGIC = b'HB'
+FORMAT_VERSION = 1
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+def encode_value(value):
+    """値をキャッシュに保存するバイト列に変換する。
+
+    Args:
+        value: JSONに変換できる値
+
+    Returns:
+        bytes: バージョン付きの圧縮したJSON
+    """
+    payload = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return MAGIC + bytes([FORMAT_VERSION]) + zlib.compress(payload)
+
+
+def decode_value(data):
+    """キャッシュから読み出したバイト列を値に戻す。
+
+    Args:
+        data (bytes): ``encode_value`` で変換したバイト列
+
+    Returns:
+        値。バージョンが異なる、または壊れている場合はNone。
+    """
+    if not data or data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != FORMAT_VERSION:
+        return None
+    try:
+        return json.loads(zlib.decompress(data[len(MAGIC) + 1:]))
+    except (zlib.error, ValueError):
+        return None
+
+
+class CacheUnavailable(Exception):
+    """バックエンドが一時的に使えない場合の例外（キャッシュにないものとして扱う）。"""
+
+
+class NullCache:
+    """共有しない場合のバックエンド（何も保存しない）。"""
+
+    shared = False
+
+    def get(self, key):
+        return None
+
+    def set(self, key, data, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class FileCache:
+    """ディレクトリ内のファイルに保存するキャッシュ。
+
+    キーのハッシュをファイル名とし、先頭8バイトに有効期限（UNIX時刻、0は無期限）を書きます。
+    書き込みは一時ファイルからの置き換えで行うため、読み出し側が書きかけの値を見ることはありません。
+    書き込みのたびに、前回から ``sweep_interval`` 秒以上経っていれば有効期限の切れたファイルを削除します。
+    """
+
+    shared = True
+
+    def __init__(self, directory=CACHE_DIR, sweep_interval=CACHE_SWEEP_INTERVAL):
+        self.directory = directory
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._sweep_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < 8:
+            return None
+        expires, = struct.unpack('>d', data[:8])
+        if expires and expires < time.time():
+            return None
+        return data[8:]
+
+    def set(self, key, data, ttl=None):
+        expires = time.time() + ttl if ttl else 0.0
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(struct.pack('>d', expires) + data)
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        if time.monotonic() >= self._next_sweep:
+            self.sweep()
+
+    def sweep(self):
+        """有効期限の切れたファイルと、書きかけのまま残った一時ファイルを削除する。
+
+        他のワーカーが同時に削除・置き換えしても、削除済みのファイルは無視します
+        （置き換えた直後のファイルを削除した場合も、次の読み出しでキャッシュにないだけです）。
+
+        Returns:
+            int: 削除したファイルの数
+        """
+        if not self._sweep_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._next_sweep = time.monotonic() + self.sweep_interval
+            now = time.time()
+            removed = 0
+            for entry in os.scandir(self.directory):
+                try:
+                    if entry.name.startswith('.tmp-'):
+                        expired = entry.stat().st_mtime + _STALE_TEMP_SECONDS < now
+                    else:
+                        with open(entry.path, 'rb') as f:
+                            header = f.read(8)
+                        expires = struct.unpack('>d', header)[0] if len(header) == 8 else 0.0
+                        expired = len(header) < 8 or (expires and expires < now)
+                    if expired:
+                        os.unlink(entry.path)
+                        removed += 1
+                except OSError:
+                    continue
+            if removed:
+                logger.info(f"有効期限の切れたキャッシュのファイルを{removed}件削除しました")
+            return removed
+        finally:
+            self._sweep_lock.release()
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class RedisError(Exception):
+    """Redisがエラーを返した、または応答を解釈できなかった場合の例外。"""
+
+
+class _RedisConnection:
+    """RESP（Redisのプロトコル）で通信する1本の接続。"""
+
+    def __init__(self, host, port, db, password, timeout):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile('rb')
+        try:
+            if password:
+                self.execute('AUTH', password)
+            if db:
+                self.execute('SELECT', db)
+        except BaseException:
+            # 認証やデータベースの選択に失敗した接続は使えないため、ソケットを閉じる
+            self.close()
+            raise
+
+    def execute(self, *args):
+        parts = [f'*{len(args)}\r\n'.encode('ascii')]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Redisとの接続が切断されました')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RedisError(rest.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError('Redisとの接続が切断されました')
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise RedisError(f'解釈できない応答です: {line!r}')
+
+    def close(self):
+        try:
+            self._file.close()
+            self._sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache:
+    """Redisに保存するキャッシュ。
+
+    RESPで直接通信するため、Redisのクライアントライブラリは不要です。接続はプールして
+    再利用し、通信に失敗した接続は破棄します（次の呼び出しで新しく接続します）。
+    接続や通信に失敗した後 ``retry_interval`` 秒間は、接続を試みずに ``CacheUnavailable`` を送出します。
+    """
+
+    shared = True
+
+    def __init__(self, url=REDIS_URL, pool_size=REDIS_POOL_SIZE, timeout=REDIS_TIMEOUT,
+                 retry_interval=REDIS_RETRY_INTERVAL):
+        parts = urlsplit(url)
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 6379
+        self.db = int(parts.path.lstrip('/') or 0)
+        self.password = unquote(parts.password) if parts.password else None
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._pool = LifoQueue(maxsize=pool_size)
+        # 接続を再び試みる時刻（time.monotonic、0は接続できている）
+        self._down_until = 0.0
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except Empty:
+            return _RedisConnection(self.host, self.port, self.db, self.password, self.timeout)
+
+    def _release(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except Exception:
+            connection.close()
+
+    def execute(self, *args):
+        """コマンドを実行して応答を返す。
+
+        Raises:
+            CacheUnavailable: 直前に接続や通信に失敗し、再び試みるまでの間の場合
+        """
+        if self._down_until and time.monotonic() < self._down_until:
+            raise CacheUnavailable('Redisへの接続を一時的に停止しています')
+        try:
+            connection = self._acquire()
+        except (OSError, RedisError):
+            # 接続できない場合と、認証やデータベースの選択に失敗した場合（設定の誤り）は同じく扱う
+            self._mark_down()
+            raise
+        try:
+            reply = connection.execute(*args)
+        except RedisError:
+            # エラーの応答を読み切っているため、接続は再利用できる
+            self._release(connection)
+            raise
+        except OSError:
+            connection.close()
+            self._mark_down()
+            raise
+        except BaseException:
+            connection.close()
+            raise
+        self._down_until = 0.0
+        self._release(connection)
+        return reply
+
+    def _mark_down(self):
+        """接続や通信の失敗を記録し、``retry_interval`` 秒間は接続を試みないようにする。"""
+        if self.retry_interval <= 0:
+            return
+        self._down_until = time.monotonic() + self.retry_interval
+        logger.warning(f"Redisに接続できないため、{self.retry_interval:.0f}秒間使用しません")
+        # プールしている接続も同じ障害で使えないため破棄する
+        self.close()
+
+    def get(self, key):
+        return self.execute('GET', key)
+
+    def set(self, key, data, ttl=None):
+        if ttl:
+            self.execute('SET', key, data, 'EX', max(1, int(ttl)))
+        else:
+            self.execute('SET', key, data)
+
+    def delete(self, key):
+        self.execute('DEL', key)
+
+    def close(self):
+        """プールしている接続をすべて閉じる。"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                return
+
+
+def create_cache(kind=CACHE_BACKEND):
+    """設定に応じたキャッシュのバックエンドを生成する。
+
+    Args:
+        kind (str, optional): ``memory``、``file``、``redis`` のいずれか
+
+    Returns:
+        キャッシュのバックエンド（``get``、``set``、``delete`` と ``shared`` を持つオブジェクト）
+    """
+    if kind == 'redis':
+        return RedisCache()
+    if kind == 'file':
+        try:
+            return FileCache()
+        except OSError as e:
+            logger.error(f"キャッシュのディレクトリを作成できないため共有しません: {str(e)}")
+    return NullCache()
+
+
+# アプリケーション全体で使用するキャッシュのバックエンド
+cache_backend = create_cache()
+
+
+def set_cache_backend(backend):
+    """キャッシュのバックエンドを差し替える（テストやアプリケーションの初期化で使用）。
+
+    Returns:
+        差し替える前のバックエンド
+    """
+    global cache_backend
+    previous, cache_backend = cache_backend, backend
+    return previous
+
+
+def cache_get(key):
+    """共有キャッシュから値を読み出す。
+
+    インスタンス間で共有しないバックエンドの場合や、読み出しに失敗した場合はNoneを返します
+    （キャッシュの障害でリクエストが失敗しないようにする）。
+
+    Args:
+        key (str): キー（接頭辞は自動で付く）
+
+    Returns:
+        値。キャッシュにない場合はNone。
+    """
+    backend = cache_backend
+    if not backend.shared:
+        return None
+    try:
+        return decode_value(backend.get(KEY_PREFIX + key))
+    except CacheUnavailable:
+        return None
+    except Exception as e:
+        logger.warning(f"共有キャッシュの読み出しに失敗しました: {str(e)}")
+        return None
+
+
+def cache_set(key, value, ttl=None):
+    """共有キャッシュに値を書き込む（共有しないバックエンドの場合は何もしない）。
+
+    Args:
+        key (str): キー（接頭辞は自動で付く）
+        value: JSONに変換できる値
+        ttl (float, optional): 有効期限（秒）
+    """
+    backend = cache_backend
+    if not backend.shared:
+        return
+    try:
+        backend.set(KEY_PREFIX + key, encode_value(value), ttl)
+    except CacheUnavailable:
+        return
+    except Exception as e:
+        logger.warning(f"共有キャッシュへの書き込みに失敗しました: {str(e)}")
+
+
+def is_shared():
+    """インスタンス間で共有するバックエンドを使用しているかどうかを返す。"""
+    return cache_backend.shared
@@ -0,0 +1,236 @@
+"""設定ファイルで定義した名前付きフィードのモジュール。
+
+このモジュールは、``FEED_CATALOG`` のJSONファイルで定義したフィード（カテゴリー、しきい値、
+キーワード、ドメインの指定の組み合わせ）を ``/f/<name>`` の短いURLで提供します。
+
+名前付きフィードは、スナップショットが更新されるたびにリフレッシャーが（``store.add_listener`` に
+登録した ``render_catalog`` で）RSSのバイト列までレンダリングしておくため、リクエストの処理は
+レンダリング済みのバイト列を返すだけになります。レンダリング済みのものがない場合（スナップショットが
+古い、まだ取得していないなど）は、通常のフィードと同じ処理で生成します。
+
+設定ファイルの例::
+
+    {
+      "feeds": [
+        {"name": "tech-200", "category": "it", "threshold": 200},
+        {"name": "no-video", "category": "all", "threshold": 500,
+         "exclude_domain": ["youtube.com", "nicovideo.jp"]},
+        {"name": "ai", "threshold": 50, "q": "AI"}
+      ]
+    }
+
+チャンネルのリンクとatom:linkには ``PUBLIC_BASE_URL`` を使います。設定されていない場合は
+レンダリングしておかず、リクエストごとにそのホストで生成します（リクエストのHostヘッダーは
+クライアントが指定できるため、すべてのクライアントに返すバイト列には使いません）。
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from .api import CATEGORIES
+from .domains import parse_domain_filter
+from .enrich import enrichment_generation
+from .feed import assemble_feed, render_feed_items
+from .memory import estimate_size, memory_budget
+from .search import parse_query
+from .store import get_snapshot, snapshot_lifetime
+
+# 名前付きフィードの設定ファイル
+FEED_CATALOG = os.environ.get('FEED_CATALOG', '')
+
+# チャンネルのリンクに使う公開URL（例: https://example.onrender.com）
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '')
+
+# 名前に使える文字
+_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# 名前付きフィードの定義（domainsは ``parse_domain_filter`` で変換済み）
+CatalogFeed = namedtuple('CatalogFeed', ['name', 'category', 'threshold', 'query', 'domains'])
+
+# レンダリング済みの名前付きフィード
+#   body: RSSのバイト列, etag: ETag, version: 使用したスナップショットの更新番号,
+#   generation: 使用した記事のメタデータの世代
+RenderedFeed = namedtuple('RenderedFeed', ['body', 'etag', 'version', 'generation'])
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+def parse_catalog(data):
+    """設定の内容を名前付きフィードの辞書に変換する。
+
+    不正な定義はログに記録して読み飛ばします。
+
+    Args:
+        data (dict): 設定ファイルの内容（``feeds`` にフィードの定義のリスト）
+
+    Returns:
+        dict: 名前 -> CatalogFeed
+    """
+    feeds = {}
+    definitions = data.get('feeds', []) if isinstance(data, dict) else []
+    for definition in definitions:
+        try:
+            feed = _parse_feed(definition)
+        except (TypeError, ValueError) as e:
+            logger.error(f"名前付きフィードの定義が不正です: {str(e)}")
+            continue
+        if feed.name in feeds:
+            logger.error(f"名前付きフィードの名前が重複しています: {feed.name}")
+            continue
+        feeds[feed.name] = feed
+    return feeds
+
+
+def _parse_feed(definition):
+    name = definition.get('name')
+    if not isinstance(name, str) or not _NAME_PATTERN.match(name):
+        raise ValueError(f'名前が不正です: {name!r}')
+    category = definition.get('category', 'all')
+    if category not in CATEGORIES:
+        raise ValueError(f'カテゴリーが不正です: {category!r}')
+    threshold = definition.get('threshold', 100)
+    if isinstance(threshold, bool) or not isinstance(threshold, int):
+        raise ValueError(f'しきい値が不正です: {threshold!r}')
+    domains = parse_domain_filter(_as_list(definition.get('include_domain')),
+                                  _as_list(definition.get('exclude_domain')))
+    query = definition.get('q')
+    if query is not None and not isinstance(query, str):
+        raise ValueError(f'キーワードが不正です: {query!r}')
+    return CatalogFeed(name, category, threshold, query, domains)
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [str(item) for item in value]
+
+
+def load_catalog(path=FEED_CATALOG):
+    """設定ファイルを読み込む。
+
+    Args:
+        path (str, optional): 設定ファイルのパス（空の場合は名前付きフィードなし）
+
+    Returns:
+        dict: 名前 -> CatalogFeed
+    """
+    if not path:
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return parse_catalog(json.load(f))
+    except (OSError, ValueError) as e:
+        logger.error(f"名前付きフィードの設定を読み込めませんでした: {str(e)}")
+        return {}
+
+
+class FeedCatalog:
+    """名前付きフィードと、そのレンダリング済みのバイト列を保持する。
+
+    Args:
+        feeds (dict): 名前 -> CatalogFeed
+        base_url (str, optional): チャンネルのリンクに使う公開URL
+    """
+
+    def __init__(self, feeds, base_url=''):
+        self.feeds = feeds
+        self.base_url = base_url.rstrip('/') or None
+        # 名前 -> RenderedFeed（差し替えて更新するため、読み出しにロックは不要）
+        self._rendered = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """名前付きフィードの定義を返す（ない場合はNone）。"""
+        return self.feeds.get(name)
+
+    def render(self, category, snapshot):
+        """カテゴリーの名前付きフィードをすべてレンダリングしておく。
+
+        Args:
+            category (str): 更新されたカテゴリー
+            snapshot (Snapshot): 更新されたスナップショット
+        """
+        if self.base_url is None or snapshot is None:
+            return
+        rendered = {}
+        generation = enrichment_generation()
+        for feed in self.feeds.values():
+            if feed.category != category:
+                continue
+            terms = parse_query(feed.query)
+            items, etag, _ = render_feed_items(snapshot, category, feed.threshold, terms,
+                                               feed.domains)
+            body = assemble_feed(items, feed.threshold, f'{self.base_url}/',
+                                 f'{self.base_url}/f/{feed.name}', category, terms)
+            rendered[feed.name] = RenderedFeed(body.encode('utf-8'), etag, snapshot.version,
+                                               generation)
+        if rendered:
+            with self._lock:
+                self._rendered = {**self._rendered, **rendered}
+
+    def lookup(self, name):
+        """現在のスナップショットでレンダリング済みのフィードを返す。
+
+        スナップショットの更新後に記事のメタデータ（``enrich``）の取得が進んでいた場合は、
+        そのカテゴリーの名前付きフィードをレンダリングし直してから返します。
+
+        Args:
+            name (str): 名前
+
+        Returns:
+            tuple: (RenderedFeed, Snapshot)。レンダリング済みのものが古い、またはない場合は (None, None)。
+        """
+        feed = self.feeds.get(name)
+        rendered = self._rendered.get(name)
+        if feed is None or rendered is None:
+            return None, None
+        snapshot = get_snapshot(feed.category)
+        if snapshot is None or snapshot.version != rendered.version:
+            return None, None
+        if ((datetime.now() - snapshot.last_update).total_seconds()
+                > snapshot_lifetime(feed.category)):
+            return None, None
+        if rendered.generation != enrichment_generation():
+            self.render(feed.category, snapshot)
+            rendered = self._rendered[name]
+        return rendered, snapshot
+
+    def memory_usage(self):
+        """レンダリング済みのフィードの件数と、メモリ使用量の見積もり（バイト）を返す。"""
+        rendered = self._rendered
+        return len(rendered), estimate_size(rendered)
+
+    def status(self):
+        """名前付きフィードごとのレンダリングの状況を返す。"""
+        rendered = self._rendered
+        return {
+            name: {
+                'category': feed.category,
+                'threshold': feed.threshold,
+                'rendered_version': rendered[name].version if name in rendered else None,
+            }
+            for name, feed in self.feeds.items()
+        }
+
+
+# アプリケーション全体で使用する名前付きフィード
+catalog = FeedCatalog(load_catalog(), PUBLIC_BASE_URL)
+memory_budget.add_source('catalog_feeds', catalog.memory_usage)
+
+
+def render_catalog(category, entries):
+    """スナップショットが更新されたら、そのカテゴリーの名前付きフィードをレンダリングする。
+
+    ``store.add_listener`` に登録して使います。
+    """
+    if not catalog.feeds:
+        return
+    catalog.render(category, get_snapshot(category))
@@ -0,0 +1,229 @@
+"""CDN・リバースプロキシ向けのキャッシュ制御モジュール。
+
+このモジュールは、フィードとHTMLのレスポンスに付ける ``Cache-Control`` と ``Surrogate-Key`` を
+計算し、スナップショットの内容が変わったときにCDNへパージを依頼する機能を提供します。
+
+``max-age`` は次の更新までの残り時間（スナップショットの経過時間と更新間隔から計算）に合わせるため、
+エッジキャッシュは更新されていないフィードへのポーリングをアプリケーションに届けずに応答できます。
+パージの送信先は ``CDN_PURGE`` で切り替えます（``noop``、``recording``、``http``）。
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from .store import snapshot_lifetime
+
+# 更新間隔を過ぎたレスポンスを、裏で再検証しながら返してよい秒数
+STALE_WHILE_REVALIDATE = int(os.environ.get('CDN_STALE_WHILE_REVALIDATE', '60'))
+
+# アプリケーションがエラーを返す間、古いレスポンスを返してよい秒数
+STALE_IF_ERROR = int(os.environ.get('CDN_STALE_IF_ERROR', '86400'))
+
+# スナップショットに依存しないページ（OPML、デバッグページ）のmax-age
+STATIC_MAX_AGE = int(os.environ.get('CDN_STATIC_MAX_AGE', '3600'))
+
+# パージの送信方法と送信先
+CDN_PURGE = os.environ.get('CDN_PURGE', 'noop')
+CDN_PURGE_URL = os.environ.get('CDN_PURGE_URL', '')
+CDN_PURGE_TOKEN = os.environ.get('CDN_PURGE_TOKEN', '')
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+def category_key(category):
+    """カテゴリーのすべてのフィードに付けるSurrogate-Key。"""
+    return f'hotentry-{category}'
+
+
+def feed_key(category, threshold):
+    """カテゴリー・しきい値ごとのフィードに付けるSurrogate-Key。"""
+    return f'hotentry-{category}-t{threshold}'
+
+
+def snapshot_max_age(category, snapshot):
+    """スナップショットが次に更新されるまでの残り秒数を返す。
+
+    アプリケーションが同じスナップショットを返し続ける期間（``store.snapshot_lifetime``）に合わせるため、
+    スケジューラーが更新間隔を延ばしている間（夜間など）は、エッジキャッシュも長く保持します。
+
+    Args:
+        category (str): カテゴリー
+        snapshot (Snapshot): ``store`` のスナップショット（Noneの場合は0を返す）
+
+    Returns:
+        int: max-ageに使う秒数
+    """
+    if snapshot is None:
+        return 0
+    age = (datetime.now() - snapshot.last_update).total_seconds()
+    return max(0, int(snapshot_lifetime(category) - age))
+
+
+def cache_control(max_age):
+    """Cache-Controlヘッダーの値を返す。"""
+    return (f'public, max-age={max_age}, stale-while-revalidate={STALE_WHILE_REVALIDATE}, '
+            f'stale-if-error={STALE_IF_ERROR}')
+
+
+def feed_cache_headers(categories, thresholds, snapshots):
+    """フィードのレスポンスに付けるキャッシュ関連のヘッダーを返す。
+
+    Args:
+        categories (list): レスポンスに含まれるカテゴリー
+        thresholds (list): レスポンスに含まれるしきい値
+        snapshots (dict): カテゴリー -> 使用したスナップショット
+
+    Returns:
+        dict: Cache-ControlとSurrogate-Key
+    """
+    max_age = min((snapshot_max_age(category, snapshots.get(category)) for category in categories),
+                  default=0)
+    keys = ['feed']
+    for category in categories:
+        keys.append(category_key(category))
+        keys.extend(feed_key(category, threshold) for threshold in thresholds)
+    return {'Cache-Control': cache_control(max_age), 'Surrogate-Key': ' '.join(keys)}
+
+
+def degraded_headers(staleness):
+    """取得に失敗して古いスナップショットで代替したレスポンスに付けるヘッダーを返す。
+
+    Args:
+        staleness (float): 代替したスナップショットの経過秒数
+
+    Returns:
+        dict: Warning（110 Response is Stale）とX-Feed-Stale-Seconds
+    """
+    return {'Warning': '110 - "Response is Stale"', 'X-Feed-Stale-Seconds': str(int(staleness))}
+
+
+def html_cache_headers(snapshot=None):
+    """HTMLのページに付けるキャッシュ関連のヘッダーを返す。
+
+    Args:
+        snapshot (dict, optional): ページに表示する総合のスナップショット。
+            Noneの場合はスナップショットに依存しないページとして扱う。
+
+    Returns:
+        dict: Cache-ControlとSurrogate-Key
+    """
+    if snapshot is None:
+        return {'Cache-Control': cache_control(STATIC_MAX_AGE), 'Surrogate-Key': 'html'}
+    return {'Cache-Control': cache_control(snapshot_max_age('all', snapshot)),
+            'Surrogate-Key': f'html {category_key("all")}'}
+
+
+class NoopPurger:
+    """パージを行わない（CDNを使わない場合）。"""
+
+    def purge(self, keys):
+        pass
+
+
+class RecordingPurger:
+    """パージの依頼を記録するだけのスタンドイン（テストやローカルでの確認用）。"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def purge(self, keys):
+        with self._lock:
+            self.calls.append(list(keys))
+
+
+class HttpPurger:
+    """``CDN_PURGE_URL`` にSurrogate-Keyを指定したPOSTを送ってパージする。
+
+    Fastlyのサロゲートキーによるパージと同じく、キーを ``Surrogate-Key`` ヘッダーに
+    空白区切りで指定します。リフレッシャーを待たせないよう、送信は別スレッドで行います。
+    """
+
+    def __init__(self, url, token=''):
+        self.url = url
+        self.token = token
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cdn-purge')
+
+    def purge(self, keys):
+        self._executor.submit(self._send, list(keys))
+
+    def _send(self, keys):
+        headers = {'Surrogate-Key': ' '.join(keys)}
+        if self.token:
+            headers['Fastly-Key'] = self.token
+        try:
+            response = requests.post(self.url, headers=headers, timeout=5)
+            response.raise_for_status()
+            logger.info(f"CDNのキャッシュをパージしました: {' '.join(keys)}")
+        except Exception as e:
+            logger.error(f"CDNのキャッシュのパージに失敗しました: {str(e)}")
+
+
+def create_purger(kind=CDN_PURGE):
+    """設定に応じたパージの送信方法を生成する。
+
+    Args:
+        kind (str, optional): ``noop``、``recording``、``http`` のいずれか
+
+    Returns:
+        パージの送信方法（``purge(keys)`` を持つオブジェクト）
+    """
+    if kind == 'http':
+        if not CDN_PURGE_URL:
+            logger.error("CDN_PURGEがhttpですがCDN_PURGE_URLが設定されていません")
+            return NoopPurger()
+        return HttpPurger(CDN_PURGE_URL, CDN_PURGE_TOKEN)
+    if kind == 'recording':
+        return RecordingPurger()
+    return NoopPurger()
+
+
+# アプリケーション全体で使用するパージの送信方法
+purger = create_purger()
+
+# カテゴリー -> 直近のスナップショットの内容のハッシュ
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def set_purger(new_purger):
+    """パージの送信方法を差し替える（テストやアプリケーションの初期化で使用）。
+
+    Returns:
+        差し替える前の送信方法
+    """
+    global purger
+    previous, purger = purger, new_purger
+    return previous
+
+
+def purge_on_change(category, entries):
+    """スナップショットの内容が変わっていれば、そのカテゴリーのキャッシュをパージする。
+
+    ``store.add_listener`` に登録して使います。プロセスで最初のスナップショットは、
+    比較対象がないためパージしません。
+
+    Args:
+        category (str): カテゴリー
+        entries (list): 新しいスナップショットのエントリーのリスト
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for entry in entries:
+        digest.update(f'{entry.url}-{entry.count}\n'.encode('utf-8'))
+    fingerprint = digest.hexdigest()
+
+    with _fingerprints_lock:
+        previous = _fingerprints.get(category)
+        _fingerprints[category] = fingerprint
+    if previous is None or previous == fingerprint:
+        return
+
+    # 総合のキーはホームページ（最終更新時刻を表示）にも付いている
+    purger.purge([category_key(category)])
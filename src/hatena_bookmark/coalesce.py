@@ -0,0 +1,146 @@
+"""同時呼び出しの集約（シングルフライト）機能モジュール。
+
+このモジュールは、同じキーに対する処理が実行中の間に届いた呼び出しを待たせ、
+実行中の処理の結果を共有させる仕組みを提供します。リクエストを処理するスレッド、
+APSchedulerのジョブ、ASGIモードのコルーチンのいずれから呼ばれても、
+同じキーの処理は同時に1つしか実行されません。
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+class _Abandoned(Exception):
+    """実行者が取り消された（結果を出さずに終わった）ことを待機中の呼び出しに伝える。"""
+
+
+class SingleFlight:
+    """キーごとに実行中の処理を1つに集約する。
+
+    実行中の処理は ``concurrent.futures.Future`` で表すため、スレッドからは
+    ``result()`` で、コルーチンからは ``asyncio.wrap_future`` で同じ結果を待てます。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        # キー -> [Future, 合流した呼び出し数]
+        self._in_flight = {}
+        self._calls = 0
+        self._executions = 0
+        self._coalesced = 0
+
+    def _join(self, key):
+        """実行中の処理に合流するか、新しい処理を登録する。
+
+        Returns:
+            tuple: (Future, 自分が実行者かどうか)
+        """
+        with self._lock:
+            self._calls += 1
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                flight[1] += 1
+                self._coalesced += 1
+                return flight[0], False
+            future = concurrent.futures.Future()
+            self._in_flight[key] = [future, 0]
+            self._executions += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        """処理の結果を待機中の呼び出しに共有する。"""
+        with self._lock:
+            waiters = self._in_flight.pop(key)[1]
+        if waiters:
+            logger.info(f"{self.name}: {key}への{waiters + 1}件の呼び出しを1回の処理にまとめました")
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """同じキーの処理が実行中であればその結果を待ち、なければ ``fn`` を実行する。
+
+        Args:
+            key (hashable): 集約のキー
+            fn (callable): 実行する処理（引数なし）
+
+        Returns:
+            object: 処理の結果
+
+        Raises:
+            Exception: 処理が送出した例外（待機中の呼び出しにも同じ例外が送出される）
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except _Abandoned:
+                # 実行者が取り消されたため、合流し直す（最初の呼び出しが実行者になる）
+                continue
+        try:
+            result = fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, error=_Abandoned(key))
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key, coro_fn):
+        """``do`` のコルーチン版。
+
+        スレッドで実行中の処理にも合流できます。実行者のコルーチンが取り消された場合
+        （ASGIのクライアントが切断した場合など）、待機中の呼び出しには取り消しを伝えず、
+        そのうちの1つが処理を実行し直します。
+
+        Args:
+            key (hashable): 集約のキー
+            coro_fn (callable): コルーチンを返す関数（引数なし）
+
+        Returns:
+            object: 処理の結果
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return await asyncio.wrap_future(future)
+            except _Abandoned:
+                continue
+        try:
+            result = await coro_fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, error=_Abandoned(key))
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def stats(self):
+        """集約の統計を返す。
+
+        Returns:
+            dict: calls（呼び出し数）、executions（実際の実行数）、
+                coalesced（実行中の処理に合流した呼び出し数）、in_flight（実行中の数）
+        """
+        with self._lock:
+            return {
+                'calls': self._calls,
+                'executions': self._executions,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._in_flight),
+            }
@@ -0,0 +1,130 @@
+"""ドメインによるエントリーの絞り込みモジュール。
+
+このモジュールは、``include_domain`` / ``exclude_domain`` パラメータで指定されたドメイン
+（とパスの前方一致）でエントリーを絞り込む機能を提供します。``youtube.com`` のように指定すると
+``www.youtube.com`` などのサブドメインにも一致し、``note.com/hatena`` のようにパスを付けると
+そのパスで始まるURLだけに一致します。
+
+エントリーのホスト名とパスは取り込み時に ``Entry`` で計算済みです。指定の組み合わせごとに
+コンパイルしたマッチャーはメモ化されるため、同じ指定でのポーリングではURLの解析も
+指定の解析も行いません。
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+from .utils import split_list_param
+
+# 1つのパラメータで指定できるドメインの最大数
+MAX_DOMAINS = 20
+
+# 正規化したドメインの指定（include, exclude はいずれも (ホスト名, パスの前方一致) のタプル）
+DomainSpec = namedtuple('DomainSpec', ['include', 'exclude'])
+
+
+def parse_domain_filter(include_values, exclude_values):
+    """クエリパラメータの値をドメインの指定に変換する。
+
+    Args:
+        include_values (list): ``include_domain`` の値のリスト（カンマ区切り・繰り返し指定可）
+        exclude_values (list): ``exclude_domain`` の値のリスト
+
+    Returns:
+        DomainSpec: 正規化した指定。どちらも指定されていない場合はNone。
+    """
+    include = _parse_rules(include_values)
+    exclude = _parse_rules(exclude_values)
+    if not include and not exclude:
+        return None
+    return DomainSpec(include, exclude)
+
+
+def _parse_rules(values):
+    """ドメインの指定を (ホスト名, パスの前方一致) の並べ替え済みのタプルに変換する。"""
+    rules = set()
+    for value in split_list_param(values)[:MAX_DOMAINS]:
+        if '://' in value:
+            value = value.split('://', 1)[1]
+        host, slash, path = value.partition('/')
+        # ホスト名は大文字小文字を区別しないが、パスは区別する
+        host = host.lower().lstrip('*.').rstrip('.')
+        if host:
+            rules.add((host, f'/{path}' if slash and path else ''))
+    return tuple(sorted(rules))
+
+
+class DomainMatcher:
+    """コンパイル済みのドメインの指定。
+
+    ホスト名ごとの判定（そのホスト名に適用されるパスの前方一致の一覧）を覚えておくため、
+    同じホスト名のエントリーはサフィックスの探索を繰り返しません。
+    """
+
+    __slots__ = ('_include', '_exclude', '_include_by_host', '_exclude_by_host')
+
+    def __init__(self, spec):
+        self._include = self._compile(spec.include)
+        self._exclude = self._compile(spec.exclude)
+        # ホスト名 -> 適用されるパスの前方一致のタプル（一致しない場合はNone）
+        self._include_by_host = {}
+        self._exclude_by_host = {}
+
+    @staticmethod
+    def _compile(rules):
+        """ホスト名 -> パスの前方一致のタプル（空文字列はホスト全体）に変換する。"""
+        compiled = {}
+        for host, path in rules:
+            compiled.setdefault(host, []).append(path)
+        return {host: tuple(paths) for host, paths in compiled.items()}
+
+    def matches(self, entry):
+        """エントリーが指定に一致するかどうかを返す。
+
+        Args:
+            entry (Entry): エントリー
+
+        Returns:
+            bool: includeの指定があればそのいずれかに一致し、excludeの指定のいずれにも
+                一致しない場合にTrue
+        """
+        if self._include and not self._match(entry, self._include, self._include_by_host):
+            return False
+        if self._exclude and self._match(entry, self._exclude, self._exclude_by_host):
+            return False
+        return True
+
+    def filter(self, entries):
+        """指定に一致するエントリーだけを返す。"""
+        return [entry for entry in entries if self.matches(entry)]
+
+    @staticmethod
+    def _match(entry, rules, by_host):
+        try:
+            paths = by_host[entry.host]
+        except KeyError:
+            paths = by_host[entry.host] = _lookup(rules, entry.host)
+        if paths is None:
+            return False
+        return any(entry.path.startswith(path) for path in paths)
+
+
+def _lookup(rules, host):
+    """ホスト名とその親ドメインに適用されるパスの前方一致を集める。"""
+    paths = []
+    labels = host.split('.')
+    for i in range(len(labels)):
+        paths.extend(rules.get('.'.join(labels[i:]), ()))
+    return tuple(paths) if paths else None
+
+
+@lru_cache(maxsize=256)
+def compile_domain_filter(spec):
+    """ドメインの指定をマッチャーにコンパイルする（指定ごとにメモ化）。
+
+    Args:
+        spec (DomainSpec): ``parse_domain_filter`` で変換した指定
+
+    Returns:
+        DomainMatcher: コンパイル済みのマッチャー
+    """
+    return DomainMatcher(spec)
@@ -0,0 +1,400 @@
+"""記事のメタデータ（サムネイルと説明）の取得モジュール。
+
+このモジュールは、ホットエントリーの記事ページから ``og:image`` と ``og:description`` を取得し、
+フィードのアイテムに付け加えるための情報（エンリッチメント）を提供します。
+
+取得はスナップショットの更新時に、まだ取得していないURLだけをバックグラウンドのワーカーで行います
+（ワーカー数は ``ENRICH_WORKERS``、同じホストへの同時取得は ``ENRICH_PER_HOST`` まで）。
+取得した結果はURLをキーとしてファイルに保存し（``ENRICH_CACHE_DIR``、有効期限は ``ENRICH_TTL``）、
+再起動後も再取得しません。フィードのレンダリングはプロセス内に読み込み済みの結果を参照するだけで、
+取得を待つことはありません。依頼したURLの取得がすべて終わると ``generation`` が1つ進み、
+次のリクエストから反映されます。
+
+外部のサイトにアクセスするため、``ENRICH_ENABLED`` を設定した場合だけ有効になります。
+"""
+
+import codecs
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.compat import chardet
+
+from .cache import FileCache, decode_value, encode_value
+from .memory import estimate_size, memory_budget
+
+# エンリッチメントを有効にするかどうか
+ENRICH_ENABLED = os.environ.get('ENRICH_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+# ワーカー数と、同じホストへの同時取得数
+ENRICH_WORKERS = int(os.environ.get('ENRICH_WORKERS', '4'))
+ENRICH_PER_HOST = int(os.environ.get('ENRICH_PER_HOST', '2'))
+
+# 記事ページの取得のタイムアウト（秒）と、読み込む最大バイト数（headに含まれるメタデータだけを使う）
+ENRICH_TIMEOUT = float(os.environ.get('ENRICH_TIMEOUT', '3.0'))
+ENRICH_MAX_BYTES = int(os.environ.get('ENRICH_MAX_BYTES', str(256 * 1024)))
+
+# 取得した結果の有効期限と、取得に失敗したURLを再取得しない秒数
+ENRICH_TTL = int(os.environ.get('ENRICH_TTL', str(7 * 24 * 3600)))
+ENRICH_FAILURE_TTL = int(os.environ.get('ENRICH_FAILURE_TTL', '3600'))
+
+# 取得した結果を保存するディレクトリ
+ENRICH_CACHE_DIR = os.environ.get('ENRICH_CACHE_DIR',
+                                  os.path.join(tempfile.gettempdir(), 'hatena-bookmark-enrich'))
+
+# プロセス内に保持する結果の件数
+ENRICH_MEMORY_SIZE = int(os.environ.get('ENRICH_MEMORY_SIZE', '2048'))
+
+# 記事ページの取得に使うヘッダー
+ENRICH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (compatible; HatenaBookmarkRSS/0.1)',
+    'Accept': 'text/html,application/xhtml+xml',
+}
+
+# 説明の最大文字数
+MAX_DESCRIPTION_LENGTH = 300
+
+# 記事のメタデータ（取得できなかった値はNone）
+Enrichment = namedtuple('Enrichment', ['image', 'description'])
+
+# 取得に失敗した、またはメタデータがなかったことを表す値
+EMPTY = Enrichment(None, None)
+
+# HTMLのmetaタグで指定された文字コード（<meta charset>とhttp-equivの両方）
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+class _MetaParser(HTMLParser):
+    """headのmetaタグからOGPのプロパティを集める（bodyに入ったら読むのをやめる）。"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.properties = {}
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            self.done = True
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            name = (attrs.get('property') or attrs.get('name') or '').lower()
+            if name in ('og:image', 'og:description', 'description') and attrs.get('content'):
+                self.properties.setdefault(name, attrs['content'].strip())
+
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            self.done = True
+
+
+def parse_metadata(html_text, base_url):
+    """記事ページのHTMLからメタデータを取り出す。
+
+    Args:
+        html_text (str): 記事ページのHTML（先頭部分）
+        base_url (str): 相対URLの基準にする記事のURL
+
+    Returns:
+        Enrichment: メタデータ
+    """
+    parser = _MetaParser()
+    for start in range(0, len(html_text), 8192):
+        parser.feed(html_text[start:start + 8192])
+        if parser.done:
+            break
+    image = parser.properties.get('og:image')
+    if image:
+        image = urljoin(base_url, image)
+        if not image.startswith(('http://', 'https://')):
+            image = None
+    description = parser.properties.get('og:description') or parser.properties.get('description')
+    if description:
+        description = ' '.join(description.split())[:MAX_DESCRIPTION_LENGTH]
+    return Enrichment(image or None, description or None)
+
+
+class Enricher:
+    """記事のメタデータをバックグラウンドで取得し、URLごとに保持する。
+
+    Args:
+        store (optional): 取得した結果を保存するキャッシュのバックエンド（``cache.FileCache`` など）
+        workers (int, optional): ワーカー数
+        per_host (int, optional): 同じホストへの同時取得数
+        timeout (float, optional): 取得のタイムアウト（秒）
+        session (requests.Session, optional): 取得に使うセッション
+    """
+
+    def __init__(self, store=None, workers=ENRICH_WORKERS, per_host=ENRICH_PER_HOST,
+                 timeout=ENRICH_TIMEOUT, session=None):
+        self.store = store
+        self.per_host = per_host
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.session.headers.update(ENRICH_HEADERS)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='enrich')
+        # URL -> Enrichment（レンダリングから参照される）
+        self._results = OrderedDict()
+        # 取得中のURL
+        self._pending = set()
+        # ホスト名 -> [同時取得数を制限するセマフォ, 待機中と取得中の数]（取得していないホストは削除する）
+        self._host_limits = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._stats = {'fetched': 0, 'loaded': 0, 'failed': 0}
+
+    @property
+    def generation(self):
+        """依頼したURLの取得が終わり、結果が追加されるたびに進む番号。
+
+        レンダリング済みのアイテムのキャッシュのキーに使うため、1回の依頼（スナップショットの更新）
+        ごとに、すべての取得が終わった時点で1つだけ進めます。
+        """
+        return self._generation
+
+    def get(self, url):
+        """URLのメタデータを返す（まだ取得していない場合はNone）。待機はしません。"""
+        result = self._results.get(url)
+        if result is None or result == EMPTY:
+            return None
+        return result
+
+    def submit(self, urls):
+        """まだ取得していないURLの取得をワーカーに依頼する（完了は待たない）。
+
+        同じホストのURLが続かないよう、ホストごとに交互に並べてから依頼します。
+
+        Args:
+            urls (iterable): 記事のURL
+
+        Returns:
+            int: 新たに依頼したURLの数
+        """
+        by_host = OrderedDict()
+        with self._lock:
+            for url in urls:
+                if url in self._results or url in self._pending:
+                    continue
+                self._pending.add(url)
+                by_host.setdefault(urlsplit(url).hostname or '', []).append(url)
+        queued = []
+        while by_host:
+            for host in list(by_host):
+                queued.append(by_host[host].pop(0))
+                if not by_host[host]:
+                    del by_host[host]
+        # 依頼の残りの数と、結果が追加されたかどうか（すべて終わったら世代を1つ進める）
+        batch = {'remaining': len(queued), 'changed': False}
+        for url in queued:
+            self._executor.submit(self._enrich, url, batch)
+        return len(queued)
+
+    def _enrich(self, url, batch):
+        # 例外で終わった場合は結果を保持せず、次の依頼で取得し直す
+        result = None
+        try:
+            result = self._load(url)
+            if result is None:
+                result = self._fetch(url)
+        except Exception as e:
+            logger.error(f"記事のメタデータの取得中にエラーが発生しました: {str(e)}")
+        finally:
+            self._remember(url, result, batch)
+
+    def _load(self, url):
+        """保存済みの結果を読み出す。"""
+        if self.store is None:
+            return None
+        try:
+            value = decode_value(self.store.get(url))
+        except Exception as e:
+            logger.warning(f"記事のメタデータの読み出しに失敗しました: {str(e)}")
+            return None
+        if not isinstance(value, list) or len(value) != 2:
+            return None
+        with self._lock:
+            self._stats['loaded'] += 1
+        return Enrichment(*value)
+
+    def _fetch(self, url):
+        """記事ページを取得してメタデータを取り出し、保存する。"""
+        with self._host_slot(urlsplit(url).hostname or ''):
+            try:
+                result = self._download(url)
+            except (requests.RequestException, ValueError) as e:
+                logger.info(f"記事のメタデータを取得できませんでした: {url}: {str(e)}")
+                result = None
+        with self._lock:
+            self._stats['fetched' if result is not None else 'failed'] += 1
+        if self.store is not None:
+            ttl = ENRICH_TTL if result is not None else ENRICH_FAILURE_TTL
+            try:
+                self.store.set(url, encode_value(list(result or EMPTY)), ttl)
+            except Exception as e:
+                logger.warning(f"記事のメタデータの保存に失敗しました: {str(e)}")
+        return result or EMPTY
+
+    def _download(self, url):
+        """記事ページの先頭を読み込み、HTMLであればメタデータを返す。"""
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '')
+            if 'html' not in content_type:
+                raise ValueError(f'HTMLではありません: {content_type}')
+            deadline = time.monotonic() + self.timeout
+            body = b''
+            for chunk in response.iter_content(8192):
+                body += chunk
+                if len(body) >= ENRICH_MAX_BYTES or b'</head>' in body or time.monotonic() > deadline:
+                    break
+            # charsetのないtext/htmlでは、requestsはISO-8859-1を返すため使わない
+            encoding = response.encoding if 'charset' in content_type.lower() else None
+        body = body[:ENRICH_MAX_BYTES]
+        text = body.decode(_valid_encoding(encoding) or detect_encoding(body), errors='replace')
+        return parse_metadata(text, url)
+
+    @contextmanager
+    def _host_slot(self, host):
+        """同じホストへの同時取得数を制限する（使われなくなったホストのセマフォは削除する）。"""
+        with self._lock:
+            slot = self._host_limits.get(host)
+            if slot is None:
+                slot = self._host_limits[host] = [threading.BoundedSemaphore(self.per_host), 0]
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if not slot[1]:
+                    del self._host_limits[host]
+
+    def _remember(self, url, result, batch):
+        with self._lock:
+            self._pending.discard(url)
+            if result is not None:
+                self._results[url] = result
+                self._results.move_to_end(url)
+                while len(self._results) > ENRICH_MEMORY_SIZE:
+                    self._results.popitem(last=False)
+                if result != EMPTY:
+                    batch['changed'] = True
+            batch['remaining'] -= 1
+            if not batch['remaining'] and batch['changed']:
+                self._generation += 1
+
+    def memory_usage(self):
+        """保持している結果の件数と、メモリ使用量の見積もり（バイト）を返す。"""
+        with self._lock:
+            results = list(self._results.items())
+        return len(results), estimate_size(results)
+
+    def status(self):
+        """保持している結果の数と、取得の統計を返す。"""
+        with self._lock:
+            return {
+                'enabled': True,
+                'cached': sum(1 for result in self._results.values() if result != EMPTY),
+                'pending': len(self._pending),
+                'generation': self._generation,
+                **self._stats,
+            }
+
+    def shutdown(self, wait=True):
+        """ワーカーを停止する。"""
+        self._executor.shutdown(wait=wait)
+
+
+def _valid_encoding(name):
+    """Pythonで使える文字コード名ならそのまま返す（使えない場合はNone）。"""
+    if not name:
+        return None
+    try:
+        codecs.lookup(name)
+    except LookupError:
+        return None
+    return name
+
+
+def detect_encoding(body):
+    """記事ページの先頭部分の文字コードを判定する。
+
+    HTMLのmetaタグで指定されていればそれを使い、なければUTF-8として読めるかを確かめ、
+    読めない場合は内容から推定します（``requests.Response.apparent_encoding`` と同じ方法）。
+
+    Args:
+        body (bytes): 記事ページの先頭部分
+
+    Returns:
+        str: 文字コード名
+    """
+    match = _META_CHARSET.search(body)
+    encoding = _valid_encoding(match.group(1).decode('ascii')) if match else None
+    if encoding:
+        return encoding
+    try:
+        body.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # 読み込みを打ち切った位置で途切れた文字は無視する
+        if e.start >= len(body) - 3 and e.reason == 'unexpected end of data':
+            return 'utf-8'
+    return _valid_encoding(chardet.detect(body).get('encoding')) or 'utf-8'
+
+
+def create_enricher():
+    """設定に応じてエンリッチメントを生成する（無効な場合はNone）。"""
+    if not ENRICH_ENABLED:
+        return None
+    try:
+        store = FileCache(ENRICH_CACHE_DIR)
+    except OSError as e:
+        logger.error(f"記事のメタデータを保存するディレクトリを作成できません: {str(e)}")
+        store = None
+    return Enricher(store)
+
+
+# アプリケーション全体で使用するエンリッチメント（無効な場合はNone）
+enricher = create_enricher()
+if enricher is not None:
+    memory_budget.add_source('enrichment', enricher.memory_usage)
+
+
+def get_enrichment(url):
+    """URLの取得済みのメタデータを返す（ない場合、無効な場合はNone）。"""
+    if enricher is None:
+        return None
+    return enricher.get(url)
+
+
+def enrichment_generation():
+    """取得済みのメタデータの世代を返す（無効な場合は0）。"""
+    return enricher.generation if enricher is not None else 0
+
+
+def enrich_entries(category, entries):
+    """スナップショットが更新されたら、新しいURLのメタデータの取得を依頼する。
+
+    ``store.add_listener`` に登録して使います。
+    """
+    if enricher is None:
+        return
+    enricher.submit(entry.url for entry in entries)
+
+
+def enrichment_status():
+    """エンリッチメントの状況を返す。"""
+    if enricher is None:
+        return {'enabled': False}
+    return enricher.status()
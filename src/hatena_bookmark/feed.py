@@ -3,112 +3,699 @@
 このモジュールは、はてなブックマークのホットエントリーからRSSフィードを生成する機能を提供します。
 """
 
+import bisect
+import hashlib
 import html
+import json
 import logging
+import os
+import struct
+import threading
+import zlib
+from collections import namedtuple
 from flask import request, Response
-from .api import fetch_hatena_hotentries
+from .api import CATEGORIES, CATEGORY_LABELS
+from .cache import cache_get, cache_set
+from .cdn import degraded_headers, feed_cache_headers
+from .domains import compile_domain_filter
+from .enrich import enrichment_generation, get_enrichment
+from .memory import SizedLRU, estimate_size, memory_budget
+from .search import parse_query
+from .store import get_serving_snapshot
+from .trace import server_timing_header, span, start_trace
+from .trending import trend_tracker
 from .utils import format_rfc822_date
 
+# レンダリング済みのアイテムを保持する件数（スナップショット・しきい値・検索語の組み合わせごと）
+FEED_CACHE_SIZE = int(os.environ.get('FEED_CACHE_SIZE', '256'))
+
+# gzipで圧縮するときの圧縮レベル
+FEED_GZIP_LEVEL = int(os.environ.get('FEED_GZIP_LEVEL', '6'))
+
+# 共有キャッシュにレンダリング済みのアイテムを保持する秒数
+SHARED_FEED_TTL = int(os.environ.get('SHARED_FEED_TTL', '3600'))
+
+# (カテゴリー, スナップショットの更新番号, 記事のメタデータの世代, しきい値, 検索語, ドメインの指定)
+#   -> (アイテムのXML, ETag, アイテム数)
+# 伸びのランキングは ('trending', ランキングの更新番号, 記事のメタデータの世代, しきい値, (), None)
+_feed_cache = SizedLRU(FEED_CACHE_SIZE)
+_feed_cache_lock = threading.Lock()
+
+# 圧縮済みのアイテム（raw: item要素のXMLのバイト列, data: それをdeflateで圧縮したブロック。
+# 最終ブロックではなく、バイト境界で終わるため、前後に別に圧縮したブロックをつなげられる）
+CompressedItems = namedtuple('CompressedItems', ['raw', 'data'])
+
+# _feed_cache と同じキー -> CompressedItems
+_compressed_cache = SizedLRU(FEED_CACHE_SIZE)
+
+# どちらのキャッシュも ``memory.MEMORY_BUDGET_MB`` の範囲に収める
+memory_budget.register('feed_items', _feed_cache, _feed_cache_lock)
+memory_budget.register('compressed_items', _compressed_cache, _feed_cache_lock)
+
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
 
-def generate_rss_feed(entries, threshold):
+def sort_by_count(entries):
+    """エントリーをブックマーク数の多い順に並べる。
+
+    同じブックマーク数のエントリーは元の順序を維持します。
+
+    Args:
+        entries (list): エントリーのリスト
+
+    Returns:
+        list: ブックマーク数の降順に並べたエントリーのリスト
+    """
+    return sorted(entries, key=lambda entry: entry.count, reverse=True)
+
+
+def filter_entries(entries, threshold):
+    """しきい値以上のブックマーク数を持つエントリーを抽出する。
+
+    Args:
+        entries (list): エントリーのリスト
+        threshold (int): ブックマーク数のしきい値
+
+    Returns:
+        list: しきい値以上のエントリーのリスト（ブックマーク数の降順）
+    """
+    return sort_by_count(entry for entry in entries if entry.count >= threshold)
+
+
+def compute_feed_etag(entries, threshold, terms=(), enrichment=''):
+    """フィードに含まれるアイテムからETagを計算する。
+
+    lastBuildDateはリクエストごとに変わるため、アイテムのguidの並びだけを
+    ハッシュ化します。フィード本文とは一致しないため弱いETagとして扱います。
+
+    Args:
+        entries (list): しきい値でフィルタリング済みのエントリーのリスト
+        threshold (int): ブックマーク数のしきい値
+        terms (tuple, optional): 検索語（チャンネルのタイトルに含まれるため区別する）
+        enrichment (str, optional): ``enrichment_digest`` の値（サムネイルが付いたら変わる）
+
+    Returns:
+        str: ETag値（引用符なし）
+    """
+    digest = hashlib.blake2b(str(threshold).encode('utf-8'), digest_size=8)
+    if terms:
+        digest.update(('\0' + ' '.join(terms)).encode('utf-8'))
+    if enrichment:
+        digest.update(('\0' + enrichment).encode('utf-8'))
+    for entry in entries:
+        digest.update(f"\n{entry.url}-{entry.count}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def enrichment_digest(entries):
+    """エントリーの取得済みのメタデータを要約した値を返す（メタデータがない場合は空文字列）。
+
+    メタデータはインスタンスごとに取得するため、世代ではなく内容から計算します。
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    found = False
+    for entry in entries:
+        enrichment = get_enrichment(entry.url)
+        if enrichment is not None:
+            digest.update(f"\n{entry.url}\0{enrichment.image}\0{enrichment.description}"
+                          .encode('utf-8'))
+            found = True
+    return digest.hexdigest() if found else ''
+
+
+def generate_rss_feed(entries, threshold, host_url=None, self_url=None, category='all'):
     """エントリーからRSSフィードを生成する。
 
     Args:
         entries (list): エントリーのリスト
         threshold (int): ブックマーク数のしきい値
+        host_url (str, optional): チャンネルのリンク先。Noneの場合はリクエストから取得。
+        self_url (str, optional): atom:linkに設定するURL。Noneの場合はリクエストURL。
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+
+    Returns:
+        str: XML形式のRSSフィード
+    """
+    if host_url is None:
+        host_url = request.host_url
+    if self_url is None:
+        self_url = request.url
+    items = ''.join(_render_item(entry) for entry in entries)
+    return assemble_feed(items, threshold, host_url, self_url, category)
+
+
+def assemble_feed(items, threshold, host_url, self_url, category='all', terms=()):
+    """レンダリング済みのアイテムにチャンネル情報を付けてRSSフィードにする。
+
+    Args:
+        items (str): item要素のXML
+        threshold (int): ブックマーク数のしきい値
+        host_url (str): チャンネルのリンク先
+        self_url (str): atom:linkに設定するURL
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+        terms (tuple, optional): 検索語
 
     Returns:
         str: XML形式のRSSフィード
     """
+    return _render_channel_header(threshold, category, host_url, self_url, terms) + items + _FEED_FOOTER
+
+
+def select_entries(snapshot, threshold, terms=(), domains=None):
+    """スナップショットからしきい値・検索語・ドメインの指定に一致するエントリーを抽出する。
+
+    Args:
+        snapshot (Snapshot): ``store`` のスナップショット
+        threshold (int): ブックマーク数のしきい値
+        terms (tuple, optional): ``search.parse_query`` で変換した検索語
+        domains (DomainSpec, optional): ``domains.parse_domain_filter`` で変換した指定
+
+    Returns:
+        list: 一致したエントリーのリスト（ブックマーク数の降順）
+    """
+    entries = snapshot.entries
+    if terms:
+        entries = [entries[position] for position in snapshot.index.search(terms)]
+    entries = filter_entries(entries, threshold)
+    if domains is not None:
+        entries = compile_domain_filter(domains).filter(entries)
+    return entries
+
+
+def render_feed_items(snapshot, category, threshold, terms=(), domains=None):
+    """スナップショットのフィードのアイテムをレンダリングする。
+
+    結果はスナップショットの更新番号・しきい値・検索語・ドメインの指定ごとにキャッシュされ、
+    同じスナップショットに対する2回目以降のリクエストでは抽出もレンダリングも行いません。
+    記事のメタデータ（``enrich``）の取得が進んだ場合は、取得済みのものを含めてレンダリングし直します。
+    共有キャッシュを使用している場合は、スナップショットの内容のハッシュをキーとして
+    他のインスタンスとも共有します（ETagも含むため、どのインスタンスでも同じETagになります）。
+
+    Args:
+        snapshot (Snapshot): ``store`` のスナップショット
+        category (str): カテゴリー
+        threshold (int): ブックマーク数のしきい値
+        terms (tuple, optional): 検索語
+        domains (DomainSpec, optional): ドメインの指定
+
+    Returns:
+        tuple: (item要素のXML, ETag, アイテム数)
+    """
+    key = (category, snapshot.version, enrichment_generation(), threshold, terms, domains)
+    with _feed_cache_lock:
+        cached = _feed_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with span('filter'):
+        selected = select_entries(snapshot, threshold, terms, domains)
+    enrichment = enrichment_digest(selected)
+    shared_key = _shared_feed_key(snapshot, category, enrichment, threshold, terms, domains)
+    rendered = _load_shared_items(shared_key) if shared_key else None
+    if rendered is None:
+        with span('render'):
+            items = ''.join(_render_item(entry) for entry in selected)
+        rendered = (items, compute_feed_etag(selected, threshold, terms, enrichment),
+                    len(selected))
+        if shared_key is not None:
+            cache_set(shared_key, list(rendered), ttl=SHARED_FEED_TTL)
+
+    _cache_put(_feed_cache, key, rendered)
+    return rendered
+
+
+def _cache_put(cache, key, value):
+    """レンダリング結果をキャッシュし、メモリの予算を超えていれば古いものから破棄する。"""
+    with _feed_cache_lock:
+        cache.put(key, value, estimate_size(value))
+    memory_budget.enforce()
+
+
+def _shared_feed_key(snapshot, category, enrichment, threshold, terms, domains):
+    """共有キャッシュのキーを返す（スナップショットを共有していない場合はNone）。
+
+    記事のメタデータは世代ではなく内容の要約（``enrichment_digest``）で区別するため、
+    同じメタデータを取得済みのインスタンスどうしでは同じキーになります。
+    """
+    if not snapshot.digest:
+        return None
+    spec = hashlib.blake2b(repr((enrichment, threshold, terms, domains)).encode('utf-8'),
+                           digest_size=8)
+    return f'feed:{category}:{snapshot.digest}:{spec.hexdigest()}'
+
+
+def _load_shared_items(key):
+    """共有キャッシュからレンダリング済みのアイテムを読み出す。"""
+    value = cache_get(key)
+    if isinstance(value, list) and len(value) == 3:
+        return tuple(value)
+    return None
+
+
+def render_threshold_feeds(entries, thresholds, host_url, self_url_for, category='all'):
+    """複数のしきい値のRSSフィードを1回のレンダリングで生成する。
+
+    エントリーをブックマーク数の降順に1回だけ並べ替え、各アイテムのXMLも1回だけ生成します。
+    しきい値ごとのフィードは、その並びの先頭から何件目までを含めるかが異なるだけです。
+
+    Args:
+        entries (list): エントリーのリスト
+        thresholds (list): ブックマーク数のしきい値のリスト
+        host_url (str): チャンネルのリンク先
+        self_url_for (callable): しきい値を受け取り、atom:linkに設定するURLを返す関数
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+
+    Returns:
+        dict: しきい値 -> (XML形式のRSSフィード, ETag, アイテム数)
+    """
+    ranked = sort_by_count(entries)
+    # bisectで探索できるよう、ブックマーク数を符号反転した昇順の列にする
+    negated_counts = [-entry.count for entry in ranked]
+    sizes = {threshold: bisect.bisect_right(negated_counts, -threshold)
+             for threshold in thresholds}
+    items = [_render_item(entry) for entry in ranked[:max(sizes.values(), default=0)]]
+
+    feeds = {}
+    for threshold, size in sizes.items():
+        header = _render_channel_header(threshold, category, host_url, self_url_for(threshold))
+        xml = header + ''.join(items[:size]) + _FEED_FOOTER
+        feeds[threshold] = (xml, compute_feed_etag(ranked[:size], threshold,
+                                                   enrichment=enrichment_digest(ranked[:size])),
+                            size)
+    return feeds
+
+
+def _render_channel_header(threshold, category, host_url, self_url, terms=()):
+    """しきい値ごとのフィードのRSSの開始タグとチャンネル情報を生成する。"""
+    if category == 'all':
+        title = f'Hatena Hotentry (Threshold: {threshold})'
+        label = ''
+    else:
+        title = f'Hatena Hotentry {category} (Threshold: {threshold})'
+        label = f'「{CATEGORY_LABELS[category]}」'
+    if terms:
+        keyword = html.escape(' '.join(terms))
+        title += f' [{keyword}]'
+        label += f'「{keyword}」を含む'
+    description = f'はてなブックマークの{label}人気エントリー（{threshold}ブックマーク以上）'
+    return _render_channel(title, description, host_url, self_url)
+
+
+def _render_channel(title, description, host_url, self_url):
+    """RSSの開始タグとチャンネル情報を生成する（タイトルと説明はエスケープ済み）。"""
     current_time = format_rfc822_date()
-    host_url = request.host_url.rstrip('/')
+    host_url = host_url.rstrip('/')
     
     # XMLヘッダーとRSS開始タグ
     xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xml += '<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:atom="http://www.w3.org/2005/Atom">\n'
+    xml += '<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:atom="http://www.w3.org/2005/Atom" xmlns:media="http://search.yahoo.com/mrss/">\n'
     xml += '  <channel>\n'
     
     # チャンネル情報
-    xml += f'    <title>Hatena Hotentry (Threshold: {threshold})</title>\n'
+    xml += f'    <title>{title}</title>\n'
     xml += f'    <link>{html.escape(host_url)}</link>\n'
-    xml += f'    <description>はてなブックマークの人気エントリー（{threshold}ブックマーク以上）</description>\n'
+    xml += f'    <description>{description}</description>\n'
     xml += '    <language>ja</language>\n'
     xml += f'    <lastBuildDate>{current_time}</lastBuildDate>\n'
-    xml += f'    <atom:link href="{html.escape(request.url)}" rel="self" type="application/rss+xml"/>\n'
+    xml += f'    <atom:link href="{html.escape(self_url)}" rel="self" type="application/rss+xml"/>\n'
     xml += '    <generator>Hatena Bookmark RSS Generator</generator>\n'
     xml += '    <ttl>5</ttl>\n'  # TTLを5分に設定
+    return xml
+
+
+def _render_item(entry, note=''):
+    """エントリー1件分のitem要素を生成する（エスケープ済みの値と日付は取り込み時に計算済み）。
+
+    記事のメタデータを取得済みであれば、サムネイルを付け、説明がないエントリーには記事の説明を使います。
+    ``note`` はブックマーク数の後ろに付け加えます（エスケープ済みの文字列）。
+    """
+    enrichment = get_enrichment(entry.url)
+    description_html = entry.description_html
+    if enrichment is not None and enrichment.description and not entry.description:
+        description_html = html.escape(enrichment.description)
+    description = f"{description_html}<br/><br/>ブックマーク数: {entry.count}{note}"
+    content = description
+    image_html = None
+    if enrichment is not None and enrichment.image:
+        image_html = html.escape(enrichment.image)
+        content = f'<p><img src="{image_html}" alt=""/></p>{description}'
     
-    # 各エントリー
-    for entry in entries:
-        # エントリーのIDを生成（URLとブックマーク数からハッシュ値を生成）
-        entry_id = f"{entry.get('url', '')}-{entry.get('count', 0)}"
-        
-        # 日付をRFC822形式に変換
-        pub_date = format_rfc822_date(entry.get('date'))
-        
-        # 説明を取得（HTMLエスケープ処理）
-        description = html.escape(entry.get("description", "説明なし"))
-        description += f"<br/><br/>ブックマーク数: {entry.get('count', 0)}"
-        
-        # アイテムを生成
-        xml += '    <item>\n'
-        xml += f'      <title>{html.escape(entry.get("title", "無題"))}</title>\n'
-        xml += f'      <link>{html.escape(entry.get("url", ""))}</link>\n'
-        xml += f'      <guid isPermaLink="false">{html.escape(entry_id)}</guid>\n'
-        xml += f'      <description><![CDATA[{description}]]></description>\n'
-        xml += f'      <pubDate>{pub_date}</pubDate>\n'
-        xml += f'      <content:encoded><![CDATA[{description}]]></content:encoded>\n'
-        xml += '    </item>\n'
-    
-    # 終了タグ
-    xml += '  </channel>\n'
-    xml += '</rss>'
-    
+    # アイテムを生成
+    xml = '    <item>\n'
+    xml += f'      <title>{entry.title_html}</title>\n'
+    xml += f'      <link>{entry.url_html}</link>\n'
+    xml += f'      <guid isPermaLink="false">{entry.guid_html}</guid>\n'
+    xml += f'      <description><![CDATA[{description}]]></description>\n'
+    xml += f'      <pubDate>{entry.pub_date}</pubDate>\n'
+    xml += f'      <content:encoded><![CDATA[{content}]]></content:encoded>\n'
+    if image_html is not None:
+        xml += f'      <media:thumbnail url="{image_html}"/>\n'
+    xml += '    </item>\n'
     return xml
 
 
-def get_hotentry_feed(threshold=100):
+# 終了タグ
+_FEED_FOOTER = '  </channel>\n</rss>'
+
+
+def accepts_gzip(accept_encoding):
+    """Accept-Encodingヘッダーがgzipを受け付けるかどうかを判定する。
+
+    Args:
+        accept_encoding (str): Accept-Encodingヘッダーの値（ない場合はNone）
+
+    Returns:
+        bool: gzip（または ``*``）の品質値が0より大きければTrue
+    """
+    for token in (accept_encoding or '').split(','):
+        name, _, params = token.strip().partition(';')
+        if name.strip().lower() not in ('gzip', '*'):
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+    return False
+
+
+def compress_feed_items(snapshot, category, threshold, terms=(), domains=None):
+    """スナップショットのフィードのアイテムを圧縮する。
+
+    結果は ``render_feed_items`` と同じキーでキャッシュされます。リクエストごとに圧縮するのは
+    チャンネル情報（lastBuildDateとURLを含む）だけで、アイテムは ``gzip_feed`` でそのままつなげます。
+
+    Args:
+        snapshot (Snapshot): ``store`` のスナップショット
+        category (str): カテゴリー
+        threshold (int): ブックマーク数のしきい値
+        terms (tuple, optional): 検索語
+        domains (DomainSpec, optional): ドメインの指定
+
+    Returns:
+        CompressedItems: 圧縮済みのアイテム
+    """
+    key = (category, snapshot.version, enrichment_generation(), threshold, terms, domains)
+    with _feed_cache_lock:
+        cached = _compressed_cache.get(key)
+    if cached is not None:
+        return cached
+
+    items, _, _ = render_feed_items(snapshot, category, threshold, terms, domains)
+    raw = items.encode('utf-8')
+    with span('compress'):
+        compressed = CompressedItems(raw, _deflate_block(raw))
+    _cache_put(_compressed_cache, key, compressed)
+    return compressed
+
+
+def gzip_feed(header, compressed_items):
+    """チャンネル情報と圧縮済みのアイテムからgzip形式のRSSフィードを組み立てる。
+
+    チャンネル情報と終了タグを別に圧縮し、圧縮済みのアイテムとともに1つのdeflateのストリームとして
+    つなげます（各ブロックは前のデータを参照しないため、つなげても正しく伸長できます）。
+
+    Args:
+        header (str): ``_render_channel_header`` で生成したチャンネル情報
+        compressed_items (CompressedItems): ``compress_feed_items`` で圧縮したアイテム
+
+    Returns:
+        bytes: gzip形式のRSSフィード
+    """
+    head = header.encode('utf-8')
+    crc = zlib.crc32(_FEED_FOOTER_BYTES, zlib.crc32(compressed_items.raw, zlib.crc32(head)))
+    length = len(head) + len(compressed_items.raw) + len(_FEED_FOOTER_BYTES)
+    return b''.join((
+        _GZIP_HEADER,
+        _deflate_block(head),
+        compressed_items.data,
+        _FEED_FOOTER_DEFLATED,
+        struct.pack('<II', crc & 0xffffffff, length & 0xffffffff),
+    ))
+
+
+def encode_feed(snapshot, category, threshold, items, host_url, self_url, terms=(), domains=None,
+                compress=False):
+    """レンダリング済みのアイテムにチャンネル情報を付け、レスポンスの本文にする。
+
+    Args:
+        snapshot (Snapshot): アイテムをレンダリングしたスナップショット
+        category (str): カテゴリー
+        threshold (int): ブックマーク数のしきい値
+        items (str): ``render_feed_items`` でレンダリングしたアイテム
+        host_url (str): チャンネルのリンク先
+        self_url (str): atom:linkに設定するURL
+        terms (tuple, optional): 検索語
+        domains (DomainSpec, optional): ドメインの指定
+        compress (bool, optional): gzipで圧縮するかどうか
+
+    Returns:
+        bytes: RSSフィード（``compress`` の場合はgzip形式）
+    """
+    header = _render_channel_header(threshold, category, host_url, self_url, terms)
+    if compress:
+        return gzip_feed(header, compress_feed_items(snapshot, category, threshold, terms, domains))
+    return (header + items + _FEED_FOOTER).encode('utf-8')
+
+
+def _deflate_block(data, final=False):
+    """データを前のデータを参照しないdeflateのブロックに圧縮する。"""
+    compressor = zlib.compressobj(FEED_GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+# gzipのヘッダー（更新日時なし、OS不明）と、圧縮済みの終了タグ（最終ブロック）
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+_FEED_FOOTER_BYTES = _FEED_FOOTER.encode('utf-8')
+_FEED_FOOTER_DEFLATED = _deflate_block(_FEED_FOOTER_BYTES, final=True)
+
+
+def generate_opml(host_url, thresholds):
+    """提供しているフィードの一覧をOPML形式で生成する。
+
+    Args:
+        host_url (str): フィードURLのベース
+        thresholds (list): 一覧に含めるしきい値のリスト
+
+    Returns:
+        str: XML形式のOPML
+    """
+    host_url = host_url.rstrip('/')
+    xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
+    xml += '<opml version="2.0">\n'
+    xml += '  <head>\n'
+    xml += '    <title>はてなブックマーク ホットエントリー RSS</title>\n'
+    xml += f'    <dateCreated>{format_rfc822_date()}</dateCreated>\n'
+    xml += '  </head>\n'
+    xml += '  <body>\n'
+    for category in CATEGORIES:
+        label = html.escape(CATEGORY_LABELS[category])
+        xml += f'    <outline text="{label}" title="{label}">\n'
+        for threshold in thresholds:
+            feed_url = html.escape(f'{host_url}/hotentry/{category}/feed?threshold={threshold}')
+            text = f'{label}（{threshold}ブックマーク以上）'
+            xml += (f'      <outline type="rss" text="{text}" title="{text}" '
+                    f'xmlUrl="{feed_url}" htmlUrl="{html.escape(host_url)}/"/>\n')
+        xml += '    </outline>\n'
+    xml += '  </body>\n'
+    xml += '</opml>'
+    return xml
+
+
+def get_hotentry_feed(threshold=100, category='all', query=None, domains=None):
     """ホットエントリーのRSSフィードを生成する。
 
     Args:
         threshold (int, optional): ブックマーク数のしきい値。デフォルトは100。
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+        query (str, optional): キーワード（タイトルか説明に含むエントリーに絞り込む）
+        domains (DomainSpec, optional): ドメインの指定（``domains.parse_domain_filter`` で変換）
 
     Returns:
         Response: XMLレスポンス
     """
+    terms = parse_query(query)
     try:
-        # 常に最新のデータを取得
-        entries = fetch_hatena_hotentries()
-        
-        # しきい値以上のブックマーク数を持つエントリーをフィルタリング
-        filtered_entries = []
-        
-        for entry in entries:
-            # ブックマーク数を取得
-            bookmark_count = entry.get('count', 0)
+        with start_trace('feed', category=category, threshold=threshold) as trace:
+            # 新しいスナップショットがなければ取得する（同時の取得は1回にまとめられる）
+            # 取得に失敗した場合は、最後に取得できたスナップショットで代替する
+            with span('snapshot'):
+                snapshot, staleness = get_serving_snapshot(category)
             
-            if bookmark_count >= threshold:
-                filtered_entries.append(entry)
-        
-        # RSSフィードを生成
-        rss_feed = generate_rss_feed(filtered_entries, threshold)
-        
-        # XMLレスポンスを返す
-        return Response(rss_feed, mimetype='application/xml')
+            # しきい値・検索語・ドメインで絞り込んだアイテム（スナップショットごとにキャッシュ）
+            items, etag, _ = render_feed_items(snapshot, category, threshold, terms, domains)
+            response = Response(mimetype='application/xml')
+            response.vary.add('Accept-Encoding')
+            response.set_etag(etag, weak=True)
+            response.headers.update(feed_cache_headers([category], [threshold], {category: snapshot}))
+            if staleness is not None:
+                response.headers.update(degraded_headers(staleness))
+
+            # If-None-Matchが一致すれば、チャンネル情報の生成と圧縮をせずに304を返す
+            if request.if_none_match.contains_weak(etag):
+                response.status_code = 304
+            else:
+                compress = accepts_gzip(request.headers.get('Accept-Encoding'))
+                response.set_data(encode_feed(snapshot, category, threshold, items,
+                                              request.host_url, request.url, terms, domains,
+                                              compress))
+                if compress:
+                    response.headers['Content-Encoding'] = 'gzip'
+            timing = server_timing_header(trace)
+            if timing:
+                response.headers['Server-Timing'] = timing
+            return response.make_conditional(request)
     except Exception as e:
         logger.error(f"フィード生成中にエラーが発生しました: {str(e)}")
-        error_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
+        return Response(build_error_feed(e), mimetype='application/xml', status=500)
+
+
+def render_trending_items(ranking, threshold=0):
+    """伸びのランキングのアイテムをレンダリングする。
+
+    結果はランキングの更新番号としきい値ごとにキャッシュされます（ランキングは更新のたびに
+    1回だけ計算されるため、2回目以降のリクエストではレンダリングも行いません）。
+
+    Args:
+        ranking (Ranking): ``trending.TrendTracker.ranking`` のランキング
+        threshold (int, optional): ブックマーク数のしきい値
+
+    Returns:
+        tuple: (item要素のXML, ETag, アイテム数)
+    """
+    key = ('trending', ranking.version, enrichment_generation(), threshold, (), None)
+    with _feed_cache_lock:
+        cached = _feed_cache.get(key)
+    if cached is not None:
+        return cached
+
+    selected = [item for item in ranking.entries if item.entry.count >= threshold]
+    items = ''.join(_render_item(item.entry, f'（1時間あたり+{item.velocity:.0f}）')
+                    for item in selected)
+    selected_entries = [item.entry for item in selected]
+    rendered = (items, compute_feed_etag(selected_entries, f'trending-{threshold}',
+                                         enrichment=enrichment_digest(selected_entries)),
+                len(selected))
+    _cache_put(_feed_cache, key, rendered)
+    return rendered
+
+
+def get_trending_feed(threshold=0):
+    """ブックマーク数の伸びが大きい順のRSSフィードを生成する。
+
+    Args:
+        threshold (int, optional): ブックマーク数のしきい値。デフォルトは0（すべて）。
+
+    Returns:
+        Response: XMLレスポンス
+    """
+    try:
+        with start_trace('trending', threshold=threshold) as trace:
+            # 総合のスナップショットを更新すると、ランキングも計算し直される
+            with span('snapshot'):
+                snapshot, staleness = get_serving_snapshot('all')
+            
+            items, etag, _ = render_trending_items(trend_tracker.ranking(), threshold)
+            header = _render_channel(
+                'Hatena Hotentry Trending',
+                'はてなブックマークの人気エントリー（1時間あたりのブックマーク数の伸びが大きい順）',
+                request.host_url, request.url)
+            
+            response = Response(header + items + _FEED_FOOTER, mimetype='application/xml')
+            response.set_etag(etag, weak=True)
+            response.headers.update(feed_cache_headers(['all'], [], {'all': snapshot}))
+            if staleness is not None:
+                response.headers.update(degraded_headers(staleness))
+            timing = server_timing_header(trace)
+            if timing:
+                response.headers['Server-Timing'] = timing
+            return response.make_conditional(request)
+    except Exception as e:
+        logger.error(f"フィード生成中にエラーが発生しました: {str(e)}")
+        return Response(build_error_feed(e), mimetype='application/xml', status=500)
+
+
+def get_batch_feeds(categories, thresholds):
+    """複数のカテゴリー・しきい値のRSSフィードをまとめて生成する。
+
+    カテゴリーごとにデータを1回だけ取得し、そのカテゴリーの全しきい値を
+    1回のレンダリングで生成します。
+
+    Args:
+        categories (list): カテゴリーのリスト
+        thresholds (list): ブックマーク数のしきい値のリスト
+
+    Returns:
+        Response: JSONレスポンス
+    """
+    host_url = request.host_url.rstrip('/')
+    feeds = []
+    snapshots = {}
+    failed = 0
+    staleness = None
+    for category in categories:
+        try:
+            snapshot, category_staleness = get_serving_snapshot(category)
+            snapshots[category] = snapshot
+            entries = snapshot.entries
+        except Exception as e:
+            logger.error(f"フィード生成中にエラーが発生しました: {str(e)}")
+            failed += 1
+            feeds.extend({'category': category, 'threshold': threshold, 'error': str(e)}
+                         for threshold in thresholds)
+            continue
+
+        if category_staleness is not None:
+            staleness = max(staleness or 0, category_staleness)
+
+        def self_url_for(threshold, category=category):
+            return f'{host_url}/hotentry/{category}/feed?threshold={threshold}'
+
+        rendered = render_threshold_feeds(entries, thresholds, host_url, self_url_for,
+                                          category=category)
+        for threshold in thresholds:
+            xml, etag, size = rendered[threshold]
+            feeds.append({
+                'category': category,
+                'threshold': threshold,
+                'url': self_url_for(threshold),
+                'etag': f'W/"{etag}"',
+                'items': size,
+                'rss': xml,
+            })
+
+    if categories and failed == len(categories):
+        return Response(json.dumps({'feeds': feeds}, ensure_ascii=False),
+                        mimetype='application/json', status=500)
+    headers = feed_cache_headers(categories, thresholds, snapshots)
+    if staleness is not None:
+        headers.update(degraded_headers(staleness))
+    return Response(json.dumps({'feeds': feeds}, ensure_ascii=False),
+                    mimetype='application/json', headers=headers)
+
+
+def build_error_feed(error):
+    """エラー内容を含むRSSフィードを生成する。
+
+    Args:
+        error (Exception): 発生した例外
+
+    Returns:
+        str: XML形式のRSSフィード
+    """
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
 <rss version="2.0">
   <channel>
     <title>エラー</title>
     <description>フィードの生成中にエラーが発生しました</description>
     <item>
       <title>エラーが発生しました</title>
-      <description>{html.escape(str(e))}</description>
+      <description>{html.escape(str(error))}</description>
     </item>
   </channel>
 </rss>"""
-        return Response(error_xml, mimetype='application/xml', status=500)
\ No newline at end of file
@@ -0,0 +1,333 @@
+"""メモリ使用量の計測と予算の管理モジュール。
+
+このモジュールは、ワーカーが保持するスナップショットとキャッシュのメモリ使用量を見積もり、
+``MEMORY_BUDGET_MB`` で設定した予算の範囲に収める機能を提供します。
+
+キャッシュ（レンダリング済みのアイテムなど）は ``SizedLRU`` で保持し、``memory_budget`` に登録します。
+キャッシュに追加するたびに、登録されたキャッシュの合計とスナップショットの見積もりが予算を超えていれば、
+最も大きいキャッシュから古い順に破棄します。上流のレスポンスが一時的に大きくなったり、検索語や
+ドメインの組み合わせが多数リクエストされたりしても、キャッシュがワーカーのメモリを使い切ることはありません。
+
+件数で上限が決まっていて破棄できないもの（名前付きフィードのレンダリング済みのXML、記事のメタデータ）は
+``add_source`` で登録し、スナップショットの更新時にスナップショットと同じく見積もって予算から差し引きます。
+
+``/admin/memory`` （``ADMIN_TOKEN`` を設定した場合のみ）で、tracemallocによる割り当ての多い箇所、
+スナップショットの見積もり、キャッシュごとの使用量を確認できます。tracemallocは
+``MEMORY_TRACE`` を設定した場合に起動時から、またはエンドポイントから開始します。
+"""
+
+import hmac
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from collections import OrderedDict
+
+# スナップショットとキャッシュの合計の予算（MB、0で制限しない）
+MEMORY_BUDGET_MB = float(os.environ.get('MEMORY_BUDGET_MB', '64'))
+
+# 予算のうち、スナップショットが大きくてもキャッシュに残しておく割合
+MIN_CACHE_SHARE = 0.1
+
+# 起動時からtracemallocで割り当てを追跡するかどうかと、記録するスタックの深さ
+MEMORY_TRACE = os.environ.get('MEMORY_TRACE', '').lower() in ('1', 'true', 'yes')
+MEMORY_TRACE_DEPTH = int(os.environ.get('MEMORY_TRACE_DEPTH', '1'))
+
+# 診断用のエンドポイントのトークン（未設定の場合はエンドポイントを公開しない）
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(obj, seen=None):
+    """オブジェクトが参照しているオブジェクトを含めたメモリ使用量を見積もる。
+
+    コンテナ（dict、list、tuple、set）と、``__slots__`` や ``__dict__`` を持つオブジェクトを
+    たどります。同じオブジェクトは1回だけ数えます（インターンされた文字列なども含む）。
+
+    Args:
+        obj: 見積もるオブジェクト
+        seen (set, optional): 数えたオブジェクトのid（再帰用）
+
+    Returns:
+        int: バイト数
+    """
+    if seen is None:
+        seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        else:
+            for cls in type(current).__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if hasattr(current, name):
+                        stack.append(getattr(current, name))
+            if hasattr(current, '__dict__'):
+                stack.append(current.__dict__)
+    return total
+
+
+class SizedLRU:
+    """件数とバイト数を数えるLRUのキャッシュ。
+
+    ロックは呼び出し側が持ちます（``feed`` のキャッシュと同じく、呼び出し側のロックの中で使う）。
+
+    Args:
+        max_entries (int): 保持する最大件数
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.bytes = 0
+        self.evictions = 0
+        # キー -> (値, バイト数)
+        self._items = OrderedDict()
+
+    def get(self, key):
+        """値を返す（ない場合はNone）。"""
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, value, size):
+        """値を追加し、件数の上限を超えたら古いものから破棄する。"""
+        previous = self._items.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self._items[key] = (value, size)
+        self.bytes += size
+        while len(self._items) > self.max_entries:
+            self.evict_oldest()
+
+    def evict_oldest(self):
+        """最も古い値を破棄し、解放したバイト数を返す（空の場合は0）。"""
+        if not self._items:
+            return 0
+        _, (_, size) = self._items.popitem(last=False)
+        self.bytes -= size
+        self.evictions += 1
+        return size
+
+    def clear(self):
+        """すべての値を破棄する。"""
+        self._items.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def __contains__(self, key):
+        return key in self._items
+
+
+class MemoryBudget:
+    """スナップショットとキャッシュの合計を予算の範囲に収める。
+
+    Args:
+        budget_bytes (int): 予算（バイト、0以下で制限しない）
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        # 名前 -> (SizedLRU, そのキャッシュを保護するロック)
+        self._caches = {}
+        # カテゴリー -> スナップショットの見積もり（バイト）
+        self._snapshots = {}
+        # 名前 -> 件数と見積もり（バイト）を返す関数
+        self._sources = {}
+        # 名前 -> (件数, 見積もり)（``measure_sources`` で更新する）
+        self._source_sizes = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def register(self, name, cache, lock):
+        """予算の対象にするキャッシュを登録する。"""
+        self._caches[name] = (cache, lock)
+
+    def add_source(self, name, measure):
+        """破棄はしないが予算から差し引くもの（件数で上限が決まっているもの）を登録する。
+
+        Args:
+            name (str): 名前
+            measure (callable): (件数, 見積もりのバイト数) を返す関数
+        """
+        self._sources[name] = measure
+
+    def measure_sources(self):
+        """登録したものの大きさを見積もり直す。"""
+        sizes = {}
+        for name, measure in list(self._sources.items()):
+            try:
+                sizes[name] = measure()
+            except Exception as e:
+                logger.warning(f"{name}のメモリ使用量を見積もれませんでした: {str(e)}")
+        self._source_sizes = sizes
+
+    def record_snapshot(self, category, size):
+        """スナップショットの見積もりを記録し、予算を超えていればキャッシュを破棄する。"""
+        self._snapshots[category] = size
+        self.enforce()
+
+    def cache_limit(self):
+        """キャッシュに使えるバイト数（制限しない場合はNone）。"""
+        if self.budget_bytes <= 0:
+            return None
+        remaining = (self.budget_bytes - sum(self._snapshots.values())
+                     - sum(size for _, size in self._source_sizes.values()))
+        return max(remaining, int(self.budget_bytes * MIN_CACHE_SHARE))
+
+    def enforce(self):
+        """キャッシュの合計が使えるバイト数を超えていれば、最も大きいキャッシュから古い順に破棄する。
+
+        キャッシュのロックを持ったまま呼び出さないでください（予算のロックの後に取得します）。
+        """
+        limit = self.cache_limit()
+        if limit is None:
+            return
+        with self._lock:
+            caches = list(self._caches.values())
+            if sum(cache.bytes for cache, _ in caches) <= limit:
+                return
+            locks = list(dict.fromkeys(lock for _, lock in caches))
+            for lock in locks:
+                lock.acquire()
+            try:
+                total = sum(cache.bytes for cache, _ in caches)
+                while total > limit:
+                    largest = max(caches, key=lambda item: item[0].bytes)[0]
+                    freed = largest.evict_oldest()
+                    if not freed:
+                        break
+                    total -= freed
+                    self.evictions += 1
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+
+    def status(self):
+        """予算、スナップショットの見積もり、キャッシュごとの使用量を返す。"""
+        return {
+            'budget_bytes': self.budget_bytes,
+            'cache_limit_bytes': self.cache_limit(),
+            'snapshot_bytes': dict(self._snapshots),
+            'sources': {name: {'entries': entries, 'bytes': size}
+                        for name, (entries, size) in self._source_sizes.items()},
+            'caches': {
+                name: {'entries': len(cache), 'bytes': cache.bytes, 'evictions': cache.evictions}
+                for name, (cache, _) in self._caches.items()
+            },
+            'budget_evictions': self.evictions,
+        }
+
+
+# アプリケーション全体で使用するメモリの予算
+memory_budget = MemoryBudget(int(MEMORY_BUDGET_MB * 1024 * 1024))
+
+
+def measure_snapshot(category, entries):
+    """スナップショットが更新されたら、その見積もりを予算に記録する。
+
+    ``store.add_listener`` に登録して使います。``add_source`` で登録したもの（名前付きフィードなど）も
+    ここで見積もり直すため、それらを更新するリスナーより後に登録してください。
+    """
+    from .store import get_snapshot
+
+    snapshot = get_snapshot(category)
+    if snapshot is None:
+        return
+    memory_budget.measure_sources()
+    memory_budget.record_snapshot(category, estimate_size((snapshot.entries, snapshot.index)))
+
+
+def check_admin_token(authorization=None, token=None):
+    """診断用のエンドポイントへのリクエストのトークンを確認する。
+
+    Args:
+        authorization (str, optional): Authorizationヘッダーの値（``Bearer <トークン>``）
+        token (str, optional): X-Admin-Tokenヘッダーの値
+
+    Returns:
+        bool: ``ADMIN_TOKEN`` が設定されていて、トークンが一致する場合はTrue
+    """
+    if not ADMIN_TOKEN:
+        return False
+    if authorization and authorization.startswith('Bearer '):
+        token = authorization[len('Bearer '):].strip()
+    if not token:
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+
+def start_tracing(depth=MEMORY_TRACE_DEPTH):
+    """tracemallocによる割り当ての追跡を開始する（開始済みなら何もしない）。"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(depth)
+        logger.info("tracemallocによる割り当ての追跡を開始しました")
+
+
+def stop_tracing():
+    """tracemallocによる割り当ての追跡を停止する。"""
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.info("tracemallocによる割り当ての追跡を停止しました")
+
+
+def top_allocations(limit=20, group_by='lineno'):
+    """割り当ての多い箇所を返す。
+
+    Args:
+        limit (int, optional): 返す件数
+        group_by (str, optional): ``lineno``、``filename``、``traceback`` のいずれか
+
+    Returns:
+        list: 箇所ごとのサイズと件数（追跡していない場合は空）
+    """
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+    ))
+    return [
+        {
+            'location': [f'{frame.filename}:{frame.lineno}' for frame in stat.traceback],
+            'bytes': stat.size,
+            'count': stat.count,
+        }
+        for stat in snapshot.statistics(group_by)[:limit]
+    ]
+
+
+def memory_report(limit=20, group_by='lineno'):
+    """メモリの使用状況をまとめて返す（``/admin/memory`` で使用）。"""
+    memory_budget.measure_sources()
+    traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+    return {
+        'tracing': tracemalloc.is_tracing(),
+        'traced_bytes': {'current': traced[0], 'peak': traced[1]} if traced else None,
+        'top_allocations': top_allocations(limit, group_by),
+        **memory_budget.status(),
+    }
+
+
+if MEMORY_TRACE:
+    start_tracing()
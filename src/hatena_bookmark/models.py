@@ -0,0 +1,88 @@
+"""エントリーのデータモデルモジュール。
+
+このモジュールは、はてなブックマークから取得したエントリーを表すクラスを提供します。
+エントリーは取り込み時に一度だけ正規化され、フィード生成で使う値（HTMLエスケープ済みの
+文字列やRFC822形式の日付）もその時点で計算しておきます。
+"""
+
+import html
+from urllib.parse import urlsplit
+
+from .utils import format_rfc822_date
+
+
+class Entry:
+    """ホットエントリー1件。
+
+    フィードで使うフィールドだけを ``__slots__`` で保持します。上流のレスポンスに
+    含まれるその他のフィールドは取り込み時に破棄されます。
+
+    Attributes:
+        title (str): 記事タイトル
+        url (str): 記事のURL
+        description (str): 記事の説明
+        count (int): ブックマーク数
+        date (str): 上流から取得した日付文字列
+        title_html (str): HTMLエスケープ済みのタイトル
+        url_html (str): HTMLエスケープ済みのURL
+        description_html (str): HTMLエスケープ済みの説明
+        guid_html (str): HTMLエスケープ済みのguid（URLとブックマーク数から生成）
+        pub_date (str): RFC822形式の日付
+        host (str): URLのホスト名（小文字、ドメインによる絞り込みに使用）
+        path (str): URLのパス
+    """
+
+    __slots__ = ('title', 'url', 'description', 'count', 'date',
+                 'title_html', 'url_html', 'description_html', 'guid_html', 'pub_date',
+                 'host', 'path')
+
+    def __init__(self, title, url, description, count, date):
+        self.title = title
+        self.url = url
+        self.description = description
+        self.count = count
+        self.date = date
+        self.title_html = html.escape(title if title is not None else '無題')
+        self.url_html = html.escape(url)
+        self.description_html = html.escape(description if description is not None else '説明なし')
+        self.guid_html = html.escape(f'{url}-{count}')
+        self.pub_date = format_rfc822_date(date)
+        try:
+            parts = urlsplit(url)
+            self.host = parts.hostname or ''
+            self.path = parts.path or '/'
+        except ValueError:
+            self.host = ''
+            self.path = '/'
+
+    @classmethod
+    def from_dict(cls, data):
+        """辞書（APIのレスポンスの1要素など）からエントリーを生成する。
+
+        Args:
+            data (dict): title, url, description, count, dateを含む辞書
+
+        Returns:
+            Entry: 生成したエントリー
+
+        Raises:
+            ValueError: URLやブックマーク数が不正な場合、文字列であるべきフィールドが文字列でない場合
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f'エントリーが辞書ではありません: {type(data).__name__}')
+        url = data.get('url')
+        if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+            raise ValueError(f'URLが不正です: {url!r}')
+        count = data.get('count') or 0
+        if isinstance(count, bool) or not isinstance(count, (int, str)):
+            raise ValueError(f'ブックマーク数が不正です: {count!r}')
+        count = int(count)
+        if count < 0:
+            raise ValueError(f'ブックマーク数が不正です: {count!r}')
+        for field in ('title', 'description', 'date'):
+            if not isinstance(data.get(field), (str, type(None))):
+                raise ValueError(f'{field}が文字列ではありません: {data.get(field)!r}')
+        return cls(data.get('title'), url, data.get('description'), count, data.get('date'))
+
+    def __repr__(self):
+        return f'Entry(url={self.url!r}, count={self.count!r})'
@@ -0,0 +1,226 @@
+"""フィード更新通知のファンアウト機能モジュール。
+
+このモジュールは、リフレッシャーが新しいホットエントリーを取り込んだときに、
+しきい値ごとのフィードの変化（ETagの変化と、新たにしきい値を超えたエントリー）を
+購読者へ配信する機能を提供します。
+
+購読者はスレッドを持たず、asyncioのイベントループ上で待機します。通知はリフレッシャーの
+スレッドからイベントループごとに1回だけ受け渡されるため、1ワーカーで数千の待機中の
+接続を保持できます。
+"""
+
+import asyncio
+import collections
+import logging
+import threading
+
+from .feed import compute_feed_etag, enrichment_digest, filter_entries
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# 配信待ちイベントの最大保持数（遅い購読者によるメモリ増加を防ぐ）
+MAX_PENDING_EVENTS = 16
+
+
+class FeedEvent:
+    """しきい値ごとのフィード変化を表すイベント。
+
+    Attributes:
+        threshold (int): ブックマーク数のしきい値
+        etag (str): 変化後のフィードのETag
+        entries (list): 変化後のフィードに含まれるエントリー
+        crossed (list): 今回新たにしきい値を超えたエントリー
+    """
+
+    __slots__ = ('threshold', 'etag', 'entries', 'crossed')
+
+    def __init__(self, threshold, etag, entries, crossed):
+        self.threshold = threshold
+        self.etag = etag
+        self.entries = entries
+        self.crossed = crossed
+
+
+class Subscription:
+    """1つの接続に対応する購読。
+
+    イベントループ上でのみ操作されます。リフレッシャーのスレッドからは
+    ``FeedNotifier`` が ``call_soon_threadsafe`` 経由でイベントを受け渡します。
+    """
+
+    __slots__ = ('threshold', 'loop', '_pending', '_waiter')
+
+    def __init__(self, threshold, loop):
+        self.threshold = threshold
+        self.loop = loop
+        self._pending = collections.deque(maxlen=MAX_PENDING_EVENTS)
+        self._waiter = None
+
+    def _deliver(self, event):
+        """イベントを受け取る（イベントループ上で呼ばれる）。"""
+        self._pending.append(event)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self, timeout=None):
+        """次のイベントを待つ。
+
+        Args:
+            timeout (float, optional): 待機する最大秒数。Noneの場合は無期限。
+
+        Returns:
+            FeedEvent: 受け取ったイベント。タイムアウトした場合はNone。
+        """
+        if not self._pending:
+            self._waiter = self.loop.create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self._waiter = None
+        return self._pending.popleft()
+
+
+class FeedNotifier:
+    """しきい値ごとの購読者へフィードの変化を配信するハブ。
+
+    ``publish`` はリフレッシャーのスレッドから呼ばれ、購読されているしきい値ごとに
+    1回だけフィルタリングとETagの計算を行います。購読者数に比例するのは
+    イベントの受け渡しだけです。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # しきい値 -> 購読のset
+        self._subscribers = {}
+        # しきい値 -> (ETag, URLのfrozenset)
+        self._state = {}
+        self._entries = None
+
+    def subscribe(self, threshold, loop=None):
+        """しきい値の変化を購読する。
+
+        Args:
+            threshold (int): ブックマーク数のしきい値
+            loop (asyncio.AbstractEventLoop, optional): 購読者のイベントループ。
+                Noneの場合は実行中のループを使用。
+
+        Returns:
+            Subscription: 購読
+        """
+        subscription = Subscription(threshold, loop or asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(threshold, set()).add(subscription)
+            if threshold not in self._state and self._entries is not None:
+                # 購読開始時点の状態を基準にし、既存のエントリーを「新規」と扱わない
+                self._state[threshold] = _feed_state(self._entries, threshold)[:2]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """購読を解除する。
+
+        Args:
+            subscription (Subscription): 解除する購読
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.threshold)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.threshold]
+
+    def subscriber_count(self):
+        """現在の購読者数を返す。
+
+        Returns:
+            int: 購読者数
+        """
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def current(self, threshold):
+        """しきい値に対する最新のフィード状態を返す。
+
+        Args:
+            threshold (int): ブックマーク数のしきい値
+
+        Returns:
+            tuple: (ETag, エントリーのリスト)。まだデータがない場合は(None, None)。
+        """
+        with self._lock:
+            entries = self._entries
+        if entries is None:
+            return None, None
+        filtered = filter_entries(entries, threshold)
+        return compute_feed_etag(filtered, threshold,
+                                 enrichment=enrichment_digest(filtered)), filtered
+
+    def publish(self, entries):
+        """新しいエントリーを取り込み、変化したしきい値の購読者へ通知する。
+
+        Args:
+            entries (list): 最新のエントリーのリスト
+
+        Returns:
+            int: 通知した購読者数
+        """
+        events = []
+        with self._lock:
+            self._entries = entries
+            # 購読者がいなくなったしきい値の状態は破棄する
+            for threshold in list(self._state):
+                if threshold not in self._subscribers:
+                    del self._state[threshold]
+            for threshold, subscribers in self._subscribers.items():
+                etag, urls, filtered = _feed_state(entries, threshold)
+                previous = self._state.get(threshold)
+                self._state[threshold] = (etag, urls)
+                if previous is not None and previous[0] == etag:
+                    continue
+                previous_urls = previous[1] if previous is not None else frozenset()
+                crossed = [entry for entry in filtered
+                           if entry.url not in previous_urls]
+                events.append((FeedEvent(threshold, etag, filtered, crossed),
+                               list(subscribers)))
+
+        notified = 0
+        for event, subscribers in events:
+            # イベントループごとにまとめて受け渡す
+            by_loop = {}
+            for subscription in subscribers:
+                by_loop.setdefault(subscription.loop, []).append(subscription)
+            for loop, loop_subscribers in by_loop.items():
+                try:
+                    loop.call_soon_threadsafe(_deliver_all, loop_subscribers, event)
+                except RuntimeError:
+                    # ループが既に閉じられている
+                    continue
+                notified += len(loop_subscribers)
+
+        if notified:
+            logger.info(f"{notified}件の購読者にフィードの更新を通知しました")
+        return notified
+
+
+def _feed_state(entries, threshold):
+    """しきい値に対するフィードの状態を計算する。
+
+    Returns:
+        tuple: (ETag, URLのfrozenset, フィルタリング済みエントリーのリスト)
+    """
+    filtered = filter_entries(entries, threshold)
+    urls = frozenset(entry.url for entry in filtered)
+    etag = compute_feed_etag(filtered, threshold, enrichment=enrichment_digest(filtered))
+    return etag, urls, filtered
+
+
+def _deliver_all(subscriptions, event):
+    """イベントループ上で複数の購読にイベントを受け渡す。"""
+    for subscription in subscriptions:
+        subscription._deliver(event)
+
+
+# プロセス全体で共有する通知ハブ
+notifier = FeedNotifier()
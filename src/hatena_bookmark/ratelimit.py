@@ -0,0 +1,200 @@
+"""クライアントごとのリクエスト数の制限モジュール。
+
+このモジュールは、フィードのエンドポイントへのリクエストをクライアント（IPアドレス、または
+User-Agentとの組み合わせ）ごとにトークンバケットで制限します。短い間隔でフィードを取得し続ける
+クライアントがワーカーを占有し、他のクライアント（IFTTTなど）が待たされることを防ぎます。
+
+条件付きリクエスト（``If-None-Match`` / ``If-Modified-Since`` 付き）は、304で済めば処理が
+軽いため、より緩い別のバケットで数えます。304にならなかった場合は、通常のバケットからも差し引きます
+（一致しないETagを送り続けて通常のバケットが負になったクライアントは、条件付きリクエストも制限します）。
+
+バケットの表はLRUで ``RATE_LIMIT_MAX_CLIENTS`` 件までに制限し、あふれたクライアントのバケットは
+破棄します（破棄されたクライアントは満杯のバケットからやり直します）。
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 通常のリクエストの1秒あたりの補充量と、バケットの容量（0以下で制限しない）
+RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', '1.0'))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', '30'))
+
+# 条件付きリクエストの1秒あたりの補充量と、バケットの容量
+RATE_LIMIT_CONDITIONAL_RATE = float(os.environ.get('RATE_LIMIT_CONDITIONAL_RATE', '4.0'))
+RATE_LIMIT_CONDITIONAL_BURST = float(os.environ.get('RATE_LIMIT_CONDITIONAL_BURST', '60'))
+
+# クライアントを識別する方法（ip: IPアドレス、ip+ua: IPアドレスとUser-Agentの組み合わせ）
+RATE_LIMIT_KEY = os.environ.get('RATE_LIMIT_KEY', 'ip')
+
+# クライアントとの間にある信頼できるリバースプロキシの数（X-Forwarded-Forの右から何番目を使うか）。
+# 0（デフォルト）ではX-Forwarded-Forを使わず、接続元のアドレスで識別する。プロキシがないのに設定すると、
+# クライアントがヘッダーを書き換えるだけで制限を逃れられるため、Renderなどの背後で動かす場合だけ設定する
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+
+# バケットを保持するクライアントの最大数
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', '10000'))
+
+
+def client_key(remote_addr, forwarded_for=None, user_agent=None, kind=RATE_LIMIT_KEY,
+               trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES):
+    """リクエストからクライアントを識別するキーを作る。
+
+    リバースプロキシ（Renderなど）の背後で動かす場合は、``X-Forwarded-For`` の右から
+    ``trusted_proxies`` 番目のアドレス（信頼できるプロキシが追加したもの）を使います。
+    それより左はクライアントが自由に設定できるため使いません（werkzeugの ``ProxyFix`` と同じ）。
+
+    Args:
+        remote_addr (str): 接続元のアドレス
+        forwarded_for (str, optional): X-Forwarded-Forヘッダーの値
+        user_agent (str, optional): User-Agentヘッダーの値
+        kind (str, optional): ``ip`` または ``ip+ua``
+        trusted_proxies (int, optional): 信頼できるリバースプロキシの数（0でヘッダーを使わない）
+
+    Returns:
+        str: クライアントのキー
+    """
+    address = remote_addr or ''
+    if forwarded_for and trusted_proxies > 0:
+        hops = forwarded_for.split(',')
+        if len(hops) >= trusted_proxies:
+            address = hops[-trusted_proxies].strip() or address
+    if kind == 'ip+ua':
+        return f'{address} {user_agent or ""}'
+    return address
+
+
+class TokenBucketLimiter:
+    """クライアントごとのトークンバケット。
+
+    Args:
+        rate (float): 1秒あたりに補充するトークン数（0以下で制限しない）
+        burst (float): バケットの容量
+        max_clients (int, optional): バケットを保持するクライアントの最大数
+        clock (callable, optional): 現在時刻を返す関数（テスト用）
+    """
+
+    def __init__(self, rate, burst, max_clients=RATE_LIMIT_MAX_CLIENTS, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        self._clock = clock
+        # キー -> [トークン数, 最後に補充した時刻]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'allowed': 0, 'limited': 0, 'evicted': 0}
+
+    @property
+    def enabled(self):
+        """制限するかどうか（補充量が0以下なら制限しない）。"""
+        return self.rate > 0
+
+    def acquire(self, key, cost=1.0):
+        """トークンを消費する。
+
+        Args:
+            key (str): クライアントのキー
+            cost (float, optional): 消費するトークン数
+
+        Returns:
+            float: 許可した場合は0。制限した場合は、再試行できるまでの秒数。
+        """
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            bucket = self._refill(key)
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                self._stats['allowed'] += 1
+                return 0.0
+            self._stats['limited'] += 1
+            return (cost - bucket[0]) / self.rate
+
+    def debt(self, key):
+        """トークンが負の場合に、0に戻るまでの秒数を返す（負でなければ0）。トークンは消費しません。"""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            bucket = self._refill(key)
+            if bucket[0] >= 0:
+                return 0.0
+            self._stats['limited'] += 1
+            return -bucket[0] / self.rate
+
+    def charge(self, key, cost=1.0):
+        """トークンを後から差し引く（足りなければ負になり、次のリクエストが待たされる）。"""
+        if not self.enabled:
+            return
+        with self._lock:
+            bucket = self._refill(key)
+            bucket[0] = max(bucket[0] - cost, -self.burst)
+
+    def _refill(self, key):
+        now = self._clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+                self._stats['evicted'] += 1
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def status(self):
+        """設定と、許可・制限・破棄した回数を返す。"""
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'clients': len(self._buckets),
+                **self._stats,
+            }
+
+
+# 通常のリクエストと条件付きリクエストのバケット
+feed_limiter = TokenBucketLimiter(RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+conditional_limiter = TokenBucketLimiter(RATE_LIMIT_CONDITIONAL_RATE, RATE_LIMIT_CONDITIONAL_BURST)
+
+
+def check_request(key, conditional):
+    """リクエストを処理してよいかを判定する。
+
+    Args:
+        key (str): ``client_key`` で作ったキー
+        conditional (bool): 条件付きリクエストかどうか
+
+    Returns:
+        int: 許可した場合は0。制限した場合は、Retry-Afterに設定する秒数（1以上）。
+    """
+    if conditional:
+        # 304にならない条件付きリクエストで通常のバケットが負になっていれば、条件付きでも制限する
+        wait = feed_limiter.debt(key) or conditional_limiter.acquire(key)
+    else:
+        wait = feed_limiter.acquire(key)
+    if not wait:
+        return 0
+    return max(1, math.ceil(wait))
+
+
+def too_many_requests_headers(retry_after):
+    """429のレスポンスに付けるヘッダーを返す（CDNにキャッシュさせない）。"""
+    return {'Retry-After': str(retry_after), 'Cache-Control': 'no-store'}
+
+
+def charge_full_response(key):
+    """条件付きリクエストが304にならなかったとき、通常のバケットからも差し引く。"""
+    feed_limiter.charge(key)
+
+
+def rate_limit_status():
+    """リクエスト数の制限の状況を返す。"""
+    return {
+        'key': RATE_LIMIT_KEY,
+        'full': feed_limiter.status(),
+        'conditional': conditional_limiter.status(),
+    }
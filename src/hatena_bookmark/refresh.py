@@ -0,0 +1,201 @@
+"""データ更新間隔の調整モジュール。
+
+このモジュールは、スケジューラーがホットエントリーを取得する間隔を、直近の更新での
+エントリーの入れ替わり（チャーン）とフィードへのリクエスト数（需要）から決定します。
+変化が大きくリクエストが多いときは間隔を短くし、夜間や変化がないときは長くします。
+決定した間隔にはジッターを加え、設定した最小・最大の範囲に収めます。
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+# 間隔の基準値と範囲（秒）
+REFRESH_BASE_INTERVAL = int(os.environ.get('REFRESH_BASE_INTERVAL', '300'))
+REFRESH_MIN_INTERVAL = int(os.environ.get('REFRESH_MIN_INTERVAL', '60'))
+REFRESH_MAX_INTERVAL = int(os.environ.get('REFRESH_MAX_INTERVAL', '1200'))
+
+# 間隔に加えるジッターの割合（0.1なら±10%）
+REFRESH_JITTER = float(os.environ.get('REFRESH_JITTER', '0.1'))
+
+# 夜間とみなす時間帯（日本時間、開始時刻を含み終了時刻を含まない）
+NIGHT_HOURS = os.environ.get('REFRESH_NIGHT_HOURS', '1-6')
+
+# チャーンが多いとみなす割合と、需要が多いとみなす1分あたりのリクエスト数
+HIGH_CHURN = 0.2
+HIGH_DEMAND = 30
+
+# 平均を取る直近の更新回数
+CHURN_WINDOW = 3
+
+JST = timezone(timedelta(hours=9), 'JST')
+
+
+def parse_hours(value):
+    """'1-6' 形式の時間帯を (開始, 終了) に変換する。
+
+    Args:
+        value (str): 時間帯の文字列
+
+    Returns:
+        tuple: (開始時刻, 終了時刻)。解析できない場合は (0, 0)（夜間なし）。
+    """
+    try:
+        start, end = (int(part) % 24 for part in value.split('-'))
+    except (AttributeError, ValueError):
+        return 0, 0
+    return start, end
+
+
+def is_night(now, hours):
+    """日本時間で夜間の時間帯かどうかを判定する。
+
+    Args:
+        now (datetime): タイムゾーン付きの現在時刻
+        hours (tuple): (開始時刻, 終了時刻)
+
+    Returns:
+        bool: 夜間であればTrue
+    """
+    start, end = hours
+    hour = now.astimezone(JST).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def compute_churn(previous_urls, entries):
+    """前回のエントリーと比べて入れ替わったエントリーの割合を計算する。
+
+    Args:
+        previous_urls (set): 前回のエントリーのURLの集合
+        entries (list): 今回のエントリーのリスト
+
+    Returns:
+        float: 0.0（変化なし）から1.0（すべて入れ替わり）までの割合
+    """
+    urls = {entry.url for entry in entries}
+    union = previous_urls | urls
+    if not union:
+        return 0.0
+    return len(previous_urls ^ urls) / len(union)
+
+
+class AdaptiveRefreshPolicy:
+    """チャーンと需要から次の更新までの間隔を決める。
+
+    ``observe`` は更新のたびに、``record_request`` はフィードのリクエストのたびに呼ばれ、
+    ``next_interval`` はスケジューラーのジョブの最後に呼ばれます。
+    """
+
+    def __init__(self, base=REFRESH_BASE_INTERVAL, minimum=REFRESH_MIN_INTERVAL,
+                 maximum=REFRESH_MAX_INTERVAL, jitter=REFRESH_JITTER,
+                 night_hours=NIGHT_HOURS, rng=None):
+        self.base = base
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.jitter = jitter
+        self.night_hours = parse_hours(night_hours)
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._previous_urls = None
+        self._churn = deque(maxlen=CHURN_WINDOW)
+        self._requests = 0
+        self._window_start = time.monotonic()
+        self._decision = None
+
+    def observe(self, category, entries):
+        """更新されたスナップショットからチャーンを記録する（総合のみ）。"""
+        if category != 'all':
+            return
+        with self._lock:
+            if self._previous_urls is not None:
+                self._churn.append(compute_churn(self._previous_urls, entries))
+            self._previous_urls = {entry.url for entry in entries}
+
+    def record_request(self):
+        """フィードへのリクエストを1件記録する。"""
+        # 厳密さは不要なため、ロックを取らずに数える
+        self._requests += 1
+
+    def next_interval(self, now=None):
+        """次の更新までの間隔を決める。
+
+        前回の決定からのリクエスト数を需要として使い、計測をリセットします。
+
+        Args:
+            now (datetime, optional): 現在時刻（テスト用）
+
+        Returns:
+            float: 次の更新までの秒数
+        """
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            elapsed = max(time.monotonic() - self._window_start, 1.0)
+            demand = self._requests * 60 / elapsed
+            self._requests = 0
+            self._window_start = time.monotonic()
+            churn = sum(self._churn) / len(self._churn) if self._churn else None
+
+            interval = float(self.base)
+            reasons = []
+            if churn is not None and churn >= HIGH_CHURN:
+                interval /= 2
+                reasons.append('high churn')
+            elif churn == 0 and len(self._churn) == self._churn.maxlen:
+                interval *= 2
+                reasons.append('no changes')
+            if demand >= HIGH_DEMAND:
+                interval /= 2
+                reasons.append('high demand')
+            elif demand == 0:
+                interval *= 2
+                reasons.append('no demand')
+            if is_night(now, self.night_hours):
+                interval *= 2
+                reasons.append('night')
+            if not reasons:
+                reasons.append('base')
+
+            interval = self._clamp(interval)
+            if self.jitter:
+                interval = self._clamp(interval * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+
+            self._decision = {
+                'interval': round(interval, 1),
+                'reasons': reasons,
+                'churn': round(churn, 3) if churn is not None else None,
+                'demand_per_minute': round(demand, 1),
+                'decided_at': now.isoformat(timespec='seconds'),
+            }
+            return interval
+
+    def current_interval(self):
+        """直近に決めた更新間隔（未決定なら基準値）を返す。"""
+        decision = self._decision
+        return decision['interval'] if decision else self.base
+
+    def status(self):
+        """直近の決定と設定を返す。
+
+        Returns:
+            dict: 直近の決定（未決定ならNone）と、基準値・範囲・ジッターの設定
+        """
+        with self._lock:
+            return {
+                'decision': dict(self._decision) if self._decision else None,
+                'base_interval': self.base,
+                'min_interval': self.minimum,
+                'max_interval': self.maximum,
+                'jitter': self.jitter,
+            }
+
+    def _clamp(self, interval):
+        return min(max(interval, self.minimum), self.maximum)
+
+
+# アプリケーション全体で共有する更新間隔の調整
+refresh_policy = AdaptiveRefreshPolicy()
@@ -0,0 +1,254 @@
+"""上流のレスポンスの記録・再生モジュール。
+
+このモジュールは、はてなブックマークから受け取ったレスポンス（ステータス、ヘッダー、本文、
+応答までの時間）をアーカイブに記録し、後から同じ順序で再生する機能を提供します。
+``UPSTREAM_MODE`` を ``record`` にすると記録し、``replay`` にすると上流に接続せずに再生します。
+再生時は ``UPSTREAM_REPLAY_SPEED`` で応答の遅延を再現できます（1.0で記録どおり、2.0で2倍速、
+0で遅延なし）。
+
+アーカイブは1レスポンスを1行のJSONとし、行ごとにgzipのメンバーとして追記したファイルです
+（``zcat`` でそのまま読めます）。先頭の行はフォーマットのバージョンを示すヘッダーです。
+"""
+
+import asyncio
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# アーカイブのフォーマットの識別子とバージョン
+ARCHIVE_FORMAT = 'hatena-upstream-archive'
+ARCHIVE_VERSION = 1
+
+# 記録しないヘッダー（本文は展開済みで保存するため、転送時のエンコーディングは意味を持たない）
+_SKIPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+def request_key(method, url):
+    """レスポンスを対応付けるキー（メソッド、パス、クエリ）を返す。
+
+    ホスト名は含めないため、本番に向けて記録したアーカイブをスタブのURLのまま再生できます。
+    """
+    parts = urlsplit(str(url))
+    return f'{method.upper()} {parts.path}' + (f'?{parts.query}' if parts.query else '')
+
+
+class UpstreamArchive:
+    """レスポンスを記録するアーカイブのファイル。
+
+    Args:
+        path (str): アーカイブのファイルのパス
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, method, url, status, headers, body, elapsed):
+        """レスポンスを1件追記する（ファイルがなければヘッダーから書き始める）。
+
+        Args:
+            method (str): リクエストのメソッド
+            url (str): リクエストのURL
+            status (int): ステータスコード
+            headers (dict): レスポンスヘッダー
+            body (bytes): 展開済みの本文
+            elapsed (float): リクエストの送信から応答までの秒数
+        """
+        record = {
+            'key': request_key(method, url),
+            'url': str(url),
+            'status': status,
+            'headers': {name: value for name, value in headers.items()
+                        if name.lower() not in _SKIPPED_HEADERS},
+            'elapsed': round(elapsed, 4),
+            'recorded_at': round(time.time(), 3),
+            'body': base64.b64encode(body).decode('ascii'),
+        }
+        with self._lock:
+            lines = []
+            if not os.path.exists(self.path):
+                lines.append({'format': ARCHIVE_FORMAT, 'version': ARCHIVE_VERSION})
+            lines.append(record)
+            payload = ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines)
+            with gzip.open(self.path, 'ab') as f:
+                f.write(payload.encode('utf-8'))
+
+    def load(self):
+        """記録したレスポンスを記録順に読み込む。
+
+        Returns:
+            list: レスポンスの辞書のリスト（本文はbytesに戻す）
+
+        Raises:
+            ValueError: アーカイブのフォーマットやバージョンが異なる場合
+        """
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        if not lines or lines[0].get('format') != ARCHIVE_FORMAT:
+            raise ValueError(f'アーカイブではありません: {self.path}')
+        if lines[0].get('version') != ARCHIVE_VERSION:
+            raise ValueError(f'アーカイブのバージョンが異なります: {lines[0].get("version")}')
+        for record in lines[1:]:
+            record['body'] = base64.b64decode(record['body'])
+        return lines[1:]
+
+
+class Replayer:
+    """記録したレスポンスを決まった順序で返す。
+
+    キーごとに記録順に返し、最後まで返したら最初に戻ります。同期・非同期のどちらの
+    クライアントから呼ばれても、同じキーへのリクエストは同じ順序でレスポンスを受け取ります。
+
+    Args:
+        records (list): ``UpstreamArchive.load`` で読み込んだレスポンス
+        speed (float, optional): 再生の速さ（1.0で記録どおりの遅延、0で遅延なし）
+    """
+
+    def __init__(self, records, speed=0.0):
+        self.speed = speed
+        self._records = {}
+        for record in records:
+            self._records.setdefault(record['key'], []).append(record)
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def next_record(self, method, url):
+        """リクエストに対応する次のレスポンスを返す（記録がなければNone）。"""
+        key = request_key(method, url)
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                return None
+            position = self._positions.get(key, 0)
+            self._positions[key] = (position + 1) % len(records)
+            return records[position]
+
+    def delay(self, record):
+        """レスポンスを返すまでに待つ秒数。"""
+        return record['elapsed'] / self.speed if self.speed > 0 else 0.0
+
+
+class RecordingAdapter(HTTPAdapter):
+    """requestsのセッションに取り付けて、受け取ったレスポンスをアーカイブに記録する。"""
+
+    def __init__(self, archive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        body = response.content
+        self.archive.append(request.method, request.url, response.status_code,
+                            response.headers, body, time.perf_counter() - start)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """requestsのセッションに取り付けて、上流の代わりに記録したレスポンスを返す。"""
+
+    def __init__(self, replayer):
+        super().__init__()
+        self.replayer = replayer
+
+    def send(self, request, **kwargs):
+        record = self.replayer.next_record(request.method, request.url)
+        if record is None:
+            raise requests.ConnectionError(
+                f'アーカイブに記録がありません: {request_key(request.method, request.url)}',
+                request=request)
+        time.sleep(self.replayer.delay(record))
+        response = requests.Response()
+        response.status_code = record['status']
+        response.headers = CaseInsensitiveDict(record['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = record['body']
+        response.url = request.url
+        response.request = request
+        response.reason = 'Replayed'
+        response.elapsed = timedelta(seconds=record['elapsed'])
+        return response
+
+    def close(self):
+        pass
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """httpxのクライアントに取り付けて、受け取ったレスポンスをアーカイブに記録する。"""
+
+    def __init__(self, archive, transport=None):
+        self.archive = archive
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        start = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        body = await response.aread()
+        elapsed = time.perf_counter() - start
+        self.archive.append(request.method, request.url, response.status_code,
+                            response.headers, body, elapsed)
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name.lower() not in _SKIPPED_HEADERS]
+        return httpx.Response(response.status_code, headers=headers, content=body,
+                              request=request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """httpxのクライアントに取り付けて、上流の代わりに記録したレスポンスを返す。"""
+
+    def __init__(self, replayer):
+        self.replayer = replayer
+
+    async def handle_async_request(self, request):
+        record = self.replayer.next_record(request.method, request.url)
+        if record is None:
+            raise httpx.ConnectError(
+                f'アーカイブに記録がありません: {request_key(request.method, request.url)}',
+                request=request)
+        await asyncio.sleep(self.replayer.delay(record))
+        return httpx.Response(record['status'], headers=record['headers'],
+                              content=record['body'], request=request)
+
+
+def install(session, mode, archive_path, speed=0.0):
+    """セッションに記録・再生のアダプターを取り付け、非同期クライアント用のトランスポートを返す。
+
+    Args:
+        session (requests.Session): 上流への同期リクエストに使うセッション
+        mode (str): ``record`` または ``replay``
+        archive_path (str): アーカイブのファイルのパス
+        speed (float, optional): 再生の速さ
+
+    Returns:
+        httpx.AsyncBaseTransport: 非同期クライアントに渡すトランスポート
+
+    Raises:
+        ValueError: モードが不明な場合、アーカイブを読み込めない場合
+    """
+    archive = UpstreamArchive(archive_path)
+    if mode == 'record':
+        adapter = RecordingAdapter(archive)
+        transport = RecordingTransport(archive)
+    elif mode == 'replay':
+        replayer = Replayer(archive.load(), speed)
+        adapter = ReplayAdapter(replayer)
+        transport = ReplayTransport(replayer)
+    else:
+        raise ValueError(f'不明なモードです: {mode}')
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return transport
@@ -0,0 +1,125 @@
+"""スナップショット内のキーワード検索モジュール。
+
+このモジュールは、エントリーのタイトルと説明に対する文字bi-gramの転置インデックスを提供します。
+日本語の文章は単語に区切られていないため、単語ではなく隣り合う2文字（1文字のクエリ用に1文字も）を
+索引語とします。検索はクエリの索引語のポスティングリストの積集合で候補を絞り込み、最後に
+候補の本文にクエリが実際に含まれているかを確認します（bi-gramがすべて含まれていても、
+連続して現れるとは限らないため）。
+
+インデックスはスナップショットの更新時に作り直しますが、タイトルと説明が変わっていない
+エントリーは前回のインデックスで計算した正規化済みの本文と索引語を再利用します。
+"""
+
+import unicodedata
+
+# クエリの最大文字数（超えた部分は無視する）
+MAX_QUERY_LENGTH = 100
+
+
+def normalize(text):
+    """検索用に文字列を正規化する（全角英数字を半角に、大文字を小文字に揃える）。
+
+    Args:
+        text (str): 文字列
+
+    Returns:
+        str: 正規化した文字列
+    """
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def ngrams(text):
+    """文字列の索引語（1文字と、隣り合う2文字）の集合を返す。"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def parse_query(value):
+    """クエリパラメータを検索語のタプルに変換する。
+
+    空白で区切られた語はすべて含むエントリーを検索します（AND検索）。
+
+    Args:
+        value (str): クエリパラメータの値
+
+    Returns:
+        tuple: 正規化した検索語のタプル。検索しない場合は空のタプル。
+    """
+    if not value:
+        return ()
+    terms = normalize(value[:MAX_QUERY_LENGTH]).split()
+    # 重複を除き、順序を揃えてキャッシュのキーに使えるようにする
+    return tuple(sorted(set(terms)))
+
+
+class SearchIndex:
+    """エントリーのタイトルと説明に対する転置インデックス。
+
+    インデックスは作成後に変更しないため、複数のスレッドから同時に検索できます。
+    """
+
+    __slots__ = ('texts', 'postings', '_documents')
+
+    def __init__(self, texts, postings, documents):
+        # エントリーの位置 -> 正規化済みの本文
+        self.texts = texts
+        # 索引語 -> その索引語を含むエントリーの位置の集合
+        self.postings = postings
+        # (URL, タイトル, 説明) -> (正規化済みの本文, 索引語の集合)（次回の作成で再利用）
+        self._documents = documents
+
+    @classmethod
+    def build(cls, entries, previous=None):
+        """エントリーのリストからインデックスを作成する。
+
+        Args:
+            entries (list): エントリーのリスト
+            previous (SearchIndex, optional): 前回のスナップショットのインデックス
+
+        Returns:
+            SearchIndex: 作成したインデックス
+        """
+        reusable = previous._documents if previous is not None else {}
+        documents = {}
+        texts = []
+        postings = {}
+        for position, entry in enumerate(entries):
+            key = (entry.url, entry.title, entry.description)
+            document = reusable.get(key) or documents.get(key)
+            if document is None:
+                text = normalize(f'{entry.title or ""}\n{entry.description or ""}')
+                document = (text, frozenset(ngrams(text)))
+            documents[key] = document
+            texts.append(document[0])
+            for gram in document[1]:
+                postings.setdefault(gram, set()).add(position)
+        return cls(texts, postings, documents)
+
+    def search(self, terms):
+        """すべての検索語を含むエントリーの位置を返す。
+
+        Args:
+            terms (tuple): ``parse_query`` で変換した検索語
+
+        Returns:
+            list: エントリーの位置の昇順のリスト
+        """
+        grams = set()
+        for term in terms:
+            grams.update(term[i:i + 2] for i in range(len(term) - 1))
+            if len(term) == 1:
+                grams.add(term)
+
+        # ポスティングリストの短い順に積集合を取る
+        candidates = None
+        for posting in sorted((self.postings.get(gram, ()) for gram in grams), key=len):
+            candidates = set(posting) if candidates is None else candidates & posting
+            if not candidates:
+                return []
+        if candidates is None:
+            return []
+
+        # 索引語がすべて含まれていても連続しているとは限らないため、本文で確認する
+        return sorted(position for position in candidates
+                      if all(term in self.texts[position] for term in terms))
@@ -0,0 +1,456 @@
+"""ホットエントリーのスナップショット保持モジュール。
+
+このモジュールは、カテゴリーごとに取得したホットエントリー（スナップショット）を保持し、
+リクエストの処理とスケジューラーの双方から利用できるようにします。
+
+スナップショットが古い、またはまだ存在しない場合の取得はシングルフライトで集約されるため、
+再起動直後に多数のリクエストが同時に届いても、はてなブックマークへのリクエストは
+カテゴリーごとに1回だけになります。
+
+スナップショットは公開後に変更しない ``Snapshot`` で、カテゴリーからの対応表ごと差し替えて公開します。
+読み出し側はロックを取らず、エントリーと取得日時が食い違ったスナップショットを見ることもありません。
+
+共有キャッシュ（``cache``）を使用している場合、取得したスナップショットは他のインスタンスとも
+共有され、他のインスタンスが取得したばかりのスナップショットがあれば取得せずにそれを使います。
+
+スナップショットの更新を受け取るリスナーのうち、時間のかかるもの（事前レンダリングやメモリ使用量の
+見積もりなど）は ``background=True`` で登録し、専用のスレッドで登録順に呼び出します。取得を
+待っているリクエストは、それらの完了を待たずにスナップショットを受け取れます。
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import MappingProxyType
+
+from .api import fetch_hatena_hotentries, fetch_hatena_hotentries_async
+from .cache import cache_get, cache_set, is_shared
+from .coalesce import SingleFlight
+from .models import Entry
+from .refresh import refresh_policy
+from .search import SearchIndex
+
+# スナップショットをそのまま使える最大経過秒数（総合は、スケジューラーの更新間隔がこれより長ければその間隔）
+SNAPSHOT_MAX_AGE = int(os.environ.get('SNAPSHOT_MAX_AGE', '300'))
+
+# 取得に失敗したとき、最後に取得できたスナップショットで代替してよい最大経過秒数
+DEGRADED_MAX_STALENESS = int(os.environ.get('DEGRADED_MAX_STALENESS', '21600'))
+
+# 取得に失敗した後、次に取得を試みるまでの秒数（その間は代替のスナップショットを返す）
+DEGRADED_RETRY_INTERVAL = int(os.environ.get('DEGRADED_RETRY_INTERVAL', '30'))
+
+# 公開後に変更しないスナップショット
+#   entries: エントリーのタプル, index: キーワード検索用のインデックス, version: 更新番号,
+#   last_update: 取得日時, digest: 内容のハッシュ（インスタンス間で共有するキャッシュのキーに使う。
+#   共有しない場合はNone）
+Snapshot = namedtuple('Snapshot', ['entries', 'index', 'version', 'last_update', 'digest'])
+
+# カテゴリー -> Snapshot の読み取り専用の対応表。更新時は対応表ごと差し替える
+_snapshots = MappingProxyType({})
+# 差し替えを直列化する（書き込み側だけが使う）
+_publish_lock = threading.Lock()
+
+# 取得失敗の記録と代替の回数を保護する
+_degraded_lock = threading.Lock()
+
+# スナップショットの更新番号（カテゴリーをまたいでプロセス内で一意）
+_versions = itertools.count(1)
+
+# はてなブックマークからの取得を集約する
+upstream_flight = SingleFlight('upstream')
+
+# カテゴリー -> (直近の取得失敗の時刻（time.monotonic）, エラーメッセージ)
+_failures = {}
+
+# 代替のスナップショットを返した回数と、代替できずにエラーにした回数
+_degraded_counts = {'served': {}, 'gave_up': {}}
+
+# スナップショット更新時に呼び出す関数（category, entries を受け取る）
+_listeners = []
+# スナップショット更新時にバックグラウンドで呼び出す関数と、それを登録順に呼び出すスレッド
+_background_listeners = []
+_listener_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot-listener')
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+def add_listener(callback, background=False):
+    """スナップショットが更新されたときに呼び出す関数を登録する。
+
+    Args:
+        callback (callable): カテゴリーとエントリーのリストを受け取る関数
+        background (bool, optional): Trueの場合は、取得の完了を待っている呼び出しを止めないよう
+            専用のスレッドで呼び出す（呼び出しの順序は登録順）
+    """
+    (_background_listeners if background else _listeners).append(callback)
+
+
+def install_entries(category, entries):
+    """取得したエントリーをスナップショットとして保存する。
+
+    キーワード検索用のインデックスもここで作成します（前回のスナップショットから
+    変わっていないエントリーの索引語は再利用します）。共有キャッシュを使用している場合は
+    他のインスタンスにも共有します。
+
+    Args:
+        category (str): カテゴリー
+        entries (list): エントリーのリスト
+
+    Returns:
+        Snapshot: 保存したスナップショット
+    """
+    if not is_shared():
+        return _install(category, entries, datetime.now(), None)
+    record = [[entry.title, entry.url, entry.description, entry.count, entry.date]
+              for entry in entries]
+    digest = hashlib.blake2b(json.dumps(record, ensure_ascii=False).encode('utf-8'),
+                             digest_size=8).hexdigest()
+    snapshot = _install(category, entries, datetime.now(), digest)
+    cache_set(f'snapshot:{category}',
+              {'t': snapshot.last_update.timestamp(), 'd': digest, 'e': record},
+              ttl=DEGRADED_MAX_STALENESS)
+    return snapshot
+
+
+def _install(category, entries, last_update, digest):
+    previous = get_snapshot(category)
+    snapshot = Snapshot(
+        entries=tuple(entries),
+        index=SearchIndex.build(entries, previous.index if previous else None),
+        version=next(_versions),
+        last_update=last_update,
+        digest=digest,
+    )
+    publish_snapshot(category, snapshot)
+    with _degraded_lock:
+        _failures.pop(category, None)
+    _notify(_listeners, category, snapshot.entries)
+    if _background_listeners:
+        _listener_executor.submit(_notify, list(_background_listeners), category, snapshot.entries)
+    return snapshot
+
+
+def _notify(listeners, category, entries):
+    """スナップショットの更新をリスナーに通知する。"""
+    for callback in listeners:
+        try:
+            callback(category, entries)
+        except Exception as e:
+            logger.error(f"スナップショット更新の通知に失敗しました: {str(e)}")
+
+
+def publish_snapshot(category, snapshot):
+    """スナップショットを公開する。
+
+    カテゴリーからの対応表をコピーして差し替えるため、読み出し中の対応表は変更されません。
+
+    Args:
+        category (str): カテゴリー
+        snapshot (Snapshot): 公開するスナップショット
+    """
+    global _snapshots
+    with _publish_lock:
+        snapshots = dict(_snapshots)
+        snapshots[category] = snapshot
+        _snapshots = MappingProxyType(snapshots)
+
+
+def clear_snapshots():
+    """すべてのスナップショットを破棄する（テストで使用）。"""
+    global _snapshots
+    with _publish_lock:
+        _snapshots = MappingProxyType({})
+
+
+def _adopt_shared(category, max_age):
+    """他のインスタンスが取得した新しいスナップショットがあれば、それを保存して返す。
+
+    Args:
+        category (str): カテゴリー
+        max_age (float): 使ってよいスナップショットの最大経過秒数
+
+    Returns:
+        Snapshot: 保存したスナップショット。使えるものがない場合はNone。
+    """
+    record = cache_get(f'snapshot:{category}')
+    if not isinstance(record, dict):
+        return None
+    try:
+        last_update = datetime.fromtimestamp(record['t'])
+        if (datetime.now() - last_update).total_seconds() > max_age:
+            return None
+        current = get_snapshot(category)
+        if current is not None and current.last_update >= last_update:
+            return None
+        entries = [Entry(*values) for values in record['e']]
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning(f"共有キャッシュのスナップショットを読み込めませんでした: {str(e)}")
+        return None
+    logger.info(f"他のインスタンスが取得したスナップショットを使用します: {category}")
+    return _install(category, entries, last_update, record.get('d'))
+
+
+def get_snapshot(category='all'):
+    """現在のスナップショットを返す（ロックを取らない）。
+
+    Args:
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+
+    Returns:
+        Snapshot: スナップショット。まだ取得していない場合はNone。
+    """
+    return _snapshots.get(category)
+
+
+def get_snapshots():
+    """カテゴリー -> スナップショットの対応表（読み取り専用、ある時点の一貫した内容）を返す。"""
+    return _snapshots
+
+
+def refresh_entries(category='all'):
+    """はてなブックマークから取得してスナップショットを更新する。
+
+    同じカテゴリーの取得が実行中であれば、その結果を待って共有します。
+
+    Args:
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+
+    Returns:
+        tuple: 取得したエントリーのタプル
+    """
+    return refresh_snapshot(category).entries
+
+
+def refresh_snapshot(category='all', reuse_age=None):
+    """``refresh_entries`` と同じく取得し、更新したスナップショットを返す。
+
+    Args:
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+        reuse_age (float, optional): 他のインスタンスが取得したスナップショットを取得の代わりに
+            使ってよい最大経過秒数。デフォルトは最小の更新間隔。
+    """
+    def refresh():
+        snapshot = _adopt_shared(category, _reuse_age(reuse_age))
+        if snapshot is not None:
+            return snapshot
+        return install_entries(category, fetch_hatena_hotentries(category))
+
+    return upstream_flight.do(category, refresh)
+
+
+async def refresh_snapshot_async(category='all', reuse_age=None):
+    """``refresh_snapshot`` のコルーチン版。
+
+    スケジューラーのスレッドで実行中の取得にも合流します。スナップショットの保存
+    （検索用のインデックスの作成、リスナーの呼び出し、共有キャッシュへの書き込み）は
+    イベントループを止めないよう、スレッドで実行します。
+    """
+    async def refresh():
+        if is_shared():
+            snapshot = await asyncio.to_thread(_adopt_shared, category, _reuse_age(reuse_age))
+            if snapshot is not None:
+                return snapshot
+        entries = await fetch_hatena_hotentries_async(category)
+        return await asyncio.to_thread(install_entries, category, entries)
+
+    return await upstream_flight.do_async(category, refresh)
+
+
+def _reuse_age(reuse_age):
+    # スケジューラーによる更新では、最小の更新間隔より古いものは取得し直す
+    return refresh_policy.minimum if reuse_age is None else reuse_age
+
+
+def get_entries(category='all'):
+    """リクエストの処理に使うエントリーを返す。
+
+    スナップショットが十分に新しければそれを使い、そうでなければ取得します。
+
+    Args:
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+
+    Returns:
+        tuple: エントリーのタプル
+
+    Raises:
+        Exception: 取得に失敗した場合
+    """
+    return get_fresh_snapshot(category).entries
+
+
+async def get_entries_async(category='all'):
+    """``get_entries`` のコルーチン版。"""
+    return (await get_fresh_snapshot_async(category)).entries
+
+
+def get_fresh_snapshot(category='all'):
+    """``get_entries`` と同じくスナップショットを用意し、スナップショット全体を返す。
+
+    Returns:
+        Snapshot: スナップショット
+
+    Raises:
+        Exception: 取得に失敗した場合
+    """
+    record_demand(category)
+    snapshot = _fresh_snapshot(category)
+    if snapshot is not None:
+        return snapshot
+    return refresh_snapshot(category, snapshot_lifetime(category))
+
+
+async def get_fresh_snapshot_async(category='all'):
+    """``get_fresh_snapshot`` のコルーチン版。"""
+    record_demand(category)
+    snapshot = _fresh_snapshot(category)
+    if snapshot is not None:
+        return snapshot
+    return await refresh_snapshot_async(category, snapshot_lifetime(category))
+
+
+def get_serving_snapshot(category='all'):
+    """フィードの配信に使うスナップショットを返す。
+
+    ``get_fresh_snapshot`` と同じく用意しますが、取得に失敗した場合は、最後に取得できた
+    スナップショットが ``DEGRADED_MAX_STALENESS`` 秒以内であればそれで代替します。
+    失敗後 ``DEGRADED_RETRY_INTERVAL`` 秒間は、取得を試みずに代替のスナップショットを返します。
+
+    Args:
+        category (str, optional): カテゴリー。デフォルトは'all'（総合）。
+
+    Returns:
+        tuple: (スナップショット, 代替した場合はその経過秒数。新しい場合はNone)
+
+    Raises:
+        Exception: 取得に失敗し、代替できるスナップショットもない場合
+    """
+    record_demand(category)
+    snapshot = _fresh_snapshot(category)
+    if snapshot is not None:
+        return snapshot, None
+    fallback = _recent_failure_fallback(category)
+    if fallback is not None:
+        return fallback
+    try:
+        return refresh_snapshot(category, snapshot_lifetime(category)), None
+    except Exception as e:
+        return _degrade(category, e)
+
+
+async def get_serving_snapshot_async(category='all'):
+    """``get_serving_snapshot`` のコルーチン版。"""
+    record_demand(category)
+    snapshot = _fresh_snapshot(category)
+    if snapshot is not None:
+        return snapshot, None
+    fallback = _recent_failure_fallback(category)
+    if fallback is not None:
+        return fallback
+    try:
+        return await refresh_snapshot_async(category, snapshot_lifetime(category)), None
+    except Exception as e:
+        return _degrade(category, e)
+
+
+def degraded_status():
+    """代替の状況を返す。
+
+    Returns:
+        dict: served（代替した回数）、gave_up（代替できなかった回数）、
+            failing（取得に失敗中のカテゴリー -> 失敗からの秒数とエラー）、max_staleness
+    """
+    now = time.monotonic()
+    with _degraded_lock:
+        return {
+            'served': dict(_degraded_counts['served']),
+            'gave_up': dict(_degraded_counts['gave_up']),
+            'failing': {category: {'seconds': round(now - failed_at, 1), 'error': error}
+                        for category, (failed_at, error) in _failures.items()},
+            'max_staleness': DEGRADED_MAX_STALENESS,
+        }
+
+
+def _recent_failure_fallback(category):
+    """直前に取得に失敗していれば、再試行せずに代替のスナップショットを返す。"""
+    with _degraded_lock:
+        failure = _failures.get(category)
+    if failure is None or time.monotonic() - failure[0] > DEGRADED_RETRY_INTERVAL:
+        return None
+    fallback = _stale_snapshot(category)
+    if fallback is not None:
+        _count_degraded('served', category)
+    return fallback
+
+
+def _degrade(category, error):
+    """取得の失敗を記録し、代替のスナップショットを返す（なければ例外を送出する）。"""
+    with _degraded_lock:
+        _failures[category] = (time.monotonic(), str(error))
+    fallback = _stale_snapshot(category)
+    if fallback is None:
+        _count_degraded('gave_up', category)
+        raise error
+    _count_degraded('served', category)
+    logger.warning(f"取得に失敗したため{int(fallback[1])}秒前のスナップショットを返します: {str(error)}")
+    return fallback
+
+
+def _stale_snapshot(category):
+    """最大経過秒数以内の古いスナップショットを (スナップショット, 経過秒数) で返す。"""
+    snapshot = get_snapshot(category)
+    if snapshot is None:
+        return None
+    age = (datetime.now() - snapshot.last_update).total_seconds()
+    if age > DEGRADED_MAX_STALENESS:
+        return None
+    return snapshot, age
+
+
+def _count_degraded(kind, category):
+    with _degraded_lock:
+        counts = _degraded_counts[kind]
+        counts[category] = counts.get(category, 0) + 1
+
+
+def record_demand(category):
+    """スケジューラーが更新する総合へのリクエストを需要として記録する。"""
+    if category == 'all':
+        refresh_policy.record_request()
+
+
+def snapshot_lifetime(category):
+    """リクエストの処理でスナップショットをそのまま使える最大経過秒数を返す。
+
+    総合はスケジューラーが更新するため、スケジューラーが決めた更新間隔が ``SNAPSHOT_MAX_AGE`` より
+    長ければその間隔を使います（夜間などに間隔を延ばしたとき、リクエストの処理で取得し直さない）。
+    その他のカテゴリーは ``SNAPSHOT_MAX_AGE`` です。
+
+    Args:
+        category (str): カテゴリー
+
+    Returns:
+        float: 最大経過秒数
+    """
+    if category == 'all':
+        return max(SNAPSHOT_MAX_AGE, refresh_policy.current_interval())
+    return SNAPSHOT_MAX_AGE
+
+
+def _fresh_snapshot(category):
+    """最大経過秒数以内のスナップショットを返す。"""
+    snapshot = get_snapshot(category)
+    if snapshot is None:
+        return None
+    age = (datetime.now() - snapshot.last_update).total_seconds()
+    if age > snapshot_lifetime(category):
+        return None
+    return snapshot
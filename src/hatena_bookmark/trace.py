@@ -0,0 +1,158 @@
+"""処理段階ごとの所要時間の計測モジュール。
+
+このモジュールは、フィードの生成やスケジューラーのジョブを1つのトレースとして扱い、
+取得（fetch）・パース（parse）・フィルタリング（filter）・生成（render）などの段階（スパン）の
+所要時間を記録します。トレースはサンプリングされたものだけが作られ、終了時に構造化ログ（JSON）として
+出力されます。``SERVER_TIMING`` を有効にすると、フィードのレスポンスに ``Server-Timing`` ヘッダーも付きます。
+
+サンプリングされていないときの ``span`` は、共有のno-opオブジェクトを返すだけです。
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+
+# トレースを記録する割合（0.0〜1.0、デフォルトは記録しない）
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))
+
+# サンプリングされたフィードのレスポンスにServer-Timingヘッダーを付けるかどうか
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+
+# 実行中のトレース（スレッド・タスクごと）
+_current = contextvars.ContextVar('trace', default=None)
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    """1回の処理のスパンを集めるトレース。
+
+    ``with`` で使うと、その間に ``span`` で計測したスパンがこのトレースに記録されます。
+    """
+
+    __slots__ = ('name', 'attributes', 'spans', 'start', 'duration', '_token')
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = attributes or {}
+        # (スパン名, 秒) のリスト（同じ名前のスパンが複数回記録されることもある）
+        self.spans = []
+        self.start = None
+        self.duration = None
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        logger.info(json.dumps(self.as_dict(), ensure_ascii=False))
+        return False
+
+    def elapsed(self):
+        """トレース開始からの経過秒数を返す。"""
+        if self.duration is not None:
+            return self.duration
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        """Server-Timingヘッダーの値を返す（合計は ``total``）。"""
+        metrics = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.spans]
+        metrics.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        """構造化ログに出力する内容を返す。"""
+        return {
+            'trace': self.name,
+            'total_ms': round(self.elapsed() * 1000, 2),
+            'spans': [{'name': name, 'ms': round(seconds * 1000, 2)} for name, seconds in self.spans],
+            **self.attributes,
+        }
+
+
+class _Span:
+    """トレースにスパンを1つ記録するコンテキストマネージャー。"""
+
+    __slots__ = ('trace', 'name', 'start')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.spans.append((self.name, time.perf_counter() - self.start))
+        return False
+
+
+class _NoopSpan:
+    """サンプリングされていないときに使う何もしないコンテキストマネージャー。"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def start_trace(name, **attributes):
+    """サンプリングされた場合にトレースを開始する。
+
+    Args:
+        name (str): トレースの名前（'feed'、'scheduler.update_feed'など）
+        **attributes: 構造化ログに含める属性
+
+    Returns:
+        Trace | _NoopSpan: ``with`` で使うコンテキストマネージャー。
+            サンプリングされなかった場合、``as`` で受け取る値はNoneになります。
+    """
+    if TRACE_SAMPLE_RATE <= 0 or random.random() >= TRACE_SAMPLE_RATE:
+        return _NOOP
+    return Trace(name, attributes)
+
+
+def span(name):
+    """実行中のトレースにスパンを記録する。
+
+    Args:
+        name (str): スパンの名前（'fetch'、'parse'、'filter'、'render'など）
+
+    Returns:
+        コンテキストマネージャー（トレースがなければno-op）
+    """
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name)
+
+
+def server_timing_header(trace):
+    """Server-Timingヘッダーを付ける場合にその値を返す。
+
+    Args:
+        trace (Trace | None): ``start_trace`` で開始したトレース
+
+    Returns:
+        str | None: ヘッダーの値。付けない場合はNone。
+    """
+    if trace is None or not SERVER_TIMING:
+        return None
+    return trace.server_timing()
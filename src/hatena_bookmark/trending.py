@@ -0,0 +1,115 @@
+"""ブックマーク数の伸び（ベロシティ）によるランキングのモジュール。
+
+このモジュールは、総合のスナップショットが更新されるたびにエントリーのブックマーク数を
+URLごとのリングバッファ（直近 ``TRENDING_HISTORY`` 回分）に記録し、1時間あたりの伸びで
+並べたランキングを作り直します。ランキングは更新のたびに1回だけ計算して差し替えるため、
+``/hotentry/all/trending`` のリクエストは計算済みのランキングを読み出すだけです。
+
+ホットエントリーから外れたURLはその時点で履歴ごと削除するため、保持する履歴は
+ホットエントリーの件数 × ``TRENDING_HISTORY`` を超えません。
+"""
+
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+# URLごとに保持するブックマーク数の履歴の数
+TRENDING_HISTORY = int(os.environ.get('TRENDING_HISTORY', '12'))
+
+# ランキングに含めるエントリーの数
+TRENDING_SIZE = int(os.environ.get('TRENDING_SIZE', '30'))
+
+# ランキングの1件（velocityは1時間あたりのブックマーク数の増加）
+TrendingEntry = namedtuple('TrendingEntry', ['entry', 'velocity'])
+
+# 計算済みのランキング（versionは計算するたびに進む。entriesはベロシティの降順）
+Ranking = namedtuple('Ranking', ['entries', 'version', 'computed_at'])
+
+
+def compute_velocity(history):
+    """ブックマーク数の履歴から1時間あたりの伸びを計算する。
+
+    Args:
+        history (iterable): (UNIX時刻, ブックマーク数) の古い順の並び
+
+    Returns:
+        float: 1時間あたりの伸び。履歴が2件未満、または時間が経過していない場合はNone。
+    """
+    history = list(history)
+    if len(history) < 2:
+        return None
+    (first_time, first_count), (last_time, last_count) = history[0], history[-1]
+    elapsed = last_time - first_time
+    if elapsed <= 0:
+        return None
+    return (last_count - first_count) * 3600 / elapsed
+
+
+class TrendTracker:
+    """URLごとのブックマーク数の履歴を保持し、伸びのランキングを計算する。
+
+    ``observe`` はスナップショットの更新のたびに呼ばれ（``store.add_listener`` に登録）、
+    ``ranking`` はリクエストの処理から呼ばれます。
+
+    Args:
+        history (int, optional): URLごとに保持する履歴の数
+        size (int, optional): ランキングに含めるエントリーの数
+    """
+
+    def __init__(self, history=TRENDING_HISTORY, size=TRENDING_SIZE):
+        self.history = max(2, history)
+        self.size = size
+        # URL -> (時刻, ブックマーク数) のリングバッファ
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._ranking = Ranking((), 0, None)
+
+    def observe(self, category, entries, now=None):
+        """総合のエントリーのブックマーク数を記録し、ランキングを計算し直す。
+
+        Args:
+            category (str): 更新されたカテゴリー（総合以外は無視する）
+            entries (tuple): 更新後のエントリー
+            now (float, optional): 記録する時刻（UNIX時刻、テスト用）
+        """
+        if category != 'all':
+            return
+        now = now if now is not None else time.time()
+        with self._lock:
+            current = {}
+            for entry in entries:
+                counts = self._counts.get(entry.url)
+                if counts is None:
+                    counts = deque(maxlen=self.history)
+                if not counts or counts[-1][0] < now:
+                    counts.append((now, entry.count))
+                current[entry.url] = counts
+            # ホットエントリーから外れたURLの履歴は捨てる
+            self._counts = current
+
+            ranked = []
+            for entry in entries:
+                velocity = compute_velocity(current[entry.url])
+                if velocity is not None and velocity > 0:
+                    ranked.append(TrendingEntry(entry, velocity))
+            ranked.sort(key=lambda item: item.velocity, reverse=True)
+            self._ranking = Ranking(tuple(ranked[:self.size]), self._ranking.version + 1, now)
+
+    def ranking(self):
+        """直近に計算したランキングを返す。"""
+        return self._ranking
+
+    def status(self):
+        """履歴を保持しているURLの数とランキングの状況を返す。"""
+        ranking = self._ranking
+        return {
+            'tracked_urls': len(self._counts),
+            'history': self.history,
+            'ranked': len(ranking.entries),
+            'version': ranking.version,
+        }
+
+
+# アプリケーション全体で使用するランキング
+trend_tracker = TrendTracker()
@@ -7,7 +7,6 @@
 import random
 import email.utils
 from datetime import datetime
-from dateutil import parser
 
 
 # User-Agentのリスト
@@ -38,9 +37,49 @@ def format_rfc822_date(date_str=None):
     """
     if date_str:
         try:
-            dt = parser.parse(date_str)
-        except Exception:
-            dt = datetime.now()
+            # APIとRSSの日付はISO 8601形式のため、まず高速な標準ライブラリで解析する
+            dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        except ValueError:
+            # ISO 8601形式以外の日付は少ないため、dateutilは必要になったときに読み込む
+            from dateutil import parser
+            try:
+                dt = parser.parse(date_str)
+            except Exception:
+                dt = datetime.now()
     else:
         dt = datetime.now()
-    return email.utils.format_datetime(dt)
\ No newline at end of file
+    return email.utils.format_datetime(dt)
+
+
+def parse_threshold(value, default=100):
+    """クエリパラメータのしきい値を整数に変換する。
+
+    Args:
+        value (str): クエリパラメータの値
+        default (int, optional): 変換できない場合の値。デフォルトは100。
+
+    Returns:
+        int: ブックマーク数のしきい値
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def split_list_param(values):
+    """カンマ区切りまたは繰り返し指定されたクエリパラメータをリストに変換する。
+
+    Args:
+        values (list): クエリパラメータの値のリスト（例: ['100,200', '500']）
+
+    Returns:
+        list: 空要素と重複を除いた値のリスト（指定順）
+    """
+    items = []
+    for value in values:
+        for item in value.split(','):
+            item = item.strip()
+            if item and item not in items:
+                items.append(item)
+    return items
@@ -0,0 +1,158 @@
+"""リクエストの多いフィードの事前レンダリングモジュール。
+
+このモジュールは、フィードへのリクエストを (カテゴリー, しきい値, エンコーディング) ごとに
+減衰するカウンターで数え、スナップショットが更新されるたびに、リクエストの多い上位
+``WARMUP_TOP_K`` 件のアイテムをレンダリング（gzipで受け取るクライアントが多いものは圧縮も）
+しておきます。スナップショットの更新直後のリクエストも、キャッシュ済みのアイテムで応答できます。
+
+カウンターはSpace-Savingアルゴリズムで ``WARMUP_CAPACITY`` 件までに制限し、古いリクエストほど
+小さく数えます（``WARMUP_HALF_LIFE`` 秒で半分）。``threshold`` には任意の整数を指定できるため、
+まれにしか使われない値がカウンターを占有し続けることはありません。
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from .feed import compress_feed_items, render_feed_items
+from .store import get_snapshot
+
+# 事前にレンダリングする件数と、数える組み合わせの最大数
+WARMUP_TOP_K = int(os.environ.get('WARMUP_TOP_K', '8'))
+WARMUP_CAPACITY = int(os.environ.get('WARMUP_CAPACITY', '64'))
+
+# リクエストの重みが半分になる秒数
+WARMUP_HALF_LIFE = float(os.environ.get('WARMUP_HALF_LIFE', '3600'))
+
+# 重みの基準時刻を進める間隔（重みが大きくなりすぎないようにする）
+_RESCALE_AFTER = 32
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+
+class DecayingTopK:
+    """件数を制限した、時間とともに減衰するカウンター（Space-Saving）。
+
+    リクエストの重みは基準時刻からの経過時間に応じて大きくし、古いリクエストを
+    相対的に小さくします（すべてのカウンターを減らす処理を毎回行わずに済む）。
+
+    Args:
+        capacity (int, optional): 数える組み合わせの最大数
+        half_life (float, optional): 重みが半分になる秒数
+        clock (callable, optional): 現在時刻を返す関数（テスト用）
+    """
+
+    def __init__(self, capacity=WARMUP_CAPACITY, half_life=WARMUP_HALF_LIFE, clock=time.monotonic):
+        self.capacity = capacity
+        self.half_life = half_life
+        self._clock = clock
+        self._epoch = clock()
+        # キー -> 重み付きの回数
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, key):
+        """キーへのリクエストを1件数える。"""
+        with self._lock:
+            elapsed = self._clock() - self._epoch
+            if elapsed / self.half_life > _RESCALE_AFTER:
+                self._rescale(elapsed)
+                elapsed = 0.0
+            weight = 2.0 ** (elapsed / self.half_life)
+            if key in self._counts:
+                self._counts[key] += weight
+            elif len(self._counts) < self.capacity:
+                self._counts[key] = weight
+            else:
+                # 最も少ないキーを置き換え、その回数を引き継ぐ（過大評価はその回数まで）
+                smallest = min(self._counts, key=self._counts.get)
+                self._counts[key] = self._counts.pop(smallest) + weight
+
+    def _rescale(self, elapsed):
+        factor = 2.0 ** (-elapsed / self.half_life)
+        self._counts = {key: count * factor for key, count in self._counts.items()}
+        self._epoch += elapsed
+
+    def top(self, k):
+        """回数の多い順に上位k件を返す。
+
+        Returns:
+            list: (キー, 現在の時刻に換算した回数) のリスト
+        """
+        with self._lock:
+            scale = 2.0 ** (-(self._clock() - self._epoch) / self.half_life)
+            ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(key, count * scale) for key, count in ranked]
+
+
+class FeedWarmer:
+    """リクエストの多いフィードをスナップショットの更新時にレンダリングしておく。
+
+    Args:
+        popularity (DecayingTopK, optional): リクエストのカウンター
+        top_k (int, optional): 事前にレンダリングする件数
+    """
+
+    def __init__(self, popularity=None, top_k=WARMUP_TOP_K):
+        self.popularity = popularity or DecayingTopK()
+        self.top_k = top_k
+        # カテゴリー -> 直近の事前レンダリングの結果
+        self._last = {}
+
+    def record(self, category, threshold, encoding):
+        """フィードへのリクエストを数える（検索語やドメインの指定がないものだけ）。
+
+        Args:
+            category (str): カテゴリー
+            threshold (int): ブックマーク数のしきい値
+            encoding (str): ``gzip`` または ``identity``
+        """
+        self.popularity.record((category, threshold, encoding))
+
+    def warm(self, category, entries=None):
+        """カテゴリーのリクエストの多いフィードをレンダリングしておく。
+
+        ``store.add_listener`` に登録して使います。
+
+        Args:
+            category (str): 更新されたカテゴリー
+            entries (tuple, optional): 更新後のエントリー（使用しない）
+        """
+        snapshot = get_snapshot(category)
+        if snapshot is None:
+            return
+        variants = [key for key, _ in self.popularity.top(self.top_k) if key[0] == category]
+        if not variants:
+            return
+        start = time.perf_counter()
+        for _, threshold, encoding in variants:
+            if encoding == 'gzip':
+                compress_feed_items(snapshot, category, threshold)
+            else:
+                render_feed_items(snapshot, category, threshold)
+        elapsed = time.perf_counter() - start
+        self._last[category] = {
+            'variants': [[threshold, encoding] for _, threshold, encoding in variants],
+            'ms': round(elapsed * 1000, 2),
+            'version': snapshot.version,
+            'at': datetime.now().isoformat(timespec='seconds'),
+        }
+        logger.debug(f"{category}のフィード{len(variants)}件を{elapsed * 1000:.1f}ミリ秒でレンダリングしました")
+
+    def status(self):
+        """現在の上位の組み合わせと、カテゴリーごとの直近の事前レンダリングの結果を返す。"""
+        return {
+            'top': [
+                {'category': category, 'threshold': threshold, 'encoding': encoding,
+                 'score': round(score, 2)}
+                for (category, threshold, encoding), score in self.popularity.top(self.top_k)
+            ],
+            'last_warmup': dict(self._last),
+        }
+
+
+# アプリケーション全体で使用する事前レンダリング
+feed_warmer = FeedWarmer()
@@ -4,5 +4,22 @@
 
 Modules:
     test_api: API通信機能のテスト
+    test_app: Flaskアプリケーションのエンドポイントのテスト
+    test_asgi: ASGIアプリケーションのエンドポイントのテスト
+    test_cache: 共有キャッシュのテスト
+    test_catalog: 名前付きフィードのテスト
+    test_cdn: CDN向けのキャッシュ制御のテスト
+    test_coalesce: 取得の集約機能のテスト
+    test_domains: ドメインによる絞り込み機能のテスト
+    test_enrich: 記事のメタデータの取得のテスト
     test_feed: フィード生成機能のテスト
+    test_memory: メモリの予算と診断のテスト
+    test_notify: 更新通知機能のテスト
+    test_ratelimit: リクエスト数の制限のテスト
+    test_refresh: 更新間隔の調整機能のテスト
+    test_replay: 上流のレスポンスの記録・再生機能のテスト
+    test_search: キーワード検索機能のテスト
+    test_trace: 処理段階の計測機能のテスト
+    test_trending: ブックマーク数の伸びによるランキングのテスト
+    test_warmup: 事前レンダリングと圧縮のテスト
 """
\ No newline at end of file
@@ -3,10 +3,18 @@
 このモジュールでは、はてなブックマークAPIとの通信機能をテストします。
 """
 
+import asyncio
+import json
 import unittest
 from unittest.mock import patch, MagicMock
 import xml.etree.ElementTree as ET
-from src.hatena_bookmark.api import fetch_hatena_hotentries, fetch_hatena_hotentries_from_rss
+import httpx
+from src.hatena_bookmark.api import (
+    fetch_hatena_hotentries,
+    fetch_hatena_hotentries_async,
+    fetch_hatena_hotentries_from_rss,
+    parse_hotentry_json,
+)
 
 
 class TestAPI(unittest.TestCase):
@@ -17,7 +25,7 @@ class TestAPI(unittest.TestCase):
         """APIからのデータ取得が成功した場合のテスト。"""
         # モックの設定
         mock_response = MagicMock()
-        mock_response.json.return_value = [
+        mock_response.content = json.dumps([
             {
                 'title': 'テスト記事1',
                 'url': 'https://example.com/1',
@@ -32,7 +40,7 @@ class TestAPI(unittest.TestCase):
                 'count': 300,
                 'date': '2023-01-02T00:00:00Z'
             }
-        ]
+        ]).encode('utf-8')
         mock_get.return_value = mock_response
 
         # テスト対象の関数を実行
@@ -40,8 +48,8 @@ class TestAPI(unittest.TestCase):
 
         # 検証
         self.assertEqual(len(result), 2)
-        self.assertEqual(result[0]['title'], 'テスト記事1')
-        self.assertEqual(result[1]['count'], 300)
+        self.assertEqual(result[0].title, 'テスト記事1')
+        self.assertEqual(result[1].count, 300)
         mock_get.assert_called_once()
 
     @patch('src.hatena_bookmark.api.session.get')
@@ -101,10 +109,89 @@ class TestAPI(unittest.TestCase):
         
         # 検証
         self.assertEqual(len(result), 1)
-        self.assertEqual(result[0]['title'], 'RSSテスト記事')
-        self.assertEqual(result[0]['count'], 150)
+        self.assertEqual(result[0].title, 'RSSテスト記事')
+        self.assertEqual(result[0].count, 150)
         mock_get.assert_called_once()
 
+    def test_fetch_hatena_hotentries_async_fallback(self):
+        """非同期版でAPIが失敗した場合にRSSフィードから取得することのテスト。"""
+        with open('tests/fixtures/popular_entries.xml', 'rb') as f:
+            rss_content = f.read()
+
+        def handler(request):
+            if 'ipad.hotentry' in str(request.url):
+                return httpx.Response(503)
+            return httpx.Response(200, content=rss_content)
+
+        async def fetch():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            with patch('src.hatena_bookmark.api._get_async_client', return_value=client):
+                try:
+                    return await fetch_hatena_hotentries_async()
+                finally:
+                    await client.aclose()
+
+        # テスト対象の関数を実行
+        result = asyncio.run(fetch())
+
+        # 検証
+        self.assertGreater(len(result), 0)
+        self.assertEqual(result[0].title, 'テスト記事1')
+        self.assertIsInstance(result[0].count, int)
+
+    @patch('src.hatena_bookmark.api.session.get')
+    def test_fetch_hatena_hotentries_projects_fields(self, mock_get):
+        """取り込み時に不要なフィールドを破棄し、フィード用の値を計算することのテスト。"""
+        # モックの設定
+        mock_response = MagicMock()
+        mock_response.content = json.dumps([
+            {
+                'title': 'A & B',
+                'url': 'https://example.com/?a=1&b=2',
+                'description': None,
+                'count': 120,
+                'date': '2023-01-01T00:00:00Z',
+                'eid': '123',
+                'image': 'https://example.com/image.png',
+            }
+        ]).encode('utf-8')
+        mock_get.return_value = mock_response
+
+        # テスト対象の関数を実行
+        entry = fetch_hatena_hotentries()[0]
+
+        # 検証
+        self.assertFalse(hasattr(entry, '__dict__'))
+        self.assertFalse(hasattr(entry, 'image'))
+        self.assertEqual(entry.title_html, 'A &amp; B')
+        self.assertEqual(entry.url_html, 'https://example.com/?a=1&amp;b=2')
+        self.assertEqual(entry.description_html, '説明なし')
+        self.assertEqual(entry.guid_html, 'https://example.com/?a=1&amp;b=2-120')
+        self.assertEqual(entry.pub_date, 'Sun, 01 Jan 2023 00:00:00 +0000')
+
+    def test_parse_hotentry_json_drops_malformed_entries(self):
+        """不正なエントリーだけを読み飛ばし、残りのエントリーを返すことのテスト。"""
+        valid = {'title': 'ok', 'url': 'https://example.com/ok', 'description': None,
+                 'count': '150', 'date': '2023-01-01T00:00:00Z'}
+        items = [
+            valid,
+            {'title': 'no url', 'count': 100},
+            {'title': 'bad url', 'url': 'javascript:alert(1)', 'count': 100},
+            {'title': 'bad count', 'url': 'https://example.com/1', 'count': 'many'},
+            {'title': 'negative', 'url': 'https://example.com/2', 'count': -1},
+            {'title': ['list'], 'url': 'https://example.com/3', 'count': 10},
+            'not a dict',
+        ]
+
+        with self.assertLogs('src.hatena_bookmark.api', level='WARNING'):
+            entries = parse_hotentry_json(items)
+
+        self.assertEqual([entry.url for entry in entries], ['https://example.com/ok'])
+        self.assertEqual(entries[0].count, 150)
+        # レスポンス自体がリストでない場合はRSSへのフォールバックのためにエラーにする
+        with self.assertRaises(ValueError):
+            parse_hotentry_json({'error': 'maintenance'})
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
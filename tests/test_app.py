@@ -0,0 +1,96 @@
+"""Flaskアプリケーションのテスト。
+
+このモジュールでは、Flaskのテストクライアントで、フィードのリクエスト数の制限（429と
+Retry-After）と、診断用のエンドポイントの認証をエンドポイント単位でテストします。
+"""
+
+import os
+import unittest
+from unittest.mock import patch
+
+# アプリケーションの読み込みで開始されるスケジューラーを、テスト中は開始しない
+os.environ.setdefault('SCHEDULER_START_DELAY', '3600')
+
+from src.hatena_bookmark import store  # noqa: E402
+
+# アプリケーションが登録するリスナー（事前レンダリングなど）は、他のテストのスナップショットの
+# 更新でも呼ばれてしまうため、読み込み後に元に戻す
+_listeners = list(store._listeners)
+_background_listeners = list(store._background_listeners)
+from src.hatena_bookmark.app import app  # noqa: E402
+store._listeners[:] = _listeners
+store._background_listeners[:] = _background_listeners
+from src.hatena_bookmark.models import Entry  # noqa: E402
+from src.hatena_bookmark.ratelimit import TokenBucketLimiter  # noqa: E402
+from src.hatena_bookmark.store import clear_snapshots, install_entries  # noqa: E402
+
+
+def _entries(prefix, count):
+    return [Entry(f'{prefix}{number}', f'https://{prefix}.example.com/{number}', '',
+                  count, '2023-01-01T00:00:00Z') for number in range(3)]
+
+
+class TestApp(unittest.TestCase):
+    """Flaskアプリケーションのテストクラス。"""
+
+    def setUp(self):
+        """テスト前の準備（スナップショットとバケットをテストごとに作り直す）。"""
+        clear_snapshots()
+        install_entries('all', _entries('app', 500))
+        self.client = app.test_client()
+        self.full = TokenBucketLimiter(rate=0.01, burst=2)
+        self.conditional = TokenBucketLimiter(rate=0.01, burst=60)
+        patchers = [
+            patch('src.hatena_bookmark.ratelimit.feed_limiter', self.full),
+            patch('src.hatena_bookmark.ratelimit.conditional_limiter', self.conditional),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_rate_limited_feed(self):
+        """バケットが空になったら、429とRetry-Afterを返すテスト。"""
+        responses = [self.client.get('/hotentry/all/feed?threshold=100') for _ in range(3)]
+        self.assertEqual([response.status_code for response in responses], [200, 200, 429])
+        self.assertGreaterEqual(int(responses[2].headers['Retry-After']), 1)
+        self.assertEqual(responses[2].headers['Cache-Control'], 'no-store')
+        # 制限の対象ではないエンドポイントは制限しない
+        self.assertEqual(self.client.get('/health').status_code, 200)
+
+    def test_conditional_requests(self):
+        """一致するETagは304で済み、一致しないETagを送り続けると429になるテスト。"""
+        etag = self.client.get('/hotentry/all/feed?threshold=100').headers['ETag']
+        statuses = [self.client.get('/hotentry/all/feed?threshold=100',
+                                    headers={'If-None-Match': etag}).status_code
+                    for _ in range(5)]
+        self.assertEqual(statuses, [304] * 5)
+
+        # 304にならない条件付きリクエストは通常のバケットからも差し引かれ、負になったら制限する
+        statuses = [self.client.get('/hotentry/all/feed?threshold=100',
+                                    headers={'If-None-Match': '"bogus"'}).status_code
+                    for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_admin_memory(self):
+        """トークンが一致する場合だけメモリの使用状況を返し、/statusには含めないテスト。"""
+        with patch('src.hatena_bookmark.memory.ADMIN_TOKEN', ''):
+            self.assertEqual(self.client.get('/admin/memory').status_code, 404)
+        with patch('src.hatena_bookmark.memory.ADMIN_TOKEN', 'secret'):
+            self.assertEqual(self.client.get('/admin/memory').status_code, 404)
+            response = self.client.get('/admin/memory',
+                                       headers={'Authorization': 'Bearer wrong'})
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get('/admin/memory?limit=5',
+                                       headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['Cache-Control'], 'no-store')
+            self.assertIn('feed_items', response.get_json()['caches'])
+            self.assertIn('sources', response.get_json())
+            response = self.client.get('/admin/memory?trace=bogus',
+                                       headers={'X-Admin-Token': 'secret'})
+            self.assertEqual(response.status_code, 400)
+        self.assertNotIn('memory', self.client.get('/status').get_json())
+
+
+if __name__ == '__main__':
+    unittest.main()
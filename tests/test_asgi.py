@@ -0,0 +1,178 @@
+"""ASGIアプリケーションのテスト。
+
+このモジュールでは、非同期版のフィード、Server-Sent Eventsの配信、ロングポーリング、
+およびそれらのリクエスト数の制限をエンドポイント単位でテストします。
+"""
+
+import asyncio
+import os
+import threading
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+# アプリケーションの読み込みで開始されるスケジューラーを、テスト中は開始しない
+os.environ.setdefault('SCHEDULER_START_DELAY', '3600')
+
+from src.hatena_bookmark import store  # noqa: E402
+
+# アプリケーションが登録するリスナー（事前レンダリングなど）は、他のテストのスナップショットの
+# 更新でも呼ばれてしまうため、読み込み後に元に戻す
+_listeners = list(store._listeners)
+_background_listeners = list(store._background_listeners)
+from src.hatena_bookmark.asgi import application  # noqa: E402
+from src.hatena_bookmark.feed import render_feed_items  # noqa: E402
+store._listeners[:] = _listeners
+store._background_listeners[:] = _background_listeners
+from src.hatena_bookmark.models import Entry  # noqa: E402
+from src.hatena_bookmark.notify import FeedNotifier  # noqa: E402
+from src.hatena_bookmark.ratelimit import TokenBucketLimiter  # noqa: E402
+from src.hatena_bookmark.store import (  # noqa: E402
+    clear_snapshots,
+    get_snapshot,
+    install_entries,
+    refresh_snapshot_async,
+)
+
+
+def _entries(prefix, count):
+    return [Entry(f'{prefix}{number}', f'https://{prefix}.example.com/{number}', '',
+                  count, '2023-01-01T00:00:00Z') for number in range(3)]
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def _get(path, headers=None):
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+        return await client.get(path, headers=headers)
+
+
+class TestAsgi(unittest.TestCase):
+    """ASGIアプリケーションのテストクラス。"""
+
+    def setUp(self):
+        """テスト前の準備（通知ハブとバケットをテストごとに作り直す）。"""
+        self.notifier = FeedNotifier()
+        self.full = TokenBucketLimiter(rate=1, burst=30)
+        self.conditional = TokenBucketLimiter(rate=1, burst=60)
+        patchers = [
+            patch('src.hatena_bookmark.asgi.notifier', self.notifier),
+            patch('src.hatena_bookmark.ratelimit.feed_limiter', self.full),
+            patch('src.hatena_bookmark.ratelimit.conditional_limiter', self.conditional),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_feed(self):
+        """スナップショットのフィードをgzipで返し、ETagが一致すれば304を返すテスト。"""
+        clear_snapshots()
+        install_entries('all', _entries('feed', 500))
+        response = _run(_get('/hotentry/all/feed?threshold=100',
+                             {'Accept-Encoding': 'gzip'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertIn('https://feed.example.com/0', response.text)
+
+        response = _run(_get('/hotentry/all/feed?threshold=100',
+                             {'If-None-Match': response.headers['etag']}))
+        self.assertEqual(response.status_code, 304)
+
+    def test_shared_cache_render_off_loop(self):
+        """共有キャッシュを使う場合は、アイテムのレンダリングをイベントループの外で行うテスト。"""
+        clear_snapshots()
+        install_entries('all', _entries('shared', 500))
+        threads = []
+
+        def render(*args):
+            threads.append(threading.current_thread())
+            return render_feed_items(*args)
+
+        with patch('src.hatena_bookmark.asgi.is_shared', return_value=True), \
+                patch('src.hatena_bookmark.asgi.render_feed_items', render):
+            response = _run(_get('/hotentry/all/feed?threshold=100'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    def test_refresh_installs_off_loop(self):
+        """取得したエントリーの保存とリスナーの呼び出しをイベントループの外で行うテスト。"""
+        clear_snapshots()
+        threads = []
+
+        async def fetch(category):
+            return _entries('refresh', 500)
+
+        with patch('src.hatena_bookmark.store.fetch_hatena_hotentries_async', fetch), \
+                patch('src.hatena_bookmark.store._listeners',
+                      [lambda category, entries: threads.append(threading.current_thread())]):
+            snapshot = _run(refresh_snapshot_async('all'))
+        self.assertIs(get_snapshot('all'), snapshot)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    def test_stream_sends_ready_and_crossing(self):
+        """接続直後にreadyを送り、しきい値を超えたエントリーをcrossingで配信するテスト。"""
+        self.notifier.publish(_entries('before', 10))
+
+        async def scenario():
+            chunks = []
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    chunks.append(message['status'])
+                    return
+                text = message['body'].decode('utf-8')
+                chunks.append(text)
+                if 'event: ready' in text:
+                    # 購読の開始後に、しきい値を超えるエントリーを取り込む
+                    self.notifier.publish(_entries('after', 500))
+                elif 'event: crossing' in text:
+                    disconnect.set()
+
+            scope = {'type': 'http', 'path': '/hotentry/all/stream',
+                     'query_string': b'threshold=100', 'headers': [],
+                     'client': ('192.0.2.1', 1234)}
+            await asyncio.wait_for(application(scope, receive, send), timeout=5)
+            return chunks
+
+        chunks = _run(scenario())
+        self.assertEqual(chunks[0], 200)
+        self.assertIn('event: ready', chunks[1])
+        self.assertIn('event: crossing', chunks[2])
+        self.assertIn('https://after.example.com/0', chunks[2])
+        self.assertEqual(self.notifier.subscriber_count(), 0)
+
+    def test_wait_returns_changed_feed(self):
+        """ETagが異なればすぐにフィードを返し、同じなら待機後に304を返すテスト。"""
+        self.notifier.publish(_entries('wait', 500))
+        response = _run(_get('/hotentry/all/feed/wait?threshold=100&etag=old'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('https://wait.example.com/0', response.text)
+
+        etag = response.headers['etag']
+        response = _run(_get('/hotentry/all/feed/wait?threshold=100&timeout=0',
+                             {'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 304)
+
+    def test_wait_is_rate_limited(self):
+        """ロングポーリングもフィードと同じバケットで制限するテスト。"""
+        self.notifier.publish(_entries('limit', 500))
+        with patch('src.hatena_bookmark.ratelimit.feed_limiter',
+                   TokenBucketLimiter(rate=0.01, burst=2)):
+            statuses = [_run(_get('/hotentry/all/feed/wait?threshold=100')).status_code
+                        for _ in range(3)]
+        self.assertEqual(statuses[:2], [200, 200])
+        self.assertEqual(statuses[2], 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+"""共有キャッシュモジュールのテスト。
+
+このモジュールでは、キャッシュのバックエンドと、スナップショットの共有をテストします。
+Redisのバックエンドは、テスト内で起動するRESPのスタンドインサーバーに対してテストします。
+"""
+
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.hatena_bookmark.cache import (
+    FORMAT_VERSION,
+    CacheUnavailable,
+    FileCache,
+    NullCache,
+    RedisCache,
+    RedisError,
+    cache_get,
+    cache_set,
+    decode_value,
+    encode_value,
+    set_cache_backend,
+)
+from src.hatena_bookmark.models import Entry
+from src.hatena_bookmark.store import clear_snapshots, get_fresh_snapshot, install_entries
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    """AUTH・GET・SET（EX）・DELだけを扱うRedisのスタンドイン。"""
+
+    def handle(self):
+        self.server.connections += 1
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                self.server.closed += 1
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.wfile.write(self.server.command(args))
+
+
+class _StandInRedis(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _RespHandler)
+        self.connections = 0
+        self.closed = 0
+        self.data = {}
+        self.password = None
+
+    def command(self, args):
+        name = args[0].upper()
+        if name == b'AUTH':
+            if args[1].decode('utf-8') != self.password:
+                return b'-WRONGPASS invalid username-password pair\r\n'
+            return b'+OK\r\n'
+        if name == b'GET':
+            item = self.data.get(args[1])
+            if item is None or (item[0] and item[0] < time.time()):
+                return b'$-1\r\n'
+            return b'$%d\r\n%s\r\n' % (len(item[1]), item[1])
+        if name == b'SET':
+            expires = time.time() + int(args[4]) if len(args) > 3 else None
+            self.data[args[1]] = (expires, args[2])
+            return b'+OK\r\n'
+        if name == b'DEL':
+            return b':%d\r\n' % (self.data.pop(args[1], None) is not None)
+        return b'-ERR unknown command\r\n'
+
+
+class TestCache(unittest.TestCase):
+    """共有キャッシュモジュールのテストクラス。"""
+
+    def test_encode_value(self):
+        """値の変換と、バージョンが異なる値の扱いのテスト。"""
+        value = {'e': [['タイトル', 'https://example.com/', None, 120, '2024-01-01']]}
+        data = encode_value(value)
+        self.assertEqual(data[2], FORMAT_VERSION)
+        self.assertEqual(decode_value(data), value)
+        self.assertIsNone(decode_value(data[:2] + bytes([FORMAT_VERSION + 1]) + data[3:]))
+        self.assertIsNone(decode_value(b'garbage'))
+
+    def test_file_cache(self):
+        """ファイルのバックエンドのテスト。"""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = FileCache(directory)
+            cache.set('a', b'1')
+            cache.set('b', b'2', ttl=0.05)
+            self.assertEqual(cache.get('a'), b'1')
+            self.assertEqual(cache.get('b'), b'2')
+            time.sleep(0.06)
+            self.assertIsNone(cache.get('b'))
+            cache.delete('a')
+            self.assertIsNone(cache.get('a'))
+
+    def test_file_cache_sweep(self):
+        """書き込み時に、有効期限の切れたファイルと古い一時ファイルを削除するテスト。"""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = FileCache(directory, sweep_interval=0)
+            cache.set('expired', b'1', ttl=0.01)
+            cache.set('forever', b'2')
+            stale = os.path.join(directory, '.tmp-stale')
+            with open(stale, 'wb') as f:
+                f.write(b'partial')
+            os.utime(stale, (0, 0))
+            time.sleep(0.02)
+            cache.set('fresh', b'3', ttl=60)
+            self.assertEqual(len(os.listdir(directory)), 2)
+            self.assertEqual((cache.get('forever'), cache.get('fresh')), (b'2', b'3'))
+
+    def test_null_cache(self):
+        """共有しない場合は読み書きしないテスト。"""
+        previous = set_cache_backend(NullCache())
+        try:
+            cache_set('key', {'a': 1})
+            self.assertIsNone(cache_get('key'))
+        finally:
+            set_cache_backend(previous)
+
+    def test_redis_backoff(self):
+        """接続できなかった後は、一定時間接続を試みずにキャッシュにないものとして扱うテスト。"""
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        cache = RedisCache(f'redis://127.0.0.1:{port}/0', timeout=0.5, retry_interval=60)
+        with self.assertRaises(OSError):
+            cache.get('key')
+        with patch('src.hatena_bookmark.cache._RedisConnection') as connection:
+            with self.assertRaises(CacheUnavailable):
+                cache.get('key')
+            previous = set_cache_backend(cache)
+            try:
+                self.assertIsNone(cache_get('key'))
+                cache_set('key', 1)
+            finally:
+                set_cache_backend(previous)
+            connection.assert_not_called()
+
+    def test_redis_auth_failure(self):
+        """認証に失敗した接続は閉じ、一定時間接続を試みないテスト。"""
+        server = _StandInRedis()
+        server.password = 'right'
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        cache = RedisCache(f'redis://:wrong@127.0.0.1:{server.server_address[1]}/0',
+                           retry_interval=60)
+        try:
+            with self.assertRaises(RedisError):
+                cache.get('key')
+            with self.assertRaises(CacheUnavailable):
+                cache.get('key')
+            deadline = time.monotonic() + 5
+            while not server.closed and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual((server.connections, server.closed), (1, 1))
+        finally:
+            cache.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_redis_cache(self):
+        """RESPのスタンドインサーバーに対するRedisのバックエンドのテスト。"""
+        server = _StandInRedis()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        cache = RedisCache(f'redis://127.0.0.1:{server.server_address[1]}/0')
+        try:
+            cache.set('key', b'\x00value\r\n')
+            cache.set('expiring', b'x', ttl=60)
+            self.assertEqual(cache.get('key'), b'\x00value\r\n')
+            self.assertIsNone(cache.get('missing'))
+            cache.delete('key')
+            self.assertIsNone(cache.get('key'))
+            with self.assertRaises(RedisError):
+                cache.execute('FLUSHALL')
+            # 接続はプールされ、エラーの後も再利用される
+            self.assertEqual(cache.get('expiring'), b'x')
+            self.assertEqual(server.connections, 1)
+        finally:
+            cache.close()
+            server.shutdown()
+            server.server_close()
+
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
+    def test_shared_snapshot(self, mock_fetch):
+        """他のインスタンスが取得したスナップショットを使うテスト。"""
+        entries = [Entry('記事', 'https://example.com/1', '説明', 150, '2024-01-01T00:00:00+09:00')]
+        with tempfile.TemporaryDirectory() as directory:
+            previous = set_cache_backend(FileCache(directory))
+            try:
+                installed = install_entries('it', entries)
+                # 別のインスタンス（スナップショットを持たない）を模擬する
+                clear_snapshots()
+                snapshot = get_fresh_snapshot('it')
+            finally:
+                set_cache_backend(previous)
+                clear_snapshots()
+        mock_fetch.assert_not_called()
+        self.assertEqual(snapshot.digest, installed.digest)
+        self.assertEqual([entry.guid_html for entry in snapshot.entries],
+                         [entry.guid_html for entry in entries])
+
+
+if __name__ == '__main__':
+    unittest.main()
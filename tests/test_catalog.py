@@ -0,0 +1,90 @@
+"""名前付きフィードモジュールのテスト。
+
+このモジュールでは、設定の読み込みと、スナップショットの更新時のレンダリングをテストします。
+"""
+
+import unittest
+from datetime import datetime, timedelta
+
+from src.hatena_bookmark.catalog import FeedCatalog, parse_catalog
+from src.hatena_bookmark.models import Entry
+from src.hatena_bookmark.store import clear_snapshots, get_snapshot, install_entries, publish_snapshot
+
+
+class TestCatalog(unittest.TestCase):
+    """名前付きフィードモジュールのテストクラス。"""
+
+    def setUp(self):
+        """テスト前の準備。"""
+        clear_snapshots()
+        self.entries = [Entry.from_dict(data) for data in [
+            {'title': 'Pythonの記事', 'url': 'https://example.com/1', 'count': 300,
+             'date': '2023-01-01T00:00:00Z'},
+            {'title': '動画', 'url': 'https://www.youtube.com/watch?v=1', 'count': 500,
+             'date': '2023-01-02T00:00:00Z'},
+            {'title': '少ない記事', 'url': 'https://example.com/2', 'count': 10,
+             'date': '2023-01-03T00:00:00Z'},
+        ]]
+        self.feeds = parse_catalog({'feeds': [
+            {'name': 'tech-200', 'category': 'it', 'threshold': 200,
+             'exclude_domain': 'youtube.com'},
+            {'name': 'python', 'category': 'it', 'threshold': 1, 'q': 'Python'},
+            {'name': 'general', 'category': 'general', 'threshold': 1},
+        ]})
+
+    def test_parse_catalog(self):
+        """不正な定義を読み飛ばすテスト。"""
+        feeds = parse_catalog({'feeds': [
+            {'name': 'ok', 'threshold': 50},
+            {'name': 'ok', 'threshold': 100},
+            {'name': 'bad name', 'threshold': 100},
+            {'name': 'unknown', 'category': 'nothing'},
+            {'name': 'text', 'threshold': '100'},
+        ]})
+        self.assertEqual(list(feeds), ['ok'])
+        self.assertEqual(feeds['ok'].category, 'all')
+        self.assertEqual(feeds['ok'].threshold, 50)
+
+    def test_render_on_install(self):
+        """スナップショットの更新時にカテゴリーの名前付きフィードだけをレンダリングするテスト。"""
+        catalog = FeedCatalog(self.feeds, 'https://feeds.example.com/')
+        install_entries('it', self.entries)
+        catalog.render('it', get_snapshot('it'))
+
+        rendered, snapshot = catalog.lookup('tech-200')
+        self.assertIs(snapshot, get_snapshot('it'))
+        body = rendered.body.decode('utf-8')
+        self.assertIn('Pythonの記事', body)
+        self.assertNotIn('youtube.com', body)
+        self.assertNotIn('少ない記事', body)
+        self.assertIn('https://feeds.example.com/f/tech-200', body)
+
+        rendered, _ = catalog.lookup('python')
+        self.assertNotIn('動画', rendered.body.decode('utf-8'))
+        self.assertEqual(catalog.lookup('general'), (None, None))
+
+    def test_lookup_requires_current_snapshot(self):
+        """スナップショットが更新された後や古くなった後はレンダリング済みのものを使わないテスト。"""
+        catalog = FeedCatalog(self.feeds, 'https://feeds.example.com')
+        install_entries('it', self.entries)
+        catalog.render('it', get_snapshot('it'))
+
+        install_entries('it', self.entries[:1])
+        self.assertEqual(catalog.lookup('tech-200'), (None, None))
+
+        catalog.render('it', get_snapshot('it'))
+        self.assertIsNotNone(catalog.lookup('tech-200')[0])
+        publish_snapshot('it', get_snapshot('it')._replace(
+            last_update=datetime.now() - timedelta(days=1)))
+        self.assertEqual(catalog.lookup('tech-200'), (None, None))
+
+    def test_render_requires_base_url(self):
+        """公開URLが設定されていなければレンダリングしないテスト。"""
+        catalog = FeedCatalog(self.feeds)
+        install_entries('it', self.entries)
+        catalog.render('it', get_snapshot('it'))
+        self.assertEqual(catalog.lookup('tech-200'), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""CDN向けのキャッシュ制御モジュールのテスト。
+
+このモジュールでは、キャッシュヘッダーの計算とスナップショットの変化によるパージをテストします。
+"""
+
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from flask import Flask
+from src.hatena_bookmark import cdn
+from src.hatena_bookmark.feed import get_hotentry_feed
+from src.hatena_bookmark.models import Entry
+from src.hatena_bookmark.refresh import refresh_policy
+from src.hatena_bookmark.store import Snapshot, clear_snapshots
+
+
+def _entry(url, count):
+    return Entry('title', url, None, count, None)
+
+
+class TestCdn(unittest.TestCase):
+    """キャッシュ制御のテストクラス。"""
+
+    def setUp(self):
+        """テスト前の準備。"""
+        self.purger = cdn.RecordingPurger()
+        self.previous_purger = cdn.set_purger(self.purger)
+
+    def tearDown(self):
+        """テスト後のクリーンアップ。"""
+        cdn.set_purger(self.previous_purger)
+
+    @patch('src.hatena_bookmark.store.SNAPSHOT_MAX_AGE', 300)
+    def test_feed_cache_headers_follow_snapshot_age(self):
+        """max-ageが次の更新までの残り時間になり、Surrogate-Keyが付くことのテスト。"""
+        snapshot = Snapshot((), None, 1, datetime.now() - timedelta(seconds=100), None)
+
+        headers = cdn.feed_cache_headers(['it'], [100, 200], {'it': snapshot})
+
+        self.assertRegex(headers['Cache-Control'],
+                         r'^public, max-age=(199|200), stale-while-revalidate=\d+, stale-if-error=\d+$')
+        self.assertEqual(headers['Surrogate-Key'], 'feed hotentry-it hotentry-it-t100 hotentry-it-t200')
+        # 更新間隔を過ぎたスナップショットはmax-age=0
+        stale = Snapshot((), None, 2, datetime.now() - timedelta(seconds=400), None)
+        self.assertIn('max-age=0,', cdn.feed_cache_headers(['it'], [100], {'it': stale})['Cache-Control'])
+
+    @patch('src.hatena_bookmark.store.SNAPSHOT_MAX_AGE', 300)
+    def test_stretched_interval_extends_max_age(self):
+        """更新間隔が延びている間は、総合のmax-ageもその間隔まで延びることのテスト。"""
+        snapshot = Snapshot((), None, 1, datetime.now() - timedelta(seconds=400), None)
+        with patch.object(refresh_policy, 'current_interval', return_value=1200):
+            self.assertIn(cdn.snapshot_max_age('all', snapshot), (799, 800))
+            # その他のカテゴリーはSNAPSHOT_MAX_AGEで更新される
+            self.assertEqual(cdn.snapshot_max_age('it', snapshot), 0)
+
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
+    def test_feed_response_has_cache_headers(self, mock_fetch):
+        """フィードのレスポンスにキャッシュヘッダーが付くことのテスト。"""
+        clear_snapshots()
+        mock_fetch.return_value = [_entry('https://example.com/1', 300)]
+        with Flask(__name__).test_request_context('/hotentry/all/feed?threshold=200'):
+            response = get_hotentry_feed(200)
+
+        self.assertIn('stale-if-error', response.headers['Cache-Control'])
+        self.assertEqual(response.headers['Surrogate-Key'], 'feed hotentry-all hotentry-all-t200')
+
+    def test_purge_only_when_snapshot_changes(self):
+        """スナップショットの内容が変わったときだけパージすることのテスト。"""
+        entries = [_entry('https://example.com/1', 100)]
+        cdn.purge_on_change('game', entries)
+        cdn.purge_on_change('game', list(entries))
+        self.assertEqual(self.purger.calls, [])
+
+        cdn.purge_on_change('game', [_entry('https://example.com/1', 120)])
+        self.assertEqual(self.purger.calls, [['hotentry-game']])
+
+
+if __name__ == '__main__':
+    unittest.main()
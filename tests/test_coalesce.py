@@ -0,0 +1,151 @@
+"""取得の集約モジュールのテスト。
+
+このモジュールでは、同時に呼ばれた処理が1回にまとめられることをテストします。
+"""
+
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+
+from src.hatena_bookmark import store
+from src.hatena_bookmark.coalesce import SingleFlight
+from src.hatena_bookmark.models import Entry
+
+
+class TestSingleFlight(unittest.TestCase):
+    """シングルフライトのテストクラス。"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """スレッドとコルーチンからの同時呼び出しが1回の実行を共有することのテスト。"""
+        flight = SingleFlight('test')
+        started = threading.Event()
+        release = threading.Event()
+        executions = []
+
+        def fetch():
+            executions.append(1)
+            started.set()
+            release.wait(5)
+            return ['entry']
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('all', fetch)))
+        leader.start()
+        self.assertTrue(started.wait(5))
+
+        followers = [threading.Thread(target=lambda: results.append(flight.do('all', fetch)))
+                     for _ in range(3)]
+        for thread in followers:
+            thread.start()
+
+        async def join_async():
+            async def never_called():
+                raise AssertionError('実行中の処理に合流するはず')
+            return await flight.do_async('all', never_called)
+
+        async def scenario():
+            task = asyncio.ensure_future(join_async())
+            # 合流の登録を待ってから実行中の処理を完了させる
+            while flight.stats()['coalesced'] < 4:
+                await asyncio.sleep(0.01)
+            release.set()
+            return await task
+
+        results.append(asyncio.run(scenario()))
+        leader.join(5)
+        for thread in followers:
+            thread.join(5)
+
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(results, [['entry']] * 5)
+        self.assertEqual(flight.stats(), {'calls': 5, 'executions': 1, 'coalesced': 4, 'in_flight': 0})
+
+    def test_error_is_shared_and_next_call_retries(self):
+        """失敗は待機中の呼び出しにも伝わり、次の呼び出しで再実行されることのテスト。"""
+        flight = SingleFlight('test')
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def failing_fetch():
+            started.set()
+            release.wait(5)
+            raise ValueError('upstream down')
+
+        def call():
+            try:
+                flight.do('all', failing_fetch)
+            except ValueError as e:
+                errors.append(str(e))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        self.assertTrue(started.wait(5))
+        follower = threading.Thread(target=call)
+        follower.start()
+        while flight.stats()['coalesced'] < 1:
+            threading.Event().wait(0.01)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(errors, ['upstream down'] * 2)
+        self.assertEqual(flight.do('all', lambda: 'ok'), 'ok')
+        self.assertEqual(flight.stats()['executions'], 2)
+
+    def test_cancelled_leader_lets_waiter_retry(self):
+        """コルーチンの実行者が取り消されたら、待機中のスレッドが実行し直すことのテスト。"""
+        flight = SingleFlight('test')
+        results = []
+
+        async def scenario():
+            async def slow_fetch():
+                await asyncio.sleep(10)
+
+            task = asyncio.ensure_future(flight.do_async('all', slow_fetch))
+            await asyncio.sleep(0.01)
+            waiter = threading.Thread(
+                target=lambda: results.append(flight.do('all', lambda: 'retried')))
+            waiter.start()
+            while flight.stats()['coalesced'] < 1:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return waiter
+
+        waiter = asyncio.run(scenario())
+        waiter.join(5)
+        self.assertEqual(results, ['retried'])
+        self.assertEqual(flight.stats()['executions'], 2)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+
+class TestSnapshotListeners(unittest.TestCase):
+    """スナップショットの更新の通知のテストクラス。"""
+
+    def test_background_listeners_do_not_block_install(self):
+        """バックグラウンドのリスナーの完了を待たずにスナップショットを返すことのテスト。"""
+        release = threading.Event()
+        calls = []
+
+        def slow_listener(category, entries):
+            release.wait(5)
+            calls.append((category, len(entries), threading.current_thread().name))
+
+        entries = [Entry('記事', 'https://example.com/1', '', 10, '2023-01-01T00:00:00Z')]
+        with patch.object(store, '_listeners', []), \
+                patch.object(store, '_background_listeners', [slow_listener]):
+            snapshot = store.install_entries('listener-test', entries)
+            self.assertIs(store.get_snapshot('listener-test'), snapshot)
+            self.assertEqual(calls, [])
+            release.set()
+            store._listener_executor.submit(lambda: None).result(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0][:2], ('listener-test', 1))
+        self.assertTrue(calls[0][2].startswith('snapshot-listener'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""ドメインによる絞り込みモジュールのテスト。
+
+このモジュールでは、include_domain / exclude_domain の指定によるエントリーの絞り込みをテストします。
+"""
+
+import unittest
+from src.hatena_bookmark.domains import DomainSpec, compile_domain_filter, parse_domain_filter
+from src.hatena_bookmark.models import Entry
+
+
+def _entry(url):
+    return Entry('title', url, None, 100, None)
+
+
+class TestDomainFilter(unittest.TestCase):
+    """ドメインによる絞り込みのテストクラス。"""
+
+    def setUp(self):
+        """テスト前の準備。"""
+        self.entries = [
+            _entry('https://anond.hatelabo.jp/20240101000000'),
+            _entry('https://www.youtube.com/watch?v=abc'),
+            _entry('https://github.com/python/cpython'),
+            _entry('https://zenn.dev/articles/abc'),
+            _entry('https://note.com/hatena/n/n123'),
+            _entry('https://note.com/other/n/n456'),
+        ]
+
+    def _urls(self, include=(), exclude=()):
+        spec = parse_domain_filter(list(include), list(exclude))
+        return [entry.url for entry in compile_domain_filter(spec).filter(self.entries)]
+
+    def test_exclude_matches_subdomains(self):
+        """除外の指定がサブドメインにも一致することのテスト。"""
+        urls = self._urls(exclude=['anond.hatelabo.jp,YouTube.com'])
+        self.assertEqual(len(urls), 4)
+        self.assertNotIn('https://www.youtube.com/watch?v=abc', urls)
+
+    def test_include_with_path_prefix(self):
+        """ドメインとパスの前方一致による指定のテスト。"""
+        self.assertEqual(self._urls(include=['github.com', 'https://zenn.dev/']),
+                         ['https://github.com/python/cpython', 'https://zenn.dev/articles/abc'])
+        self.assertEqual(self._urls(include=['note.com/hatena']), ['https://note.com/hatena/n/n123'])
+        self.assertEqual(self._urls(include=['note.com'], exclude=['note.com/other']),
+                         ['https://note.com/hatena/n/n123'])
+        # ホスト名は大文字小文字を区別せず、パスは区別する
+        self.assertEqual(self._urls(include=['Note.COM/hatena']), ['https://note.com/hatena/n/n123'])
+        self.assertEqual(self._urls(include=['note.com/Hatena']), [])
+
+    def test_spec_is_normalized_and_memoized(self):
+        """同じ指定は表記や順序が違っても同じマッチャーを再利用することのテスト。"""
+        first = parse_domain_filter(['zenn.dev,GitHub.com'], [])
+        second = parse_domain_filter(['github.com', 'zenn.dev'], [])
+        self.assertEqual(first, DomainSpec((('github.com', ''), ('zenn.dev', '')), ()))
+        self.assertEqual(first, second)
+        self.assertIs(compile_domain_filter(first), compile_domain_filter(second))
+        self.assertIsNone(parse_domain_filter([], ['']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+"""記事のメタデータの取得モジュールのテスト。
+
+このモジュールでは、ローカルのHTTPサーバーの記事ページからメタデータを取得し、
+同時取得数の制限、タイムアウト、保存した結果の再利用をテストします。
+"""
+
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from src.hatena_bookmark.cache import FileCache
+from src.hatena_bookmark.enrich import Enricher, detect_encoding, parse_metadata
+from src.hatena_bookmark.feed import _render_item, compute_feed_etag, enrichment_digest
+from src.hatena_bookmark.models import Entry
+
+PAGE = """<!DOCTYPE html>
+<html><head>
+<meta property="og:image" content="/images/{name}.png">
+<meta property="og:description" content="記事 {name} の&amp;説明">
+</head><body><p>本文</p></body></html>"""
+
+# Content-Typeにcharsetがなく、metaタグで文字コードを指定しているページ
+SJIS_PAGE = """<html><head><meta charset="Shift_JIS">
+<meta property="og:description" content="日本語の説明">
+</head><body></body></html>"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """パスに応じて記事ページ、遅いページ、HTMLではないページを返すサーバー。"""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path.startswith('/slow'):
+                time.sleep(1.0)
+            time.sleep(0.05)
+            if self.path.startswith('/image'):
+                body, content_type = b'\x89PNG', 'image/png'
+            elif self.path.startswith('/sjis'):
+                body, content_type = SJIS_PAGE.encode('shift_jis'), 'text/html'
+            else:
+                name = self.path.strip('/')
+                body, content_type = PAGE.format(name=name).encode('utf-8'), 'text/html; charset=utf-8'
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class TestEnrich(unittest.TestCase):
+    """記事のメタデータの取得モジュールのテストクラス。"""
+
+    def setUp(self):
+        """テスト前の準備。"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.active = 0
+        self.server.max_active = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.enrichers = []
+
+    def tearDown(self):
+        """テスト後のクリーンアップ。"""
+        for enricher in self.enrichers:
+            enricher.shutdown()
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def _enricher(self, **kwargs):
+        enricher = Enricher(FileCache(self.directory.name), **kwargs)
+        self.enrichers.append(enricher)
+        return enricher
+
+    def _wait(self, enricher, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while enricher.status()['pending'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_parse_metadata(self):
+        """OGPのメタデータを取り出すテスト。"""
+        result = parse_metadata(PAGE.format(name='a'), 'https://example.com/articles/1')
+        self.assertEqual(result.image, 'https://example.com/images/a.png')
+        self.assertEqual(result.description, '記事 a の&説明')
+        self.assertEqual(parse_metadata('<html><body></body></html>', 'https://example.com/'),
+                         (None, None))
+
+    def test_fetch_with_limits_and_reuse(self):
+        """同じホストへの同時取得数を制限し、保存した結果を再起動後に再利用するテスト。"""
+        enricher = self._enricher(workers=8, per_host=2)
+        urls = [f'{self.base_url}/{number}' for number in range(8)]
+        self.assertEqual(enricher.submit(urls), 8)
+        # 取得中のURLは重複して依頼しない
+        self.assertEqual(enricher.submit(urls), 0)
+        self.assertIsNone(enricher.get(urls[0]))
+        self._wait(enricher)
+
+        self.assertLessEqual(self.server.max_active, 2)
+        self.assertEqual(enricher.get(urls[3]).image, f'{self.base_url}/images/3.png')
+        self.assertEqual(enricher.status()['fetched'], 8)
+        # 世代は依頼ごとに1つだけ進み、使われなくなったホストのセマフォは残らない
+        self.assertEqual(enricher.generation, 1)
+        self.assertEqual(enricher._host_limits, {})
+
+        # 新しいプロセスでも、保存した結果があれば取得しない
+        restarted = self._enricher()
+        restarted.submit(urls)
+        self._wait(restarted)
+        self.assertEqual(len(self.server.requests), 8)
+        self.assertEqual(restarted.get(urls[5]).description, '記事 5 の&説明')
+        self.assertEqual(restarted.status()['loaded'], 8)
+        self.assertEqual(restarted.generation, 1)
+
+    def test_charset(self):
+        """Content-Typeにcharsetがなければ、metaタグの文字コードで読むテスト。"""
+        enricher = self._enricher()
+        enricher.submit([f'{self.base_url}/sjis'])
+        self._wait(enricher)
+        self.assertEqual(enricher.get(f'{self.base_url}/sjis').description, '日本語の説明')
+
+    def test_detect_encoding(self):
+        """metaタグがなければUTF-8として読めるかを確かめ、読めなければ推定するテスト。"""
+        text = '<html><head><title>日本語のページ</title></head>'
+        self.assertEqual(detect_encoding(text.encode('utf-8')), 'utf-8')
+        # 読み込みを打ち切った位置で途切れた文字があってもUTF-8とする
+        self.assertEqual(detect_encoding(text.encode('utf-8')[:-len('</title></head>') - 1]),
+                         'utf-8')
+        self.assertEqual(detect_encoding(b'<meta http-equiv="Content-Type" '
+                                         b'content="text/html; charset=EUC-JP">'), 'EUC-JP')
+        self.assertEqual(detect_encoding(b'<meta charset="unknown-charset">'), 'utf-8')
+
+    def test_timeout_and_non_html(self):
+        """タイムアウトしたページとHTMLではないページは失敗として記録するテスト。"""
+        enricher = self._enricher(timeout=0.3)
+        enricher.submit([f'{self.base_url}/slow', f'{self.base_url}/image.png'])
+        self._wait(enricher)
+        self.assertIsNone(enricher.get(f'{self.base_url}/slow'))
+        self.assertIsNone(enricher.get(f'{self.base_url}/image.png'))
+        self.assertEqual(enricher.status()['failed'], 2)
+        self.assertEqual(enricher.generation, 0)
+
+    def test_render_uses_cached_enrichment(self):
+        """レンダリングは取得済みのメタデータだけを使うテスト。"""
+        enricher = self._enricher()
+        entry = Entry.from_dict({'title': '記事', 'url': f'{self.base_url}/x', 'count': 10})
+        with patch('src.hatena_bookmark.enrich.enricher', enricher):
+            self.assertNotIn('media:thumbnail', _render_item(entry))
+            self.assertEqual(enrichment_digest([entry]), '')
+            enricher.submit([entry.url])
+            self._wait(enricher)
+            xml = _render_item(entry)
+            enrichment = enrichment_digest([entry])
+        # メタデータが付いたフィードは、同じアイテムでもETagが変わる
+        self.assertNotEqual(compute_feed_etag([entry], 0, enrichment=enrichment),
+                            compute_feed_etag([entry], 0))
+        self.assertIn(f'<media:thumbnail url="{self.base_url}/images/x.png"/>', xml)
+        self.assertIn('記事 x の&amp;説明', xml)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,7 +6,25 @@
 import unittest
 from unittest.mock import patch, MagicMock
 from flask import Flask, Response
-from src.hatena_bookmark.feed import generate_rss_feed, get_hotentry_feed
+import json
+from src.hatena_bookmark.feed import (
+    _render_item,
+    compute_feed_etag,
+    filter_entries,
+    generate_rss_feed,
+    get_batch_feeds,
+    get_hotentry_feed,
+    render_threshold_feeds,
+)
+from src.hatena_bookmark.models import Entry
+from datetime import datetime, timedelta
+from src.hatena_bookmark.store import (
+    DEGRADED_MAX_STALENESS,
+    clear_snapshots,
+    degraded_status,
+    get_snapshot,
+    publish_snapshot,
+)
 
 
 class TestFeed(unittest.TestCase):
@@ -19,9 +37,11 @@ class TestFeed(unittest.TestCase):
         self.app_context.push()
         self.request_context = self.app.test_request_context('http://example.com/hotentry/all/feed?threshold=200')
         self.request_context.push()
+        # 前のテストのスナップショットを使わないようにする
+        clear_snapshots()
         
         # テスト用のエントリーデータ
-        self.test_entries = [
+        self.test_entries = [Entry.from_dict(data) for data in [
             {
                 'title': 'テスト記事1',
                 'url': 'https://example.com/1',
@@ -36,13 +56,19 @@ class TestFeed(unittest.TestCase):
                 'count': 300,
                 'date': '2023-01-02T00:00:00Z'
             }
-        ]
+        ]]
 
     def tearDown(self):
         """テスト後のクリーンアップ。"""
         self.request_context.pop()
         self.app_context.pop()
 
+    def _age_snapshot(self, category, seconds):
+        """スナップショットの取得日時を指定した秒数だけ過去にする。"""
+        snapshot = get_snapshot(category)
+        publish_snapshot(category, snapshot._replace(
+            last_update=datetime.now() - timedelta(seconds=seconds)))
+
     def test_generate_rss_feed(self):
         """RSSフィード生成のテスト。"""
         # テスト対象の関数を実行
@@ -57,7 +83,7 @@ class TestFeed(unittest.TestCase):
         self.assertIn('ブックマーク数: 200', result)
         self.assertIn('ブックマーク数: 300', result)
 
-    @patch('src.hatena_bookmark.feed.fetch_hatena_hotentries')
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
     def test_get_hotentry_feed_success(self, mock_fetch):
         """ホットエントリーフィード取得成功のテスト。"""
         # モックの設定
@@ -72,15 +98,15 @@ class TestFeed(unittest.TestCase):
         self.assertEqual(result.status_code, 200)
         mock_fetch.assert_called_once()
 
-    @patch('src.hatena_bookmark.feed.fetch_hatena_hotentries')
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
     def test_get_hotentry_feed_filtering(self, mock_fetch):
         """ブックマーク数によるフィルタリングのテスト。"""
         # モックの設定
-        mock_fetch.return_value = [
+        mock_fetch.return_value = [Entry.from_dict(data) for data in [
             {'title': '記事1', 'url': 'https://example.com/1', 'description': '説明1', 'count': 100, 'date': '2023-01-01T00:00:00Z'},
             {'title': '記事2', 'url': 'https://example.com/2', 'description': '説明2', 'count': 200, 'date': '2023-01-02T00:00:00Z'},
             {'title': '記事3', 'url': 'https://example.com/3', 'description': '説明3', 'count': 300, 'date': '2023-01-03T00:00:00Z'}
-        ]
+        ]]
         
         # テスト対象の関数を実行（しきい値200）
         result = get_hotentry_feed(200)
@@ -91,7 +117,53 @@ class TestFeed(unittest.TestCase):
         self.assertIn('<title>記事2</title>', content)
         self.assertIn('<title>記事3</title>', content)
 
-    @patch('src.hatena_bookmark.feed.fetch_hatena_hotentries')
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
+    def test_get_hotentry_feed_not_modified(self, mock_fetch):
+        """If-None-MatchがETagと一致する場合に304を返すことのテスト。"""
+        # モックの設定
+        mock_fetch.return_value = self.test_entries
+        etag = get_hotentry_feed(200).get_etag()[0]
+        
+        # 同じETagを指定して再度リクエスト
+        with self.app.test_request_context(
+                'http://example.com/hotentry/all/feed?threshold=200',
+                headers={'If-None-Match': f'W/"{etag}"'}), \
+                patch('src.hatena_bookmark.feed.encode_feed') as mock_encode:
+            result = get_hotentry_feed(200)
+        
+        # 検証（304ではフィードの本文を生成しない）
+        self.assertEqual(result.status_code, 304)
+        self.assertEqual(result.get_etag(), (etag, True))
+        self.assertIn('max-age', result.headers['Cache-Control'])
+        mock_encode.assert_not_called()
+
+    @patch('src.hatena_bookmark.feed._render_item', wraps=_render_item)
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
+    def test_get_hotentry_feed_query(self, mock_fetch, mock_render_item):
+        """キーワードとしきい値で絞り込み、同じスナップショットではレンダリングを再利用することのテスト。"""
+        # モックの設定
+        mock_fetch.return_value = [Entry.from_dict(data) for data in [
+            {'title': '生成AIの活用', 'url': 'https://example.com/1', 'description': '説明', 'count': 300},
+            {'title': '生成AI入門', 'url': 'https://example.com/2', 'description': '説明', 'count': 100},
+            {'title': '料理のレシピ', 'url': 'https://example.com/3', 'description': '説明', 'count': 500},
+        ]]
+        
+        # テスト対象の関数を実行（しきい値200、キーワード「生成AI」）
+        first = get_hotentry_feed(200, query='生成AI')
+        second = get_hotentry_feed(200, query='生成AI')
+        
+        # 検証（記事1のみが含まれ、2回目はアイテムをレンダリングしない）
+        content = second.get_data(as_text=True)
+        self.assertIn('<title>生成AIの活用</title>', content)
+        self.assertNotIn('<title>生成AI入門</title>', content)
+        self.assertNotIn('<title>料理のレシピ</title>', content)
+        self.assertIn('<title>Hatena Hotentry (Threshold: 200) [生成ai]</title>', content)
+        self.assertEqual(mock_render_item.call_count, 1)
+        self.assertEqual(first.get_etag(), second.get_etag())
+        self.assertNotEqual(first.get_etag(), get_hotentry_feed(200).get_etag())
+        mock_fetch.assert_called_once()
+
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
     def test_get_hotentry_feed_error(self, mock_fetch):
         """エラー発生時のテスト。"""
         # モックの設定
@@ -109,6 +181,70 @@ class TestFeed(unittest.TestCase):
         self.assertIn('<title>エラーが発生しました</title>', content)
         self.assertIn('テストエラー', content)
 
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
+    def test_get_hotentry_feed_degraded(self, mock_fetch):
+        """取得に失敗した場合に古いスナップショットで代替するテスト。"""
+        mock_fetch.return_value = self.test_entries
+        get_hotentry_feed(200)
+        served = degraded_status()['served'].get('all', 0)
+
+        # スナップショットを古くしてから取得に失敗させる
+        mock_fetch.side_effect = Exception('テストエラー')
+        self._age_snapshot('all', 3600)
+        result = get_hotentry_feed(200)
+        self.assertEqual(result.status_code, 200)
+        self.assertIn('テスト記事1', result.get_data(as_text=True))
+        self.assertIn('Response is Stale', result.headers['Warning'])
+        self.assertGreaterEqual(int(result.headers['X-Feed-Stale-Seconds']), 3600)
+        self.assertIn('max-age=0', result.headers['Cache-Control'])
+        self.assertEqual(degraded_status()['served']['all'], served + 1)
+        self.assertIn('all', degraded_status()['failing'])
+
+        # 直後のリクエストは再取得を試みずに代替する
+        get_hotentry_feed(200)
+        self.assertEqual(mock_fetch.call_count, 2)
+
+        # 最大経過秒数を超えたら代替せずにエラーを返す
+        self._age_snapshot('all', DEGRADED_MAX_STALENESS + 1)
+        result = get_hotentry_feed(200)
+        self.assertEqual(result.status_code, 500)
+
+    def test_render_threshold_feeds(self):
+        """複数しきい値の一括生成が個別のフィルタリングと一致することのテスト。"""
+        entries = [Entry(f'記事{i}', f'https://example.com/{i}', '説明', count, None)
+                   for i, count in enumerate([120, 600, 80, 250, 250])]
+        
+        # テスト対象の関数を実行
+        feeds = render_threshold_feeds(entries, [100, 200, 500], 'http://example.com',
+                                       lambda threshold: f'http://example.com/?t={threshold}')
+        
+        # 検証（ブックマーク数の降順で、しきい値ごとに先頭からの件数だけが異なる）
+        for threshold, size in [(100, 4), (200, 3), (500, 1)]:
+            xml, etag, items = feeds[threshold]
+            expected = filter_entries(entries, threshold)
+            self.assertEqual(items, size)
+            self.assertEqual(etag, compute_feed_etag(expected, threshold))
+            self.assertEqual(xml.count('<item>'), size)
+            self.assertIn(f'<title>Hatena Hotentry (Threshold: {threshold})</title>', xml)
+        self.assertLess(feeds[200][0].index('記事1'), feeds[200][0].index('記事3'))
+
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
+    def test_get_batch_feeds(self, mock_fetch):
+        """バッチ取得でカテゴリーごとにデータを1回だけ取得することのテスト。"""
+        # モックの設定
+        mock_fetch.return_value = self.test_entries
+        
+        # テスト対象の関数を実行
+        result = get_batch_feeds(['all', 'it'], [200, 300])
+        
+        # 検証
+        self.assertEqual(result.status_code, 200)
+        feeds = json.loads(result.get_data(as_text=True))['feeds']
+        self.assertEqual([(feed['category'], feed['threshold'], feed['items']) for feed in feeds],
+                         [('all', 200, 2), ('all', 300, 1), ('it', 200, 2), ('it', 300, 1)])
+        self.assertEqual(feeds[2]['url'], 'http://example.com/hotentry/it/feed?threshold=200')
+        self.assertEqual(mock_fetch.call_count, 2)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
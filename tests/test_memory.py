@@ -0,0 +1,131 @@
+"""メモリ使用量の計測と予算の管理モジュールのテスト。
+
+このモジュールでは、メモリ使用量の見積もり、件数とバイト数を数えるLRU、
+予算を超えたときのキャッシュの破棄、診断用のトークンの確認とレポートをテストします。
+"""
+
+import threading
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+from src.hatena_bookmark.feed import _feed_cache
+from src.hatena_bookmark.memory import (
+    MemoryBudget,
+    SizedLRU,
+    check_admin_token,
+    estimate_size,
+    memory_report,
+)
+
+
+class _Slotted:
+    """``__slots__`` を持つテスト用のクラス。"""
+
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+
+class TestMemory(unittest.TestCase):
+    """メモリ使用量の計測と予算の管理モジュールのテストクラス。"""
+
+    def test_estimate_size(self):
+        """参照しているオブジェクトを含めて見積もり、同じオブジェクトは1回だけ数えるテスト。"""
+        text = 'x' * 10000
+        self.assertGreater(estimate_size([text]), 10000)
+        self.assertLess(estimate_size([text, text]), 20000)
+        self.assertGreater(estimate_size({'key': (text,)}), 10000)
+        self.assertGreater(estimate_size(_Slotted(text)), 10000)
+
+    def test_sized_lru(self):
+        """件数の上限を超えたら古いものから破棄し、バイト数を数え直すテスト。"""
+        cache = SizedLRU(max_entries=2)
+        cache.put('a', 'A', 10)
+        cache.put('b', 'B', 20)
+        self.assertEqual(cache.get('a'), 'A')
+        cache.put('c', 'C', 30)
+        self.assertEqual(list(cache), ['a', 'c'])
+        self.assertEqual(cache.bytes, 40)
+        cache.put('a', 'A2', 5)
+        self.assertEqual((cache.get('a'), cache.bytes, cache.evictions), ('A2', 35, 1))
+        self.assertIsNone(cache.get('b'))
+
+    def test_budget_eviction(self):
+        """キャッシュの合計が予算を超えたら、最も大きいキャッシュから古い順に破棄するテスト。"""
+        budget = MemoryBudget(100)
+        lock = threading.Lock()
+        large, small = SizedLRU(10), SizedLRU(10)
+        budget.register('large', large, lock)
+        budget.register('small', small, lock)
+        for number in range(3):
+            large.put(number, 'x', 30)
+        small.put('s', 'y', 20)
+        budget.enforce()
+        self.assertEqual((list(large), list(small)), ([1, 2], ['s']))
+
+        # スナップショットが大きくなると、キャッシュに使えるバイト数が減る（下限あり）
+        budget.record_snapshot('all', 95)
+        self.assertEqual(budget.cache_limit(), 10)
+        self.assertEqual(large.bytes + small.bytes, 0)
+        status = budget.status()
+        self.assertEqual(status['snapshot_bytes'], {'all': 95})
+        self.assertEqual(status['caches']['large']['evictions'], 3)
+        self.assertEqual(status['budget_evictions'], 4)
+
+    def test_budget_sources(self):
+        """破棄できないものの見積もりを予算から差し引き、見積もれないものは除くテスト。"""
+        budget = MemoryBudget(100)
+        cache = SizedLRU(10)
+        budget.register('cache', cache, threading.Lock())
+        budget.add_source('fixed', lambda: (3, 60))
+        budget.add_source('broken', lambda: 1 / 0)
+        for number in range(3):
+            cache.put(number, 'x', 20)
+        budget.measure_sources()
+        budget.enforce()
+        self.assertEqual(budget.cache_limit(), 40)
+        self.assertEqual(list(cache), [1, 2])
+        self.assertEqual(budget.status()['sources'], {'fixed': {'entries': 3, 'bytes': 60}})
+
+    def test_budget_disabled(self):
+        """予算が0なら破棄しないテスト。"""
+        budget = MemoryBudget(0)
+        cache = SizedLRU(10)
+        budget.register('cache', cache, threading.Lock())
+        cache.put('a', 'A', 10 ** 9)
+        budget.enforce()
+        self.assertEqual(len(cache), 1)
+
+    def test_admin_token(self):
+        """トークンが設定されていて一致する場合だけ許可するテスト。"""
+        with patch('src.hatena_bookmark.memory.ADMIN_TOKEN', ''):
+            self.assertFalse(check_admin_token('Bearer ', ''))
+        with patch('src.hatena_bookmark.memory.ADMIN_TOKEN', 'secret'):
+            self.assertTrue(check_admin_token('Bearer secret'))
+            self.assertTrue(check_admin_token(None, 'secret'))
+            self.assertFalse(check_admin_token('Bearer wrong', 'secret'))
+            self.assertFalse(check_admin_token(None, None))
+
+    def test_memory_report(self):
+        """追跡中は割り当ての多い箇所を返すテスト。"""
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        try:
+            payload = [bytearray(1024) for _ in range(100)]
+            report = memory_report(limit=5)
+            self.assertTrue(report['tracing'])
+            self.assertLessEqual(len(report['top_allocations']), 5)
+            self.assertTrue(any(__file__ in allocation['location'][0]
+                                for allocation in report['top_allocations']))
+            self.assertEqual(report['caches']['feed_items']['entries'], len(_feed_cache))
+            del payload
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
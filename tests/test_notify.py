@@ -0,0 +1,69 @@
+"""通知ハブのテスト。
+
+このモジュールでは、しきい値ごとのフィード変化の配信機能をテストします。
+"""
+
+import asyncio
+import threading
+import unittest
+from src.hatena_bookmark.models import Entry
+from src.hatena_bookmark.notify import FeedNotifier
+
+
+def _entry(url, count):
+    return Entry(url, url, '', count, '2023-01-01T00:00:00Z')
+
+
+class TestFeedNotifier(unittest.TestCase):
+    """通知ハブのテストクラス。"""
+
+    def test_publish_notifies_crossed_entries(self):
+        """しきい値を新たに超えたエントリーが通知されることのテスト。"""
+        notifier = FeedNotifier()
+        notifier.publish([_entry('https://example.com/1', 250)])
+
+        async def scenario():
+            subscription = notifier.subscribe(200)
+            # リフレッシャーと同じく別スレッドから取り込む
+            thread = threading.Thread(target=notifier.publish, args=([
+                _entry('https://example.com/1', 250),
+                _entry('https://example.com/2', 210),
+                _entry('https://example.com/3', 50),
+            ],))
+            thread.start()
+            event = await subscription.get(timeout=5)
+            thread.join()
+            notifier.unsubscribe(subscription)
+            return event
+
+        event = asyncio.run(scenario())
+
+        # 検証（既存のエントリー1は含まれず、エントリー2のみ）
+        self.assertIsNotNone(event)
+        self.assertEqual([entry.url for entry in event.crossed], ['https://example.com/2'])
+        self.assertEqual(len(event.entries), 2)
+        self.assertEqual(notifier.current(200)[0], event.etag)
+        self.assertEqual(notifier.subscriber_count(), 0)
+
+    def test_publish_without_change_does_not_notify(self):
+        """フィードが変化しない場合は通知されないことのテスト。"""
+        notifier = FeedNotifier()
+        entries = [_entry('https://example.com/1', 250), _entry('https://example.com/2', 10)]
+        notifier.publish(entries)
+
+        async def scenario():
+            subscription = notifier.subscribe(200)
+            # しきい値未満のエントリーの変化はフィードに影響しない
+            notified = notifier.publish([entries[0], _entry('https://example.com/2', 20)])
+            event = await subscription.get(timeout=0.05)
+            return notified, event
+
+        notified, event = asyncio.run(scenario())
+
+        # 検証
+        self.assertEqual(notified, 0)
+        self.assertIsNone(event)
+
+
+if __name__ == '__main__':
+    unittest.main()
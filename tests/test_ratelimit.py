@@ -0,0 +1,105 @@
+"""リクエスト数の制限モジュールのテスト。
+
+このモジュールでは、トークンバケットの消費と補充、Retry-Afterの秒数、
+条件付きリクエストのバケット、クライアント数の上限をテストします。
+"""
+
+import unittest
+from unittest.mock import patch
+
+from src.hatena_bookmark.ratelimit import (
+    TokenBucketLimiter,
+    charge_full_response,
+    check_request,
+    client_key,
+)
+
+
+class _Clock:
+    """テスト用の時計。"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimit(unittest.TestCase):
+    """リクエスト数の制限モジュールのテストクラス。"""
+
+    def setUp(self):
+        """テスト前の準備。"""
+        self.clock = _Clock()
+
+    def test_token_bucket(self):
+        """容量まで許可し、補充量に応じて再試行までの秒数を返すテスト。"""
+        limiter = TokenBucketLimiter(rate=0.5, burst=3, clock=self.clock)
+        self.assertEqual([limiter.acquire('a') for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(limiter.acquire('a'), 2.0)
+        # 他のクライアントには影響しない
+        self.assertEqual(limiter.acquire('b'), 0.0)
+
+        self.clock.now = 2.0
+        self.assertEqual(limiter.acquire('a'), 0.0)
+        self.assertGreater(limiter.acquire('a'), 0.0)
+        status = limiter.status()
+        self.assertEqual((status['allowed'], status['limited'], status['clients']), (5, 2, 2))
+
+    def test_disabled(self):
+        """補充量が0以下なら制限しないテスト。"""
+        limiter = TokenBucketLimiter(rate=0, burst=1, clock=self.clock)
+        self.assertTrue(all(limiter.acquire('a') == 0.0 for _ in range(100)))
+        self.assertEqual(limiter.status()['clients'], 0)
+
+    def test_lru_eviction(self):
+        """クライアント数の上限を超えたら最も古いバケットを破棄するテスト。"""
+        limiter = TokenBucketLimiter(rate=1, burst=1, max_clients=2, clock=self.clock)
+        limiter.acquire('a')
+        limiter.acquire('b')
+        limiter.acquire('a')
+        limiter.acquire('c')
+        self.assertEqual(list(limiter._buckets), ['a', 'c'])
+        self.assertEqual(limiter.status()['evicted'], 1)
+
+    def test_conditional_requests(self):
+        """条件付きリクエストは別のバケットで数え、304にならなければ通常のバケットからも引くテスト。"""
+        full = TokenBucketLimiter(rate=1, burst=2, clock=self.clock)
+        conditional = TokenBucketLimiter(rate=1, burst=5, clock=self.clock)
+        with patch('src.hatena_bookmark.ratelimit.feed_limiter', full), \
+                patch('src.hatena_bookmark.ratelimit.conditional_limiter', conditional):
+            self.assertEqual([check_request('a', False) for _ in range(2)], [0, 0])
+            self.assertEqual(check_request('a', False), 1)
+            # 通常のバケットが空でも、条件付きリクエストは許可される
+            self.assertEqual(check_request('a', True), 0)
+
+            self.clock.now = 10.0
+            check_request('b', True)
+            charge_full_response('b')
+            charge_full_response('b')
+            self.assertEqual(check_request('b', False), 1)
+            # 通常のバケットが負になったら、条件付きリクエストも制限する
+            charge_full_response('b')
+            self.assertEqual(check_request('b', True), 1)
+            self.clock.now = 11.0
+            self.assertEqual(check_request('b', True), 0)
+
+    def test_client_key(self):
+        """プロキシが追加したX-Forwarded-ForのアドレスとUser-Agentでクライアントを識別するテスト。"""
+        self.assertEqual(client_key('10.0.0.1'), '10.0.0.1')
+        # デフォルトではプロキシを信頼せず、クライアントが付けたヘッダーを使わない
+        self.assertEqual(client_key('10.0.0.1', '203.0.113.5'), '10.0.0.1')
+        self.assertEqual(client_key('10.0.0.1', '203.0.113.5', trusted_proxies=1), '203.0.113.5')
+        # クライアントが先頭に付けたアドレスは使わない
+        self.assertEqual(client_key('10.0.0.1', '198.51.100.9, 203.0.113.5', trusted_proxies=1),
+                         '203.0.113.5')
+        self.assertEqual(client_key('10.0.0.2', '198.51.100.9, 203.0.113.5, 10.0.0.1',
+                                    trusted_proxies=2), '203.0.113.5')
+        # プロキシの数より少なければ、接続元のアドレスを使う
+        self.assertEqual(client_key('10.0.0.1', '203.0.113.5', trusted_proxies=2), '10.0.0.1')
+        self.assertEqual(client_key('10.0.0.1', '203.0.113.5', trusted_proxies=0), '10.0.0.1')
+        self.assertEqual(client_key('10.0.0.1', None, 'IFTTT', kind='ip+ua'), '10.0.0.1 IFTTT')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""更新間隔の調整モジュールのテスト。
+
+このモジュールでは、チャーンと需要、時間帯から更新間隔を決める機能をテストします。
+"""
+
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from src.hatena_bookmark.models import Entry
+from src.hatena_bookmark.refresh import AdaptiveRefreshPolicy, compute_churn, is_night
+from src.hatena_bookmark.store import (
+    Snapshot, clear_snapshots, get_serving_snapshot, publish_snapshot,
+)
+
+# 日本時間の正午と深夜3時
+NOON = datetime(2023, 1, 1, 3, 0, tzinfo=timezone.utc)
+NIGHT = datetime(2023, 1, 1, 18, 0, tzinfo=timezone.utc)
+
+
+def _entries(*urls):
+    return [Entry(url, url, '', 100, '2023-01-01T00:00:00Z') for url in urls]
+
+
+class TestAdaptiveRefreshPolicy(unittest.TestCase):
+    """更新間隔の調整のテストクラス。"""
+
+    def _policy(self, jitter=0.0):
+        return AdaptiveRefreshPolicy(base=300, minimum=60, maximum=1200, jitter=jitter,
+                                     night_hours='1-6', rng=random.Random(0))
+
+    def test_churn_and_demand_shorten_interval(self):
+        """入れ替わりが多くリクエストも多いときに間隔が短くなることのテスト。"""
+        policy = self._policy()
+        policy.observe('all', _entries('a', 'b', 'c'))
+        policy.observe('all', _entries('c', 'd', 'e'))
+        for _ in range(1000):
+            policy.record_request()
+
+        self.assertEqual(policy.next_interval(NOON), 75)
+        self.assertEqual(policy.status()['decision']['reasons'], ['high churn', 'high demand'])
+
+    def test_quiet_night_backs_off_to_maximum(self):
+        """変化もリクエストもない夜間は最大間隔まで延びることのテスト。"""
+        policy = self._policy()
+        for _ in range(4):
+            policy.observe('all', _entries('a', 'b'))
+        # 総合以外のカテゴリーはチャーンに含めない
+        policy.observe('it', _entries('x'))
+
+        self.assertEqual(policy.next_interval(NIGHT), 1200)
+        self.assertEqual(policy.status()['decision']['reasons'], ['no changes', 'no demand', 'night'])
+
+    def test_jitter_stays_within_bounds(self):
+        """ジッターを加えても指定した割合と範囲に収まることのテスト。"""
+        policy = self._policy(jitter=0.1)
+        for _ in range(50):
+            # リクエストがないため基準値の2倍（600秒）の±10%
+            interval = policy.next_interval(NOON)
+            self.assertGreaterEqual(interval, 540)
+            self.assertLessEqual(interval, 660)
+
+    @patch('src.hatena_bookmark.store.SNAPSHOT_MAX_AGE', 300)
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
+    def test_long_interval_suppresses_request_fetch(self, mock_fetch):
+        """更新間隔を延ばしている間は、間隔内のスナップショットをリクエストで取得し直さないテスト。"""
+        clear_snapshots()
+        policy = self._policy()
+        for _ in range(4):
+            policy.observe('all', _entries('a', 'b'))
+        policy.next_interval(NIGHT)
+        mock_fetch.return_value = _entries('new')
+        for category in ('all', 'it'):
+            publish_snapshot(category, Snapshot(tuple(_entries('old')), None, 1,
+                                                datetime.now() - timedelta(seconds=600), None))
+
+        with patch('src.hatena_bookmark.store.refresh_policy', policy):
+            snapshot, staleness = get_serving_snapshot('all')
+            self.assertEqual(snapshot.entries[0].url, 'old')
+            self.assertIsNone(staleness)
+            mock_fetch.assert_not_called()
+
+            # スケジューラーが更新しないカテゴリーは SNAPSHOT_MAX_AGE で取得し直す
+            snapshot, _ = get_serving_snapshot('it')
+            self.assertEqual(snapshot.entries[0].url, 'new')
+            mock_fetch.assert_called_once_with('it')
+        clear_snapshots()
+
+    def test_helpers(self):
+        """チャーンと夜間判定のテスト。"""
+        self.assertAlmostEqual(compute_churn({'a', 'b'}, _entries('b', 'c')), 2 / 3)
+        self.assertEqual(compute_churn(set(), []), 0.0)
+        self.assertTrue(is_night(NIGHT, (1, 6)))
+        self.assertFalse(is_night(NOON, (1, 6)))
+        self.assertTrue(is_night(NIGHT.replace(hour=14), (22, 5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
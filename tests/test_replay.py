@@ -0,0 +1,101 @@
+"""上流のレスポンスの記録・再生モジュールのテスト。
+
+このモジュールでは、ローカルのHTTPサーバーのレスポンスを記録し、同期・非同期の
+クライアントで再生できることをテストします。
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import httpx
+import requests
+
+from src.hatena_bookmark.replay import (
+    ReplayTransport,
+    Replayer,
+    UpstreamArchive,
+    install,
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """リクエストごとに連番を返すサーバー。"""
+
+    def do_GET(self):
+        self.server.count += 1
+        body = json.dumps({'path': self.path, 'count': self.server.count}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestReplay(unittest.TestCase):
+    """上流のレスポンスの記録・再生モジュールのテストクラス。"""
+
+    def setUp(self):
+        """テスト前の準備。"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'archive.jsonl.gz')
+        self.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.count = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api/ipad.hotentry'
+
+    def tearDown(self):
+        """テスト後のクリーンアップ。"""
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def test_record_and_replay(self):
+        """記録したレスポンスを記録順に繰り返し再生するテスト。"""
+        with requests.Session() as session:
+            install(session, 'record', self.path)
+            recorded = [session.get(self.url, params={'mode': 'it'}).json() for _ in range(2)]
+
+        records = UpstreamArchive(self.path).load()
+        self.assertEqual([record['key'] for record in records],
+                         ['GET /api/ipad.hotentry?mode=it'] * 2)
+        self.assertGreater(records[0]['elapsed'], 0)
+
+        # ホスト名が異なっても、パスとクエリが一致すれば再生される
+        with requests.Session() as session:
+            install(session, 'replay', self.path)
+            replayed = [session.get('https://b.hatena.ne.jp/api/ipad.hotentry',
+                                    params={'mode': 'it'}) for _ in range(3)]
+            with self.assertRaises(requests.ConnectionError):
+                session.get('https://b.hatena.ne.jp/hotentry.rss')
+        self.assertEqual([response.json() for response in replayed],
+                         recorded + recorded[:1])
+        self.assertEqual(replayed[0].headers['Content-Type'], 'application/json')
+        self.assertEqual(self.server.count, 2)
+
+    def test_replay_async(self):
+        """非同期クライアントでの再生のテスト。"""
+        archive = UpstreamArchive(self.path)
+        archive.append('GET', 'https://example.com/hotentry.rss', 200,
+                       {'Content-Type': 'application/xml'}, b'<rss/>', 0.5)
+        transport = ReplayTransport(Replayer(archive.load()))
+
+        async def fetch():
+            async with httpx.AsyncClient(transport=transport) as client:
+                return await client.get('http://127.0.0.1/hotentry.rss')
+
+        response = asyncio.run(fetch())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'<rss/>')
+        self.assertEqual(Replayer([], speed=2.0).delay({'elapsed': 0.5}), 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
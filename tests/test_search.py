@@ -0,0 +1,58 @@
+"""キーワード検索モジュールのテスト。
+
+このモジュールでは、bi-gramの転置インデックスによる検索をテストします。
+"""
+
+import unittest
+from src.hatena_bookmark.models import Entry
+from src.hatena_bookmark.search import SearchIndex, parse_query
+
+
+def _entry(url, title, description=None):
+    return Entry(title, url, description, 100, None)
+
+
+class TestSearchIndex(unittest.TestCase):
+    """転置インデックスのテストクラス。"""
+
+    def setUp(self):
+        """テスト前の準備。"""
+        self.entries = [
+            _entry('https://example.com/0', '生成AIで業務効率化', '大規模言語モデルの導入事例'),
+            _entry('https://example.com/1', '京都と東京の違い', None),
+            _entry('https://example.com/2', '東京都の人口', '統計データ'),
+            _entry('https://example.com/3', 'ＧｅｎＡＩ入門', '生成ＡＩの基本'),
+        ]
+        self.index = SearchIndex.build(self.entries)
+
+    def test_search_japanese_substring(self):
+        """日本語の部分文字列と全角英数字が検索できることのテスト。"""
+        self.assertEqual(self.index.search(parse_query('生成AI')), [0, 3])
+        self.assertEqual(self.index.search(parse_query('言語モデル')), [0])
+        self.assertEqual(self.index.search(parse_query('genai')), [3])
+        # 1文字の検索語と、空白区切りのAND検索
+        self.assertEqual(self.index.search(parse_query('都')), [1, 2])
+        self.assertEqual(self.index.search(parse_query('東京　人口')), [2])
+
+    def test_verification_removes_false_positives(self):
+        """bi-gramがすべて含まれていても連続していなければ一致しないことのテスト。"""
+        # 「京都と東京」は「東京」「京都」を含むが「東京都」は含まない
+        self.assertEqual(self.index.search(parse_query('東京都')), [2])
+        self.assertEqual(self.index.search(parse_query('存在しない')), [])
+
+    def test_rebuild_reuses_unchanged_documents(self):
+        """更新時に変わっていないエントリーの索引語を再利用することのテスト。"""
+        changed = _entry('https://example.com/1', '京都と大阪の違い', None)
+        entries = [self.entries[0], changed, self.entries[2]]
+
+        rebuilt = SearchIndex.build(entries, previous=self.index)
+
+        key = ('https://example.com/0', self.entries[0].title, self.entries[0].description)
+        self.assertIs(rebuilt._documents[key], self.index._documents[key])
+        self.assertEqual(len(rebuilt._documents), 3)
+        self.assertEqual(rebuilt.search(parse_query('大阪')), [1])
+        self.assertEqual(rebuilt.search(parse_query('東京')), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
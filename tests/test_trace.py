@@ -0,0 +1,61 @@
+"""処理段階の計測モジュールのテスト。
+
+このモジュールでは、トレースのサンプリングとスパンの記録、Server-Timingヘッダーをテストします。
+"""
+
+import json
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from src.hatena_bookmark.feed import get_hotentry_feed
+from src.hatena_bookmark.models import Entry
+from src.hatena_bookmark.store import clear_snapshots
+from src.hatena_bookmark.trace import span, start_trace
+
+
+class TestTrace(unittest.TestCase):
+    """トレースのテストクラス。"""
+
+    @patch('src.hatena_bookmark.trace.TRACE_SAMPLE_RATE', 0.0)
+    def test_unsampled_trace_is_noop(self):
+        """サンプリングされない場合はスパンを記録しないことのテスト。"""
+        with start_trace('feed') as trace:
+            with span('fetch') as current:
+                pass
+        self.assertIsNone(trace)
+        self.assertIsNone(current)
+
+    @patch('src.hatena_bookmark.trace.TRACE_SAMPLE_RATE', 1.0)
+    def test_sampled_trace_logs_spans(self):
+        """サンプリングされたトレースがスパンを構造化ログに出力することのテスト。"""
+        with self.assertLogs('src.hatena_bookmark.trace', level='INFO') as logs:
+            with start_trace('feed', threshold=200) as trace:
+                with span('fetch'):
+                    pass
+                with span('render'):
+                    pass
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['trace'], 'feed')
+        self.assertEqual(record['threshold'], 200)
+        self.assertEqual([s['name'] for s in record['spans']], ['fetch', 'render'])
+        self.assertRegex(trace.server_timing(),
+                         r'^fetch;dur=[\d.]+, render;dur=[\d.]+, total;dur=[\d.]+$')
+
+    @patch('src.hatena_bookmark.trace.SERVER_TIMING', True)
+    @patch('src.hatena_bookmark.trace.TRACE_SAMPLE_RATE', 1.0)
+    @patch('src.hatena_bookmark.store.fetch_hatena_hotentries')
+    def test_feed_server_timing_header(self, mock_fetch):
+        """フィードのレスポンスに段階ごとのServer-Timingヘッダーが付くことのテスト。"""
+        clear_snapshots()
+        mock_fetch.return_value = [Entry('t', 'https://example.com/1', 'd', 300, None)]
+        app = Flask(__name__)
+        with app.test_request_context('/hotentry/all/feed?threshold=200'):
+            response = get_hotentry_feed(200)
+
+        names = [metric.split(';')[0] for metric in response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(names, ['snapshot', 'filter', 'render', 'total'])
+
+
+if __name__ == '__main__':
+    unittest.main()
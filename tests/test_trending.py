@@ -0,0 +1,75 @@
+"""ブックマーク数の伸びによるランキングモジュールのテスト。
+
+このモジュールでは、更新ごとの履歴の記録とランキングの計算、ホットエントリーから外れた
+URLの削除、ランキングのレンダリングをテストします。
+"""
+
+import unittest
+
+from src.hatena_bookmark.feed import render_trending_items
+from src.hatena_bookmark.models import Entry
+from src.hatena_bookmark.trending import TrendTracker, compute_velocity
+
+
+def _entries(counts):
+    """URLの番号 -> ブックマーク数 からエントリーのタプルを作る。"""
+    return tuple(Entry(f'記事{number}', f'https://example.com/{number}', None, count, None)
+                 for number, count in counts.items())
+
+
+class TestTrending(unittest.TestCase):
+    """ブックマーク数の伸びによるランキングモジュールのテストクラス。"""
+
+    def test_compute_velocity(self):
+        """1時間あたりの伸びの計算のテスト。"""
+        self.assertEqual(compute_velocity([(0, 10), (900, 20), (1800, 40)]), 60.0)
+        self.assertIsNone(compute_velocity([(0, 10)]))
+        self.assertIsNone(compute_velocity([(0, 10), (0, 20)]))
+
+    def test_ranking_by_velocity(self):
+        """伸びの大きい順に並び、履歴が1件のURLや伸びていないURLは含まれないテスト。"""
+        tracker = TrendTracker(history=3, size=2)
+        tracker.observe('all', _entries({1: 500, 2: 20, 3: 100}), now=0)
+        self.assertEqual(tracker.ranking().entries, ())
+
+        tracker.observe('all', _entries({1: 510, 2: 80, 3: 100, 4: 50}), now=600)
+        ranking = tracker.ranking()
+        self.assertEqual([item.entry.url for item in ranking.entries],
+                         ['https://example.com/2', 'https://example.com/1'])
+        self.assertEqual(ranking.entries[0].velocity, 360.0)
+        self.assertEqual(ranking.version, 2)
+
+        # 総合以外のカテゴリーは無視する
+        tracker.observe('it', _entries({5: 1000}), now=1200)
+        self.assertEqual(tracker.ranking().version, 2)
+
+    def test_history_is_bounded(self):
+        """履歴はURLごとに固定の数だけ保持し、外れたURLは削除されるテスト。"""
+        tracker = TrendTracker(history=3)
+        for step in range(5):
+            tracker.observe('all', _entries({1: 100 + step * 10, 2: 100}), now=step * 600)
+        self.assertEqual(len(tracker._counts['https://example.com/1']), 3)
+        # 直近3回（1200秒）で20ブックマーク
+        self.assertEqual(tracker.ranking().entries[0].velocity, 60.0)
+
+        tracker.observe('all', _entries({2: 100}), now=3000)
+        self.assertEqual(tracker.status()['tracked_urls'], 1)
+        self.assertEqual(tracker.ranking().entries, ())
+
+    def test_render_trending_items(self):
+        """ランキングのアイテムにしきい値を適用し、伸びを表示するテスト。"""
+        tracker = TrendTracker()
+        tracker.observe('all', _entries({1: 50, 2: 300}), now=0)
+        tracker.observe('all', _entries({1: 150, 2: 330}), now=3600)
+        items, etag, size = render_trending_items(tracker.ranking(), threshold=100)
+        self.assertEqual(size, 2)
+        self.assertLess(items.index('記事1'), items.index('記事2'))
+        self.assertIn('ブックマーク数: 150（1時間あたり+100）', items)
+
+        _, other_etag, size = render_trending_items(tracker.ranking(), threshold=200)
+        self.assertEqual(size, 1)
+        self.assertNotEqual(etag, other_etag)
+
+
+if __name__ == '__main__':
+    unittest.main()
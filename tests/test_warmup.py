@@ -0,0 +1,100 @@
+"""リクエストの多いフィードの事前レンダリングモジュールのテスト。
+
+このモジュールでは、減衰するカウンターと、スナップショットの更新時の事前レンダリング、
+事前に圧縮したアイテムから組み立てたgzipのフィードをテストします。
+"""
+
+import gzip
+import unittest
+
+from src.hatena_bookmark.feed import (
+    _compressed_cache,
+    _feed_cache,
+    _render_channel_header,
+    assemble_feed,
+    compress_feed_items,
+    gzip_feed,
+    render_feed_items,
+)
+from src.hatena_bookmark.models import Entry
+from src.hatena_bookmark.store import clear_snapshots, get_snapshot, install_entries
+from src.hatena_bookmark.warmup import DecayingTopK, FeedWarmer
+
+
+class _Clock:
+    """テスト用の時計。"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestWarmup(unittest.TestCase):
+    """リクエストの多いフィードの事前レンダリングモジュールのテストクラス。"""
+
+    def setUp(self):
+        """テスト前の準備。"""
+        clear_snapshots()
+        self.entries = [Entry(f'記事{number}', f'https://example.com/{number}', '説明' * 10,
+                              number * 10, None) for number in range(1, 51)]
+
+    def test_decaying_top_k(self):
+        """古いリクエストほど小さく数え、件数の上限を超えたら少ないものを置き換えるテスト。"""
+        clock = _Clock()
+        popularity = DecayingTopK(capacity=2, half_life=60, clock=clock)
+        for _ in range(4):
+            popularity.record('old')
+        clock.now = 120
+        for _ in range(2):
+            popularity.record('new')
+        top = popularity.top(2)
+        self.assertEqual([key for key, _ in top], ['new', 'old'])
+        self.assertAlmostEqual(top[0][1], 2.0)
+        self.assertAlmostEqual(top[1][1], 1.0)
+
+        popularity.record('other')
+        self.assertEqual({key for key, _ in popularity.top(2)}, {'new', 'other'})
+
+        # 基準時刻を進めても順位と回数は変わらない
+        clock.now = 120 + 60 * 40
+        popularity.record('new')
+        self.assertEqual(popularity.top(1)[0][0], 'new')
+        self.assertAlmostEqual(popularity.top(1)[0][1], 1.0)
+
+    def test_warm_on_install(self):
+        """スナップショットの更新時に上位の組み合わせだけをレンダリングしておくテスト。"""
+        warmer = FeedWarmer(DecayingTopK(), top_k=2)
+        for _ in range(3):
+            warmer.record('it', 200, 'gzip')
+        warmer.record('it', 300, 'identity')
+        warmer.record('it', 300, 'identity')
+        warmer.record('it', 400, 'identity')
+        warmer.record('all', 100, 'identity')
+
+        snapshot = install_entries('it', self.entries)
+        warmer.warm('it')
+        version = snapshot.version
+        self.assertTrue(any(key[:2] == ('it', version) and key[3] == 200 for key in _compressed_cache))
+        warmed = {key[3] for key in _feed_cache if key[:2] == ('it', version)}
+        self.assertEqual(warmed, {200, 300})
+        self.assertEqual(warmer.status()['last_warmup']['it']['version'], version)
+
+    def test_gzip_feed(self):
+        """事前に圧縮したアイテムをつなげたgzipが、圧縮しないフィードと同じ内容になるテスト。"""
+        install_entries('it', self.entries)
+        snapshot = get_snapshot('it')
+        items, _, _ = render_feed_items(snapshot, 'it', 100)
+        header = _render_channel_header(100, 'it', 'http://example.com/',
+                                        'http://example.com/hotentry/it/feed?threshold=100')
+        body = gzip_feed(header, compress_feed_items(snapshot, 'it', 100))
+        expected = assemble_feed(items, 100, 'http://example.com/',
+                                 'http://example.com/hotentry/it/feed?threshold=100', 'it')
+        self.assertEqual(gzip.decompress(body).decode('utf-8').split('<language>')[1],
+                         expected.split('<language>')[1])
+        self.assertLess(len(body), len(expected.encode('utf-8')) // 3)
+
+
+if __name__ == '__main__':
+    unittest.main()